@@ -146,6 +146,76 @@ OCTO_PASSWORD = os.getenv("OCTO_PASSWORD", "")
 OCTO_HOST = os.getenv("OCTO_HOST", "octo")
 OCTO_PORT = int(os.getenv("OCTO_PORT", "58888"))
 OCTO_API_TOKEN = os.getenv("OCTO_API_TOKEN", "")
+# Набор флагов Chromium при запуске профиля: lean или default (см. OctoClient.FLAG_PRESETS)
+OCTO_FLAGS_PRESET = os.getenv("OCTO_FLAGS_PRESET", "lean")
+# Таймауты запросов к локальному API Octo (запуск профиля - отдельный, он поднимает браузер) и размер пула соединений
+OCTO_HTTP_TIMEOUT = float(os.getenv("OCTO_HTTP_TIMEOUT", "15"))
+OCTO_START_TIMEOUT = float(os.getenv("OCTO_START_TIMEOUT", "90"))
+OCTO_HTTP_POOL_SIZE = int(os.getenv("OCTO_HTTP_POOL_SIZE", "20"))
+# Как часто обновлять реестр состояния профилей Octo (секунды)
+OCTO_REGISTRY_INTERVAL = float(os.getenv("OCTO_REGISTRY_INTERVAL", "5"))
+# Сколько секунд считать логин в Octo действительным (при ошибке авторизации логин повторяется сразу)
+OCTO_AUTH_TTL = float(os.getenv("OCTO_AUTH_TTL", "1800"))
+# Ожидание остановки/готовности профиля: опрос Octo с паузой от INITIAL до MAX (удваивается), не дольше READY_TIMEOUT
+OCTO_POLL_INITIAL_DELAY = float(os.getenv("OCTO_POLL_INITIAL_DELAY", "0.2"))
+OCTO_POLL_MAX_DELAY = float(os.getenv("OCTO_POLL_MAX_DELAY", "2"))
+OCTO_READY_TIMEOUT = float(os.getenv("OCTO_READY_TIMEOUT", "30"))
+# Сколько секунд держать профиль запущенным после задачи в ожидании следующей (0 - останавливать сразу)
+# и сколько простаивающих профилей держать одновременно
+OCTO_PROFILE_IDLE_TTL = float(os.getenv("OCTO_PROFILE_IDLE_TTL", "300"))
+OCTO_PROFILE_POOL_SIZE = int(os.getenv("OCTO_PROFILE_POOL_SIZE", "4"))
+
+# Parser settings
+# Сбор сообщений: observer (MutationObserver, только новые узлы), dom (полный проход по DOM)
+# или api (постраничная выгрузка через API-клиент приложения, при отказе API - прокрутка в режиме observer)
+PARSER_EXTRACTION_MODE = os.getenv("PARSER_EXTRACTION_MODE", "observer")
+# Блокировка картинок, медиа, шрифтов (по расширению в URL) и трекеров на странице парсера
+# через CDP Network.setBlockedURLs; типы ресурсов: image, media, font
+PARSER_BLOCK_RESOURCES = os.getenv("PARSER_BLOCK_RESOURCES", "True").lower() in ("true", "1", "yes")
+PARSER_BLOCKED_RESOURCE_TYPES = [
+    t.strip() for t in os.getenv("PARSER_BLOCKED_RESOURCE_TYPES", "image,media,font").split(",") if t.strip()
+]
+PARSER_BLOCKED_DOMAINS = [
+    d.strip() for d in os.getenv(
+        "PARSER_BLOCKED_DOMAINS",
+        "google-analytics.com,googletagmanager.com,doubleclick.net,facebook.net,hotjar.com,"
+        "sentry.io,clarity.ms,mixpanel.com,amplitude.com,segment.io",
+    ).split(",") if d.strip()
+]
+
+# Parse job queue: heartbeat interval and timeout after which a running job is considered lost (seconds)
+PARSER_JOB_HEARTBEAT_INTERVAL = int(os.getenv("PARSER_JOB_HEARTBEAT_INTERVAL", "10"))
+PARSER_JOB_STALE_TIMEOUT = int(os.getenv("PARSER_JOB_STALE_TIMEOUT", "60"))
+# Выполнять задачи в потоке web-процесса (без отдельного run_parser_worker)
+PARSER_INLINE_JOBS = os.getenv("PARSER_INLINE_JOBS", "False").lower() in ("true", "1", "yes")
+# Parser worker (manage.py run_parser_worker): общий лимит задач, лимит на один хост Octo и опрос очереди
+PARSER_WORKER_CONCURRENCY = int(os.getenv("PARSER_WORKER_CONCURRENCY", "8"))
+PARSER_WORKER_OCTO_HOST_CONCURRENCY = int(os.getenv("PARSER_WORKER_OCTO_HOST_CONCURRENCY", "4"))
+PARSER_WORKER_POLL_INTERVAL = float(os.getenv("PARSER_WORKER_POLL_INTERVAL", "2"))
+# Сколько чатов пакетной задачи парсить параллельно во вкладках одного профиля
+PARSER_PROFILE_TABS = int(os.getenv("PARSER_PROFILE_TABS", "3"))
+# Фоновая запись сообщений: размер пачки, максимальная задержка неполной пачки (секунды)
+# и размер очереди, при заполнении которой сбор ждет запись
+PARSER_WRITER_BATCH_SIZE = int(os.getenv("PARSER_WRITER_BATCH_SIZE", "100"))
+PARSER_WRITER_FLUSH_INTERVAL = float(os.getenv("PARSER_WRITER_FLUSH_INTERVAL", "2"))
+PARSER_WRITER_QUEUE_SIZE = int(os.getenv("PARSER_WRITER_QUEUE_SIZE", "1000"))
+# Повторы записи пачки (пауза от RETRY_DELAY секунд, удваивается), после них пачка делится и плохие строки отбрасываются
+PARSER_WRITER_MAX_RETRIES = int(os.getenv("PARSER_WRITER_MAX_RETRIES", "3"))
+PARSER_WRITER_RETRY_DELAY = float(os.getenv("PARSER_WRITER_RETRY_DELAY", "0.5"))
+# Первичный парсинг чата (сообщений в базе еще нет): запись через COPY во временную таблицу
+# большими пачками, с задержкой неполной пачки не больше FLUSH_INTERVAL секунд
+PARSER_BACKFILL_COPY = os.getenv("PARSER_BACKFILL_COPY", "True").lower() in ("true", "1", "yes")
+PARSER_BACKFILL_BATCH_SIZE = int(os.getenv("PARSER_BACKFILL_BATCH_SIZE", "5000"))
+PARSER_BACKFILL_FLUSH_INTERVAL = float(os.getenv("PARSER_BACKFILL_FLUSH_INTERVAL", "10"))
+# Размер пула асинхронных соединений с PostgreSQL, через который парсеры одного воркера пишут параллельно
+PARSER_DB_POOL_SIZE = int(os.getenv("PARSER_DB_POOL_SIZE", "8"))
+# Плановое обновление чатов по Profile.parsing_interval (тик планировщика в воркере, секунды)
+PARSER_SCHEDULER_ENABLED = os.getenv("PARSER_SCHEDULER_ENABLED", "True").lower() in ("true", "1", "yes")
+PARSER_SCHEDULER_TICK = int(os.getenv("PARSER_SCHEDULER_TICK", "60"))
+# Чаты с оплатой за последние N часов обновляются с повышенным приоритетом
+PARSER_SCHEDULER_PAID_WINDOW = int(os.getenv("PARSER_SCHEDULER_PAID_WINDOW", "72"))
+# Максимальная случайная задержка запуска задач профиля (секунды)
+PARSER_SCHEDULER_MAX_JITTER = int(os.getenv("PARSER_SCHEDULER_MAX_JITTER", "300"))
 
 # Telegram settings (optional, for notifications)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Profile, ChatMessage, FullChatMessage, ModelInfo, CustomUser
+from .models import Profile, ChatMessage, FullChatMessage, ModelInfo, CustomUser, ParseJob, ChatSummary
 
 
 @admin.register(CustomUser)
@@ -60,3 +60,17 @@ class FullChatMessageAdmin(admin.ModelAdmin):
         return obj.message[:50] + '...' if len(obj.message) > 50 else obj.message
     message_short.short_description = 'Message'
 
+
+
+@admin.register(ParseJob)
+class ParseJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'profile_uuid', 'chat_url', 'platform', 'status', 'priority', 'scheduled_at', 'cancel_requested', 'worker_id', 'created_at', 'heartbeat_at')
+    list_filter = ('status', 'platform', 'update_only')
+    search_fields = ('profile_uuid', 'chat_url', 'worker_id')
+
+
+@admin.register(ChatSummary)
+class ChatSummaryAdmin(admin.ModelAdmin):
+    list_display = ('chat_url', 'model_id', 'user_id', 'message_count', 'paid_count', 'revenue', 'last_message_at')
+    list_filter = ('model_id',)
+    search_fields = ('chat_url', 'model_id', 'user_id')
@@ -8,6 +8,11 @@ class LoginPageException(Exception):
     pass
 
 
+class MessageSaveError(Exception):
+    """Raised when some collected messages could not be written to the database"""
+    pass
+
+
 class OctoProfileStartException(Exception):
     """Raised when Octo profile fails to start"""
     pass
@@ -0,0 +1,477 @@
+"""
+Batched ingest of parsed messages into FullChatMessage
+"""
+import asyncio
+import datetime
+import hashlib
+import weakref
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from .models import ChatSummary, FullChatMessage, ModelInfo
+
+
+INGEST_BATCH_SIZE = 1000
+HIGH_WATER_MARK_WINDOW = 20
+
+
+def message_fingerprint(chat_url: str, is_from_model: bool, timestamp, text: str) -> str:
+    """Компактный ключ дедупликации сообщения
+
+    Хэш от чата, стороны отправителя (модель или собеседник), времени
+    (с точностью до минуты, в UTC) и текста с нормализованными пробелами.
+    Одинаковые тексты в разное время дают разные ключи.
+
+    Сообщение, собранное из API и из DOM, должно давать один ключ, поэтому
+    в хэш не идут поля, которые у источников различаются: id отправителя
+    (в API - id аккаунта, в DOM - инициалы аватара) и часовой пояс времени.
+    Время без пояса (DOM без известной зоны браузера) считается временем
+    TIME_ZONE - так же его сохраняет Django.
+    """
+    if isinstance(timestamp, datetime.datetime):
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        timestamp = timestamp.astimezone(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M')
+    else:
+        timestamp = ''
+
+    sender = 'model' if is_from_model else 'fan'
+    raw = '\x1f'.join([chat_url or '', sender, timestamp, ' '.join((text or '').split())])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _fill_fingerprints(messages: list[FullChatMessage]):
+    for message in messages:
+        if not message.fingerprint:
+            message.fingerprint = message_fingerprint(
+                message.chat_url, message.is_from_model, message.timestamp, message.message
+            )
+
+
+def ingest_messages(messages: list[FullChatMessage], batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """Сохранение пачки сообщений одной транзакцией
+
+    Дубликаты (уже сохраненные в базе, повторы внутри пачки и строки
+    параллельного парсера того же чата) отбрасывает сам INSERT ...
+    ON CONFLICT (fingerprint) DO NOTHING по уникальному индексу. RETURNING
+    отдает только реально вставленные строки: они и считаются, и добавляются
+    в ChatSummary в той же транзакции.
+
+    Args:
+        messages: несохраненные экземпляры FullChatMessage
+        batch_size: размер одного INSERT
+
+    Returns:
+        {'inserted': <кол-во вставленных>, 'skipped': <кол-во пропущенных дубликатов>}
+    """
+    if not messages:
+        return {'inserted': 0, 'skipped': 0}
+
+    _fill_fingerprints(messages)
+
+    meta = FullChatMessage._meta
+    fields = [f for f in meta.concrete_fields if not f.primary_key]
+    quote = connection.ops.quote_name
+    row_placeholder = '({})'.format(', '.join(['%s'] * len(fields)))
+
+    inserted = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            cursor.execute(
+                'INSERT INTO {table} ({columns}) VALUES {rows} ON CONFLICT ({key}) DO NOTHING RETURNING {key}'.format(
+                    table=quote(meta.db_table),
+                    columns=', '.join(quote(f.column) for f in fields),
+                    rows=', '.join([row_placeholder] * len(chunk)),
+                    key=quote(meta.get_field('fingerprint').column),
+                ),
+                [
+                    field.get_db_prep_save(field.pre_save(message, True), connection)
+                    for message in chunk
+                    for field in fields
+                ],
+            )
+            returned = {row[0] for row in cursor.fetchall()}
+            for message in chunk:
+                # Повтор внутри пачки: fingerprint вернулся один раз, в сводку идет первый экземпляр
+                if message.fingerprint in returned:
+                    returned.discard(message.fingerprint)
+                    inserted.append(message)
+        _add_to_summaries(inserted)
+
+    return {'inserted': len(inserted), 'skipped': len(messages) - len(inserted)}
+
+
+def _add_to_summaries(messages: list[FullChatMessage]):
+    """Добавляет вставленные сообщения к счетчикам ChatSummary их чатов"""
+    totals = {}
+    for message in messages:
+        if not message.chat_url:
+            continue
+        total = totals.setdefault((message.model_id or '', message.chat_url), {
+            'user_id': None, 'message_count': 0, 'model_message_count': 0, 'paid_count': 0, 'revenue': Decimal(0),
+            'first_message_at': None, 'last_message_at': None, 'last_paid_at': None,
+        })
+        if not message.is_from_model and message.user_id:
+            total['user_id'] = max(total['user_id'] or '', message.user_id)
+        total['message_count'] += 1
+        if message.is_from_model:
+            total['model_message_count'] += 1
+        if message.is_paid:
+            total['paid_count'] += 1
+        total['revenue'] += Decimal(str(message.amount_paid or 0))
+        timestamp = message.timestamp
+        if timestamp is None:
+            continue
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        if total['first_message_at'] is None or timestamp < total['first_message_at']:
+            total['first_message_at'] = timestamp
+        if total['last_message_at'] is None or timestamp > total['last_message_at']:
+            total['last_message_at'] = timestamp
+        if message.is_paid and (total['last_paid_at'] is None or timestamp > total['last_paid_at']):
+            total['last_paid_at'] = timestamp
+
+    for (model_id, chat_url), total in totals.items():
+        summary, _ = ChatSummary.objects.select_for_update().get_or_create(model_id=model_id, chat_url=chat_url)
+        if total['user_id']:
+            summary.user_id = total['user_id']
+        summary.message_count += total['message_count']
+        summary.model_message_count += total['model_message_count']
+        summary.paid_count += total['paid_count']
+        summary.revenue += total['revenue']
+        if total['first_message_at'] is not None:
+            summary.first_message_at = min(filter(None, [summary.first_message_at, total['first_message_at']]))
+            summary.last_message_at = max(filter(None, [summary.last_message_at, total['last_message_at']]))
+        if total['last_paid_at'] is not None:
+            summary.last_paid_at = max(filter(None, [summary.last_paid_at, total['last_paid_at']]))
+        summary.save()
+
+
+def rebuild_chat_summaries() -> int:
+    """Пересобирает ChatSummary целиком одним агрегирующим запросом по FullChatMessage
+
+    При записи сообщений сводка обновляется в той же транзакции, что и вставка,
+    начальное заполнение делает миграция - пересборка нужна после правок
+    сообщений в базе в обход парсера.
+
+    Returns:
+        Количество чатов в сводке
+    """
+    rows = (
+        FullChatMessage.objects.exclude(chat_url__isnull=True)
+        .exclude(chat_url='')
+        .values('model_id', 'chat_url')
+        .annotate(
+            fan_id=Max('user_id', filter=Q(is_from_model=False)),
+            message_count=Count('id'),
+            model_message_count=Count('id', filter=Q(is_from_model=True)),
+            paid_count=Count('id', filter=Q(is_paid=True)),
+            revenue=Sum('amount_paid'),
+            first_message_at=Min('timestamp'),
+            last_message_at=Max('timestamp'),
+            last_paid_at=Max('timestamp', filter=Q(is_paid=True)),
+        )
+        .order_by()
+    )
+    summaries = [
+        ChatSummary(
+            model_id=row['model_id'],
+            chat_url=row['chat_url'],
+            user_id=row['fan_id'],
+            message_count=row['message_count'],
+            model_message_count=row['model_message_count'],
+            paid_count=row['paid_count'],
+            revenue=row['revenue'] or 0,
+            first_message_at=row['first_message_at'],
+            last_message_at=row['last_message_at'],
+            last_paid_at=row['last_paid_at'],
+        )
+        for row in rows.iterator()
+    ]
+    with transaction.atomic():
+        ChatSummary.objects.all().delete()
+        ChatSummary.objects.bulk_create(summaries, batch_size=INGEST_BATCH_SIZE)
+    return len(summaries)
+
+
+def load_high_water_mark(chat_url: str, window: int = HIGH_WATER_MARK_WINDOW) -> tuple[set, set]:
+    """Fingerprint и id на платформе новейших сохраненных сообщений чата
+
+    Берется не одно, а window последних сообщений: если самое новое изменилось
+    в выдаче (удалено, другой формат даты), обновление все равно остановится
+    на следующем. Пустые множества - чат еще не парсился, нужна полная прокрутка.
+
+    Returns:
+        (fingerprints, platform_message_ids)
+    """
+    rows = (
+        FullChatMessage.objects.filter(chat_url=chat_url)
+        .order_by('-timestamp', '-id')
+        .values_list('fingerprint', 'platform_message_id')[:window]
+    )
+    fingerprints, message_ids = set(), set()
+    for fingerprint, message_id in rows:
+        if fingerprint:
+            fingerprints.add(fingerprint)
+        if message_id:
+            message_ids.add(message_id)
+    return fingerprints, message_ids
+
+
+def load_model_info(profile_uuid: str) -> tuple[str | None, str | None]:
+    """id и имя модели, к которой привязан профиль Octo (None, None - профиль не привязан)"""
+    model_info = ModelInfo.objects.filter(model_octo_profile=profile_uuid).first()
+    if model_info is None:
+        return None, None
+    return model_info.model_id, model_info.model_name
+
+
+# Асинхронные версии для парсеров: запросы идут из event loop через пул
+# соединений psycopg, а не через sync_to_async. sync_to_async (и async ORM
+# Django, который построен на нем же) выполняет все запросы в одном потоке -
+# параллельные парсеры ждали бы друг друга. С пулом каждый парсер пишет
+# в базу по своему соединению.
+
+_async_pools: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool]' = weakref.WeakKeyDictionary()
+
+
+async def async_db_pool() -> AsyncConnectionPool | None:
+    """Пул асинхронных соединений с PostgreSQL текущего event loop
+
+    Returns:
+        None, если база не PostgreSQL - тогда асинхронные функции этого
+        модуля выполняют синхронные через sync_to_async
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        db = settings.DATABASES['default']
+        conninfo = make_conninfo(
+            dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+            host=db['HOST'] or None, port=db['PORT'] or None,
+        )
+        pool = AsyncConnectionPool(
+            conninfo, min_size=1, max_size=settings.PARSER_DB_POOL_SIZE,
+            kwargs={'autocommit': True}, open=False,
+        )
+        _async_pools[loop] = pool
+        await pool.open()
+    return pool
+
+
+async def close_async_db_pool():
+    """Закрывает пул соединений текущего event loop"""
+    pool = _async_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+def _with_summary(insert: sql.Composable) -> sql.Composed:
+    """Оборачивает INSERT в FullChatMessage так, чтобы вставленные строки тем же
+    запросом добавлялись к ChatSummary. Запрос возвращает количество вставленных"""
+    def column(model, name):
+        return sql.Identifier(model._meta.get_field(name).column)
+
+    return sql.SQL(
+        'WITH inserted AS ({insert} RETURNING {model_id}, {chat_url}, {user_id}, {is_from_model}, '
+        '{is_paid}, {amount_paid}, {timestamp}), '
+        'summary AS ('
+        'INSERT INTO {summary} ({s_model_id}, {s_chat_url}, {s_user_id}, {s_count}, {s_model_count}, {s_paid}, '
+        '{s_revenue}, {s_first}, {s_last}, {s_last_paid}) '
+        'SELECT {model_id}, {chat_url}, MAX({user_id}) FILTER (WHERE NOT {is_from_model}), COUNT(*), '
+        'COUNT(*) FILTER (WHERE {is_from_model}), '
+        'COUNT(*) FILTER (WHERE {is_paid}), COALESCE(SUM({amount_paid}), 0), MIN({timestamp}), MAX({timestamp}), '
+        'MAX({timestamp}) FILTER (WHERE {is_paid}) '
+        'FROM inserted WHERE {chat_url} IS NOT NULL AND {chat_url} <> {empty} GROUP BY {model_id}, {chat_url} '
+        'ON CONFLICT ({s_model_id}, {s_chat_url}) DO UPDATE SET '
+        '{s_user_id} = COALESCE(EXCLUDED.{s_user_id}, {summary}.{s_user_id}), '
+        '{s_count} = {summary}.{s_count} + EXCLUDED.{s_count}, '
+        '{s_model_count} = {summary}.{s_model_count} + EXCLUDED.{s_model_count}, '
+        '{s_paid} = {summary}.{s_paid} + EXCLUDED.{s_paid}, '
+        '{s_revenue} = {summary}.{s_revenue} + EXCLUDED.{s_revenue}, '
+        '{s_first} = LEAST({summary}.{s_first}, EXCLUDED.{s_first}), '
+        '{s_last} = GREATEST({summary}.{s_last}, EXCLUDED.{s_last}), '
+        '{s_last_paid} = GREATEST({summary}.{s_last_paid}, EXCLUDED.{s_last_paid}) '
+        'RETURNING 1) '
+        'SELECT COUNT(*) FROM inserted'
+    ).format(
+        insert=insert,
+        model_id=column(FullChatMessage, 'model_id'),
+        chat_url=column(FullChatMessage, 'chat_url'),
+        user_id=column(FullChatMessage, 'user_id'),
+        is_from_model=column(FullChatMessage, 'is_from_model'),
+        is_paid=column(FullChatMessage, 'is_paid'),
+        amount_paid=column(FullChatMessage, 'amount_paid'),
+        timestamp=column(FullChatMessage, 'timestamp'),
+        empty=sql.Literal(''),
+        summary=sql.Identifier(ChatSummary._meta.db_table),
+        s_model_id=column(ChatSummary, 'model_id'),
+        s_chat_url=column(ChatSummary, 'chat_url'),
+        s_user_id=column(ChatSummary, 'user_id'),
+        s_count=column(ChatSummary, 'message_count'),
+        s_model_count=column(ChatSummary, 'model_message_count'),
+        s_paid=column(ChatSummary, 'paid_count'),
+        s_revenue=column(ChatSummary, 'revenue'),
+        s_first=column(ChatSummary, 'first_message_at'),
+        s_last=column(ChatSummary, 'last_message_at'),
+        s_last_paid=column(ChatSummary, 'last_paid_at'),
+    )
+
+
+async def aingest_messages(messages: list[FullChatMessage], batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """Асинхронный ingest_messages
+
+    Вместо предварительного SELECT дубликаты отбрасывает сам INSERT ...
+    ON CONFLICT (fingerprint) DO NOTHING, вставленные строки тем же запросом
+    добавляются к ChatSummary. Все пачки пишутся одной транзакцией.
+    """
+    pool = await async_db_pool()
+    if pool is None:
+        return await sync_to_async(ingest_messages)(messages, batch_size)
+    if not messages:
+        return {'inserted': 0, 'skipped': 0}
+
+    _fill_fingerprints(messages)
+
+    meta = FullChatMessage._meta
+    fields = [f for f in meta.concrete_fields if not f.primary_key]
+    columns = sql.SQL(', ').join(sql.Identifier(f.column) for f in fields)
+    row_placeholder = sql.SQL('({})').format(sql.SQL(', ').join(sql.Placeholder() * len(fields)))
+
+    inserted = 0
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            for start in range(0, len(messages), batch_size):
+                chunk = messages[start:start + batch_size]
+                query = sql.SQL(
+                    'INSERT INTO {table} ({columns}) VALUES {rows} ON CONFLICT ({key}) DO NOTHING'
+                ).format(
+                    table=sql.Identifier(meta.db_table),
+                    columns=columns,
+                    rows=sql.SQL(', ').join([row_placeholder] * len(chunk)),
+                    key=sql.Identifier(meta.get_field('fingerprint').column),
+                )
+                params = [
+                    field.get_db_prep_save(field.pre_save(message, True), connection)
+                    for message in chunk
+                    for field in fields
+                ]
+                cursor = await conn.execute(_with_summary(query), params)
+                inserted += (await cursor.fetchone())[0]
+
+    return {'inserted': inserted, 'skipped': len(messages) - inserted}
+
+
+async def acopy_ingest_messages(messages: list[FullChatMessage]) -> dict:
+    """Загрузка большой пачки сообщений через COPY (первичный парсинг больших чатов)
+
+    Строки потоком COPY идут во временную staging-таблицу, затем один
+    INSERT ... SELECT DISTINCT ON (fingerprint) ... ON CONFLICT DO NOTHING
+    переносит в FullChatMessage только новые (и добавляет их к ChatSummary):
+    дубликаты внутри пачки и уже сохраненные отбрасываются на стороне базы
+    одним запросом. Staging-таблица удаляется при коммите.
+
+    Returns:
+        {'inserted': <кол-во вставленных>, 'skipped': <кол-во пропущенных дубликатов>}
+    """
+    pool = await async_db_pool()
+    if pool is None:
+        return await sync_to_async(ingest_messages)(messages)
+    if not messages:
+        return {'inserted': 0, 'skipped': 0}
+
+    _fill_fingerprints(messages)
+
+    meta = FullChatMessage._meta
+    fields = [f for f in meta.concrete_fields if not f.primary_key]
+    columns = sql.SQL(', ').join(sql.Identifier(f.column) for f in fields)
+    table = sql.Identifier(meta.db_table)
+    staging = sql.Identifier(f'{meta.db_table}_staging')
+    key = sql.Identifier(meta.get_field('fingerprint').column)
+
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                sql.SQL(
+                    'CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA'
+                ).format(staging=staging, columns=columns, table=table)
+            )
+            async with conn.cursor() as cursor:
+                async with cursor.copy(
+                    sql.SQL('COPY {staging} ({columns}) FROM STDIN').format(staging=staging, columns=columns)
+                ) as copy:
+                    for message in messages:
+                        await copy.write_row([
+                            field.get_db_prep_save(field.pre_save(message, True), connection) for field in fields
+                        ])
+            cursor = await conn.execute(_with_summary(
+                sql.SQL(
+                    'INSERT INTO {table} ({columns}) '
+                    'SELECT DISTINCT ON ({key}) {columns} FROM {staging} ORDER BY {key} '
+                    'ON CONFLICT ({key}) DO NOTHING'
+                ).format(table=table, columns=columns, staging=staging, key=key)
+            ))
+            inserted = (await cursor.fetchone())[0]
+
+    return {'inserted': inserted, 'skipped': len(messages) - inserted}
+
+
+async def aload_high_water_mark(chat_url: str, window: int = HIGH_WATER_MARK_WINDOW) -> tuple[set, set]:
+    """Асинхронный load_high_water_mark"""
+    pool = await async_db_pool()
+    if pool is None:
+        return await sync_to_async(load_high_water_mark)(chat_url, window)
+
+    meta = FullChatMessage._meta
+    query = sql.SQL(
+        'SELECT {fingerprint}, {message_id} FROM {table} WHERE {chat_url} = %s '
+        'ORDER BY {timestamp} DESC, {pk} DESC LIMIT %s'
+    ).format(
+        fingerprint=sql.Identifier(meta.get_field('fingerprint').column),
+        message_id=sql.Identifier(meta.get_field('platform_message_id').column),
+        table=sql.Identifier(meta.db_table),
+        chat_url=sql.Identifier(meta.get_field('chat_url').column),
+        timestamp=sql.Identifier(meta.get_field('timestamp').column),
+        pk=sql.Identifier(meta.pk.column),
+    )
+    async with pool.connection() as conn:
+        cursor = await conn.execute(query, [chat_url, window])
+        rows = await cursor.fetchall()
+
+    fingerprints, message_ids = set(), set()
+    for fingerprint, message_id in rows:
+        if fingerprint:
+            fingerprints.add(fingerprint)
+        if message_id:
+            message_ids.add(message_id)
+    return fingerprints, message_ids
+
+
+async def aload_model_info(profile_uuid: str) -> tuple[str | None, str | None]:
+    """Асинхронный load_model_info"""
+    pool = await async_db_pool()
+    if pool is None:
+        return await sync_to_async(load_model_info)(profile_uuid)
+
+    meta = ModelInfo._meta
+    query = sql.SQL('SELECT {model_id}, {model_name} FROM {table} WHERE {profile} = %s LIMIT 1').format(
+        model_id=sql.Identifier(meta.get_field('model_id').column),
+        model_name=sql.Identifier(meta.get_field('model_name').column),
+        table=sql.Identifier(meta.db_table),
+        profile=sql.Identifier(meta.get_field('model_octo_profile').column),
+    )
+    async with pool.connection() as conn:
+        cursor = await conn.execute(query, [profile_uuid])
+        row = await cursor.fetchone()
+    return (row[0], row[1]) if row else (None, None)
@@ -0,0 +1,328 @@
+"""
+Postgres-backed parse job queue shared by all web workers and nodes
+"""
+import asyncio
+import datetime
+import os
+import socket
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .ingest import close_async_db_pool
+from .models import ParseJob
+from .services import BatchChatParser, close_async_octo_client, close_profile_pool, create_parser, detect_platform
+
+
+def make_worker_id() -> str:
+    """Идентификатор исполнителя задач: хост, процесс и поток"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def enqueue_job(profile_uuid: str, chat_url: str, update_only: bool = False,
+                priority: int = ParseJob.PRIORITY_MANUAL, scheduled_at=None) -> ParseJob:
+    """Ставит задачу парсинга чата в очередь
+
+    Полный парсинг наследует checkpoint последней задачи того же чата, если
+    она завершилась ошибкой или была остановлена, - уже сохраненная история
+    повторно не выгружается.
+    """
+    return ParseJob.objects.create(
+        profile_uuid=profile_uuid,
+        chat_url=chat_url,
+        platform=detect_platform(chat_url),
+        update_only=update_only,
+        priority=priority,
+        scheduled_at=scheduled_at,
+        checkpoint=None if update_only else inherited_checkpoint(chat_url),
+    )
+
+
+def enqueue_batch_job(profile_uuid: str, chat_urls: list[str], update_only: bool = False,
+                      priority: int = ParseJob.PRIORITY_MANUAL, scheduled_at=None) -> ParseJob:
+    """Ставит в очередь пакетную задачу: чаты парсятся по очереди в одной сессии профиля"""
+    chat_urls = list(dict.fromkeys(chat_urls))  # Без дублей, порядок сохраняем
+    if not chat_urls:
+        raise ValueError("Batch job needs at least one chat URL")
+    return ParseJob.objects.create(
+        profile_uuid=profile_uuid,
+        chat_url=chat_urls[0],
+        chat_urls=chat_urls,
+        platform=detect_platform(chat_urls[0]),
+        update_only=update_only,
+        priority=priority,
+        scheduled_at=scheduled_at,
+    )
+
+
+def inherited_checkpoint(chat_url: str) -> dict | None:
+    """Checkpoint последнего прерванного полного парсинга чата"""
+    last_job = (
+        ParseJob.objects.filter(chat_url=chat_url, update_only=False, finished_at__isnull=False)
+        .order_by('-finished_at')
+        .first()
+    )
+    if last_job is None or last_job.status not in (ParseJob.STATUS_ERROR, ParseJob.STATUS_CANCELLED):
+        return None
+    return last_job.checkpoint
+
+
+def claim_next_job(worker_id: str, exclude_profiles=(), attempts: int = 5) -> ParseJob | None:
+    """Забирает из очереди задачу с наибольшим приоритетом (среди равных - самую старую)
+
+    SELECT ... FOR UPDATE SKIP LOCKED: параллельные исполнители не ждут друг
+    друга и никогда не получают одну и ту же задачу. Задачи профилей, которые
+    уже парсятся (на любом воркере) или перечислены в exclude_profiles,
+    пропускаются - один профиль Octo обслуживает только один парсер.
+
+    Незакоммиченный claim другого воркера этим запросом не виден: две задачи
+    одного профиля могут быть выбраны одновременно. Второй claim отклоняет
+    уникальное условие parsejob_one_running_per_profile - профиль
+    пропускается и берется следующая задача.
+    """
+    busy_profiles = ParseJob.objects.filter(status=ParseJob.STATUS_RUNNING).values('profile_uuid')
+    skipped = set(exclude_profiles)
+    for _ in range(attempts):
+        job = None
+        try:
+            with transaction.atomic():
+                job = (
+                    ParseJob.objects.select_for_update(skip_locked=True)
+                    .filter(status=ParseJob.STATUS_QUEUED)
+                    .filter(Q(scheduled_at__isnull=True) | Q(scheduled_at__lte=timezone.now()))
+                    .exclude(profile_uuid__in=busy_profiles)
+                    .exclude(profile_uuid__in=list(skipped))
+                    .order_by('-priority', 'created_at')
+                    .first()
+                )
+                if job is None:
+                    return None
+                now = timezone.now()
+                job.status = ParseJob.STATUS_RUNNING
+                job.worker_id = worker_id
+                job.started_at = now
+                job.heartbeat_at = now
+                job.save(update_fields=['status', 'worker_id', 'started_at', 'heartbeat_at'])
+                return job
+        except IntegrityError:
+            # Параллельный воркер только что взял задачу этого профиля
+            skipped.add(job.profile_uuid)
+    return None
+
+
+def heartbeat(job_id: int, checkpoint: dict | None = None) -> bool:
+    """Обновляет heartbeat (и checkpoint, если передан) задачи
+
+    Returns:
+        True, если для задачи запрошена остановка
+    """
+    fields = {'heartbeat_at': timezone.now()}
+    if checkpoint is not None:
+        fields['checkpoint'] = checkpoint
+    ParseJob.objects.filter(pk=job_id).update(**fields)
+    return ParseJob.objects.filter(pk=job_id, cancel_requested=True).exists()
+
+
+def finish_job(job_id: int, status: str, result: dict | None = None, error_message: str = '',
+               checkpoint: dict | None = None):
+    """Фиксирует итог выполнения задачи"""
+    fields = {
+        'status': status,
+        'result': result,
+        'error_message': error_message,
+        'finished_at': timezone.now(),
+    }
+    if checkpoint is not None:
+        fields['checkpoint'] = checkpoint
+    ParseJob.objects.filter(pk=job_id).update(**fields)
+
+
+def release_job(job_id: int):
+    """Возвращает задачу в очередь (воркер останавливается, а отмену никто не запрашивал)"""
+    ParseJob.objects.filter(
+        pk=job_id,
+        cancel_requested=False,
+        status__in=[ParseJob.STATUS_RUNNING, ParseJob.STATUS_CANCELLED],
+    ).update(
+        status=ParseJob.STATUS_QUEUED,
+        worker_id='',
+        started_at=None,
+        heartbeat_at=None,
+        finished_at=None,
+        result=None,
+    )
+
+
+def request_cancel(profile_uuid: str | None = None) -> int:
+    """Останавливает задачи профиля (или все задачи, если профиль не указан)
+
+    Задачи в очереди отменяются сразу, выполняющимся выставляется флаг
+    cancel_requested - исполнитель увидит его при следующем heartbeat.
+
+    Returns:
+        Количество затронутых задач
+    """
+    jobs = ParseJob.objects.all()
+    if profile_uuid:
+        jobs = jobs.filter(profile_uuid=profile_uuid)
+    cancelled = jobs.filter(status=ParseJob.STATUS_QUEUED).update(
+        status=ParseJob.STATUS_CANCELLED,
+        cancel_requested=True,
+        finished_at=timezone.now(),
+    )
+    flagged = jobs.filter(status=ParseJob.STATUS_RUNNING).update(cancel_requested=True)
+    return cancelled + flagged
+
+
+def reap_stale_jobs() -> int:
+    """Помечает ошибкой выполняющиеся задачи, исполнитель которых перестал слать heartbeat"""
+    deadline = timezone.now() - datetime.timedelta(seconds=settings.PARSER_JOB_STALE_TIMEOUT)
+    return ParseJob.objects.filter(
+        status=ParseJob.STATUS_RUNNING,
+        heartbeat_at__lt=deadline,
+    ).update(
+        status=ParseJob.STATUS_ERROR,
+        error_message='Worker heartbeat lost',
+        finished_at=timezone.now(),
+    )
+
+
+def visible_jobs(recent_seconds: int = 30):
+    """Задачи для списка активных парсеров: в работе и завершенные за последние recent_seconds"""
+    recent = timezone.now() - datetime.timedelta(seconds=recent_seconds)
+    return ParseJob.objects.filter(status__in=ParseJob.ACTIVE_STATUSES) | ParseJob.objects.filter(
+        finished_at__gte=recent
+    )
+
+
+async def execute_job(job: ParseJob, parsers: dict | None = None):
+    """Выполняет задачу: запускает парсер и параллельно шлет heartbeat
+
+    Флаг cancel_requested, выставленный любым web-воркером, превращается
+    в parser.stop_requested.
+
+    Args:
+        job: задача, уже переведенная в running
+        parsers: словарь job_id -> парсер, в котором исполнитель держит
+            запущенные парсеры (нужен воркеру для остановки при завершении)
+    """
+    if job.is_batch:
+        parser = BatchChatParser(
+            job.profile_uuid, job.chat_urls, update_only=job.update_only, checkpoint=job.checkpoint,
+        )
+    else:
+        parser = create_parser(
+            job.profile_uuid, job.chat_url, update_only=job.update_only, platform=job.platform,
+            checkpoint=job.checkpoint,
+        )
+    if parsers is not None:
+        parsers[job.pk] = parser
+
+    async def keep_alive():
+        while True:
+            await asyncio.sleep(settings.PARSER_JOB_HEARTBEAT_INTERVAL)
+            try:
+                await sync_to_async(close_old_connections)()
+                stop = await sync_to_async(heartbeat)(job.pk, parser.checkpoint())
+            except Exception as e:
+                # Временная ошибка БД не должна останавливать heartbeat - иначе задачу пометят потерянной
+                print(f"⚠️ Heartbeat error for job {job.pk}: {e}")
+                continue
+            if stop:
+                print(f"🛑 Stop requested for job {job.pk}")
+                parser.stop_requested = True
+
+    heartbeat_task = asyncio.create_task(keep_alive())
+    try:
+        result = await parser.run()
+    except Exception as e:
+        print(f"❌ Parser error in job {job.pk}: {e}")
+        await sync_to_async(finish_job)(
+            job.pk, ParseJob.STATUS_ERROR, error_message=str(e), checkpoint=parser.checkpoint()
+        )
+        return
+    finally:
+        heartbeat_task.cancel()
+        if parsers is not None:
+            parsers.pop(job.pk, None)
+
+    result = result or {}
+    if parser.stop_requested or result.get('status') == 'cancelled':
+        status = ParseJob.STATUS_CANCELLED
+    elif result.get('status') == 'error':
+        status = ParseJob.STATUS_ERROR
+    else:
+        status = ParseJob.STATUS_COMPLETED
+    await sync_to_async(finish_job)(
+        job.pk, status, result=result, error_message=result.get('message', '') if status == ParseJob.STATUS_ERROR else '',
+        checkpoint=parser.checkpoint(),
+    )
+    print(f"✅ Job {job.pk} finished with status {status}: {result}")
+
+
+async def _execute_standalone(job: ParseJob):
+    """execute_job в отдельном event loop: профиль и пулы соединений Octo и БД закрываются вместе с циклом"""
+    try:
+        await execute_job(job)
+    finally:
+        await close_profile_pool()
+        await close_async_octo_client()
+        await close_async_db_pool()
+
+
+def run_queued_jobs():
+    """Выполняет задачи из очереди, пока она не опустеет (для запуска в отдельном потоке)"""
+    worker_id = make_worker_id()
+    while True:
+        close_old_connections()
+        # Без отдельного воркера потерянные задачи снимает этот исполнитель
+        reap_stale_jobs()
+        job = claim_next_job(worker_id)
+        if job is None:
+            return
+        print(f"🚀 Worker {worker_id} claimed job {job.pk}: {job.chat_url}")
+        asyncio.run(_execute_standalone(job))
+
+
+# Единственный поток разбора очереди в процессе (PARSER_INLINE_JOBS)
+_runner_lock = threading.Lock()
+_runner_thread: threading.Thread | None = None
+_runner_wakeup = False  # Задачу поставили, пока поток разбирал очередь
+
+
+def _run_inline_jobs():
+    global _runner_thread, _runner_wakeup
+    while True:
+        try:
+            run_queued_jobs()
+        except Exception as e:
+            print(f"❌ Job runner error: {e}")
+        with _runner_lock:
+            # Очередь проверена пустой, но задачу могли поставить после проверки
+            if not _runner_wakeup:
+                _runner_thread = None
+                return
+            _runner_wakeup = False
+
+
+def start_job_runner():
+    """Будит поток, который разбирает очередь задач в этом процессе
+
+    Только при PARSER_INLINE_JOBS (разработка без отдельного воркера), иначе
+    задачи выполняет manage.py run_parser_worker. Поток на процесс один: если
+    он уже работает, он проверит очередь еще раз перед выходом.
+    """
+    global _runner_thread, _runner_wakeup
+    if not settings.PARSER_INLINE_JOBS:
+        return None
+    with _runner_lock:
+        if _runner_thread is not None:
+            _runner_wakeup = True
+            return _runner_thread
+        _runner_thread = threading.Thread(target=_run_inline_jobs, name="ParseJobRunner", daemon=True)
+        _runner_thread.start()
+        return _runner_thread
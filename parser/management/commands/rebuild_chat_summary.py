@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from parser.ingest import rebuild_chat_summaries
+
+
+class Command(BaseCommand):
+    help = "Пересобирает сводку по чатам (ChatSummary) из всех сохраненных сообщений FullChatMessage"
+
+    def handle(self, *args, **options):
+        chats = rebuild_chat_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt summary for {chats} chat(s)"))
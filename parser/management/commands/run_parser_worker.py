@@ -0,0 +1,31 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from parser.worker import ParserWorker
+
+
+class Command(BaseCommand):
+    help = "Запускает воркер, который выполняет задачи парсинга из очереди ParseJob"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='Максимум одновременно выполняемых задач (PARSER_WORKER_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--per-host', type=int, default=None,
+            help='Максимум одновременных задач на один хост Octo (PARSER_WORKER_OCTO_HOST_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=None,
+            help='Интервал опроса пустой очереди в секундах (PARSER_WORKER_POLL_INTERVAL)',
+        )
+
+    def handle(self, *args, **options):
+        worker = ParserWorker(
+            concurrency=options['concurrency'],
+            host_concurrency=options['per_host'],
+            poll_interval=options['poll_interval'],
+        )
+        asyncio.run(worker.run())
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from parser.scheduler import schedule_parsing
+
+
+class Command(BaseCommand):
+    help = "Ставит в очередь плановое обновление чатов активных профилей, у которых истек parsing_interval"
+
+    def handle(self, *args, **options):
+        enqueued = schedule_parsing()
+        self.stdout.write(self.style.SUCCESS(f"Enqueued {enqueued} batch update job(s)"))
@@ -0,0 +1,93 @@
+# Generated by Django 5.1.4 on 2026-10-17 00:57
+
+import datetime
+import hashlib
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _fingerprint(chat_url, user_id, timestamp, text):
+    # Копия parser.ingest.message_fingerprint на момент миграции
+    if isinstance(timestamp, datetime.datetime):
+        if timezone.is_aware(timestamp):
+            timestamp = timezone.localtime(timestamp).replace(tzinfo=None)
+        timestamp = timestamp.strftime("%Y-%m-%d %H:%M")
+    else:
+        timestamp = ""
+    raw = "\x1f".join([chat_url or "", user_id or "", timestamp, text or ""])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """Заполняет fingerprint у существующих сообщений
+
+    Повторы (одинаковые чат, отправитель, время и текст) остаются с NULL,
+    чтобы уникальный индекс можно было создать без удаления данных.
+    """
+    FullChatMessage = apps.get_model("parser", "FullChatMessage")
+    seen = set()
+    batch = []
+    rows = FullChatMessage.objects.order_by("id").only(
+        "id", "chat_url", "user_id", "timestamp", "message"
+    )
+    for row in rows.iterator(chunk_size=2000):
+        fingerprint = _fingerprint(row.chat_url, row.user_id, row.timestamp, row.message)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        row.fingerprint = fingerprint
+        batch.append(row)
+        if len(batch) >= 2000:
+            FullChatMessage.objects.bulk_update(batch, ["fingerprint"])
+            batch = []
+    if batch:
+        FullChatMessage.objects.bulk_update(batch, ["fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0002_add_chat_url_to_fullchatmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fullchatmessage",
+            name="fingerprint",
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="fullchatmessage",
+            name="fingerprint",
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="fullchatmessage",
+            name="timestamp",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="fullchatmessage",
+            index=models.Index(
+                fields=["chat_url", "timestamp"], name="fullchatmsg_chat_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fullchatmessage",
+            index=models.Index(
+                fields=["model_id", "chat_url"], name="fullchatmsg_model_chat_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="modelinfo",
+            index=models.Index(
+                fields=["model_octo_profile"], name="modelinfo_octo_profile_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="modelinfo",
+            index=models.Index(fields=["model_id"], name="modelinfo_model_id_idx"),
+        ),
+    ]
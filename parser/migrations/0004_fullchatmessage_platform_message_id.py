@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0003_fullchatmessage_fingerprint_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fullchatmessage",
+            name="platform_message_id",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
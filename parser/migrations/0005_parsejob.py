@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0004_fullchatmessage_platform_message_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ParseJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("profile_uuid", models.CharField(max_length=255)),
+                ("chat_url", models.URLField(max_length=500)),
+                ("platform", models.CharField(default="onlyfans", max_length=32)),
+                ("update_only", models.BooleanField(default=False)),
+                ("status", models.CharField(choices=[("queued", "Queued"), ("running", "Running"), ("completed", "Completed"), ("error", "Error"), ("cancelled", "Cancelled")], default="queued", max_length=16)),
+                ("cancel_requested", models.BooleanField(default=False)),
+                ("worker_id", models.CharField(blank=True, default="", max_length=255)),
+                ("heartbeat_at", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("error_message", models.TextField(blank=True, default="")),
+                ("result", models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "parser_parsejob",
+                "ordering": ["created_at"],
+                "indexes": [models.Index(fields=["status", "created_at"], name="parsejob_status_created_idx"), models.Index(fields=["profile_uuid", "status"], name="parsejob_profile_status_idx")],
+            },
+        ),
+    ]
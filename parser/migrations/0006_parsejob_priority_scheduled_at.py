@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0005_parsejob"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="parsejob",
+            name="parsejob_status_created_idx",
+        ),
+        migrations.AddField(
+            model_name="parsejob",
+            name="priority",
+            field=models.IntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name="parsejob",
+            name="scheduled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="parsejob",
+            index=models.Index(fields=["status", "-priority", "created_at"], name="parsejob_status_prio_idx"),
+        ),
+    ]
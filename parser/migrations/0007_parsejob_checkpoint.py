@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0006_parsejob_priority_scheduled_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parsejob",
+            name="checkpoint",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
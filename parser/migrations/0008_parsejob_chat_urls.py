@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0007_parsejob_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parsejob",
+            name="chat_urls",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
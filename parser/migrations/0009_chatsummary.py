@@ -0,0 +1,70 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:28
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+
+def build_chat_summaries(apps, schema_editor):
+    """Сводка по уже сохраненным сообщениям (как parser.ingest.rebuild_chat_summaries)"""
+    FullChatMessage = apps.get_model("parser", "FullChatMessage")
+    ChatSummary = apps.get_model("parser", "ChatSummary")
+    rows = (
+        FullChatMessage.objects.exclude(chat_url__isnull=True)
+        .exclude(chat_url="")
+        .values("model_id", "chat_url")
+        .annotate(
+            fan_id=Max("user_id", filter=Q(is_from_model=False)),
+            message_count=Count("id"),
+            paid_count=Count("id", filter=Q(is_paid=True)),
+            revenue=Sum("amount_paid"),
+            first_message_at=Min("timestamp"),
+            last_message_at=Max("timestamp"),
+        )
+        .order_by()
+    )
+    ChatSummary.objects.bulk_create(
+        [
+            ChatSummary(
+                model_id=row["model_id"],
+                chat_url=row["chat_url"],
+                user_id=row["fan_id"],
+                message_count=row["message_count"],
+                paid_count=row["paid_count"],
+                revenue=row["revenue"] or 0,
+                first_message_at=row["first_message_at"],
+                last_message_at=row["last_message_at"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0008_parsejob_chat_urls"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model_id", models.CharField(blank=True, default="", max_length=255)),
+                ("chat_url", models.URLField(max_length=500)),
+                ("user_id", models.CharField(blank=True, max_length=64, null=True)),
+                ("message_count", models.IntegerField(default=0)),
+                ("paid_count", models.IntegerField(default=0)),
+                ("revenue", models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ("first_message_at", models.DateTimeField(blank=True, null=True)),
+                ("last_message_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "parser_chatsummary",
+                "indexes": [models.Index(fields=["model_id", "-last_message_at"], name="chatsummary_model_last_idx")],
+                "constraints": [models.UniqueConstraint(fields=("model_id", "chat_url"), name="chatsummary_model_chat_uniq")],
+            },
+        ),
+        migrations.RunPython(build_chat_summaries, migrations.RunPython.noop),
+    ]
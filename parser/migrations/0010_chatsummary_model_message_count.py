@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_model_message_count(apps, schema_editor):
+    """Количество сообщений модели для уже собранных сводок"""
+    FullChatMessage = apps.get_model("parser", "FullChatMessage")
+    ChatSummary = apps.get_model("parser", "ChatSummary")
+    model_messages = (
+        FullChatMessage.objects.filter(
+            model_id=OuterRef("model_id"), chat_url=OuterRef("chat_url"), is_from_model=True
+        )
+        .order_by()
+        .values("chat_url")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    ChatSummary.objects.update(model_message_count=Coalesce(Subquery(model_messages), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0009_chatsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsummary",
+            name="model_message_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_model_message_count, migrations.RunPython.noop),
+    ]
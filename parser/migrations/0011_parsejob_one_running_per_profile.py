@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:40
+
+from django.db import migrations, models
+
+
+def fail_duplicate_running_jobs(apps, schema_editor):
+    """Лишние выполняющиеся задачи профиля (после прошлых гонок claim) помечаются ошибкой"""
+    ParseJob = apps.get_model("parser", "ParseJob")
+    seen = set()
+    for job in ParseJob.objects.filter(status="running").order_by("profile_uuid", "-heartbeat_at", "-pk"):
+        if job.profile_uuid in seen:
+            ParseJob.objects.filter(pk=job.pk).update(status="error", error_message="Duplicate running job for profile")
+        seen.add(job.profile_uuid)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0010_chatsummary_model_message_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_running_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="parsejob",
+            constraint=models.UniqueConstraint(condition=models.Q(("status", "running")), fields=("profile_uuid",), name="parsejob_one_running_per_profile"),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.4 on 2026-10-17 05:10
+
+import datetime
+import hashlib
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def _fingerprint(chat_url, is_from_model, timestamp, text):
+    # Копия parser.ingest.message_fingerprint на момент миграции
+    if isinstance(timestamp, datetime.datetime):
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+        timestamp = timestamp.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")
+    else:
+        timestamp = ""
+    sender = "model" if is_from_model else "fan"
+    raw = "\x1f".join([chat_url or "", sender, timestamp, " ".join((text or "").split())])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def recompute_fingerprints(apps, schema_editor):
+    """Пересчитывает fingerprint по стороне отправителя, времени в UTC и тексту
+
+    Старые ключи сбрасываются целиком, чтобы новый ключ одной строки не
+    столкнулся со старым ключом другой. Строки, которые совпали по новому
+    ключу (одно сообщение из API и из DOM), остаются с NULL, как и повторы
+    в 0003: данные не удаляются, но дубликатом при записи они больше не станут.
+    """
+    FullChatMessage = apps.get_model("parser", "FullChatMessage")
+    FullChatMessage.objects.exclude(fingerprint__isnull=True).update(fingerprint=None)
+
+    seen = set()
+    batch = []
+    rows = FullChatMessage.objects.order_by("id").only(
+        "id", "chat_url", "is_from_model", "timestamp", "message"
+    )
+    for row in rows.iterator(chunk_size=2000):
+        fingerprint = _fingerprint(row.chat_url, row.is_from_model, row.timestamp, row.message)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        row.fingerprint = fingerprint
+        batch.append(row)
+        if len(batch) >= 2000:
+            FullChatMessage.objects.bulk_update(batch, ["fingerprint"])
+            batch = []
+    if batch:
+        FullChatMessage.objects.bulk_update(batch, ["fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0011_parsejob_one_running_per_profile"),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-17 05:20
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def fill_last_paid_at(apps, schema_editor):
+    """Время последнего платного сообщения для уже собранных сводок"""
+    FullChatMessage = apps.get_model("parser", "FullChatMessage")
+    ChatSummary = apps.get_model("parser", "ChatSummary")
+    last_paid = (
+        FullChatMessage.objects.filter(
+            model_id=OuterRef("model_id"), chat_url=OuterRef("chat_url"), is_paid=True
+        )
+        .order_by()
+        .values("chat_url")
+        .annotate(last_paid_at=Max("timestamp"))
+        .values("last_paid_at")
+    )
+    ChatSummary.objects.filter(paid_count__gt=0).update(last_paid_at=Subquery(last_paid))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parser", "0012_recompute_message_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsummary",
+            name="last_paid_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_last_paid_at, migrations.RunPython.noop),
+    ]
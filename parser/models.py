@@ -52,6 +52,10 @@ class ModelInfo(models.Model):
 
     class Meta:
         db_table = 'parser_modelinfo'
+        indexes = [
+            models.Index(fields=['model_octo_profile'], name='modelinfo_octo_profile_idx'),
+            models.Index(fields=['model_id'], name='modelinfo_model_id_idx'),
+        ]
     
     def __str__(self):
         return f"ModelInfo {self.model_name} (group: {self.group_id})"
@@ -66,11 +70,119 @@ class FullChatMessage(models.Model):
     is_paid = models.BooleanField(default=False)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     model_id = models.CharField(max_length=255, default='', blank=True)
+    # Хэш чата, стороны отправителя, времени (UTC) и текста - ключ дедупликации (см. parser.ingest.message_fingerprint)
+    fingerprint = models.CharField(max_length=32, unique=True, null=True, blank=True)
+    # id сообщения на платформе (есть только у сообщений, полученных из API)
+    platform_message_id = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         db_table = 'parser_fullchatmessage'
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['chat_url', 'timestamp'], name='fullchatmsg_chat_ts_idx'),
+            models.Index(fields=['model_id', 'chat_url'], name='fullchatmsg_model_chat_idx'),
+        ]
     
     def __str__(self):
         return f"Message from user {self.user_id} at {self.timestamp}"
 
+
+class ChatSummary(models.Model):
+    """Сводка по чату модели для главной страницы
+
+    Обновляется при записи сообщений (parser.ingest) только на вставленные
+    строки, полностью пересобирается командой rebuild_chat_summary.
+    """
+    model_id = models.CharField(max_length=255, default='', blank=True)
+    chat_url = models.URLField(max_length=500)
+    # id собеседника (отправитель сообщений не от модели)
+    user_id = models.CharField(max_length=64, null=True, blank=True)
+    message_count = models.IntegerField(default=0)
+    model_message_count = models.IntegerField(default=0)  # Из них сообщений модели
+    paid_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    first_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_paid_at = models.DateTimeField(null=True, blank=True)  # Последнее платное сообщение (приоритет планировщика)
+
+    class Meta:
+        db_table = 'parser_chatsummary'
+        constraints = [
+            models.UniqueConstraint(fields=['model_id', 'chat_url'], name='chatsummary_model_chat_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['model_id', '-last_message_at'], name='chatsummary_model_last_idx'),
+        ]
+
+    def __str__(self):
+        return f"ChatSummary {self.model_id} {self.chat_url} ({self.message_count} messages)"
+
+
+class ParseJob(models.Model):
+    """Задача парсинга чата. Очередь общая для всех web-воркеров и нод"""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_ERROR = 'error'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_ERROR, 'Error'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    # Приоритеты: задачи из интерфейса идут раньше плановых, чаты с недавними оплатами - раньше остальных
+    PRIORITY_SCHEDULED = 0
+    PRIORITY_PAID = 10
+    PRIORITY_MANUAL = 20
+
+    profile_uuid = models.CharField(max_length=255)
+    chat_url = models.URLField(max_length=500)
+    # Пакетная задача: чаты, которые парсятся по очереди в одной сессии профиля (chat_url - первый из них)
+    chat_urls = models.JSONField(null=True, blank=True)
+    platform = models.CharField(max_length=32, default='onlyfans')
+    update_only = models.BooleanField(default=False)
+    priority = models.IntegerField(default=PRIORITY_MANUAL)
+    # Не запускать раньше этого времени (разнос плановых задач во времени)
+    scheduled_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    cancel_requested = models.BooleanField(default=False)
+    worker_id = models.CharField(max_length=255, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error_message = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    # Сохраненный диапазон чата ({'api_cursor', 'oldest_timestamp', 'newest_timestamp'}), у пакета -
+    # {'chat_index', 'done', 'chats': {индекс: диапазон чата}} - для продолжения после сбоя
+    checkpoint = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'parser_parsejob'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at'], name='parsejob_status_prio_idx'),
+            models.Index(fields=['profile_uuid', 'status'], name='parsejob_profile_status_idx'),
+        ]
+        constraints = [
+            # Один профиль Octo - одна выполняющаяся задача (гонку параллельных claim решает база)
+            models.UniqueConstraint(
+                fields=['profile_uuid'],
+                condition=models.Q(status='running'),
+                name='parsejob_one_running_per_profile',
+            ),
+        ]
+
+    @property
+    def is_batch(self) -> bool:
+        return bool(self.chat_urls)
+
+    def __str__(self):
+        if self.is_batch:
+            return f"ParseJob {self.pk} batch of {len(self.chat_urls)} chats ({self.status})"
+        return f"ParseJob {self.pk} {self.chat_url} ({self.status})"
@@ -0,0 +1,106 @@
+"""
+Interval scheduler: enqueues incremental updates of known chats for active profiles
+"""
+import datetime
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .jobs import enqueue_batch_job
+from .models import ChatSummary, ModelInfo, ParseJob, Profile
+
+
+def profile_is_due(profile: Profile, now: datetime.datetime) -> bool:
+    """Истек ли интервал парсинга профиля (parsing_interval - в минутах)"""
+    if profile.last_parsed_at is None:
+        return True
+    return profile.last_parsed_at + datetime.timedelta(minutes=profile.parsing_interval) <= now
+
+
+def profile_chats(profile_uuid: str) -> list[dict]:
+    """Известные чаты профиля из ChatSummary (сначала недавно активные)
+
+    Returns:
+        [{'chat_url': ..., 'last_paid_at': datetime | None}, ...]
+    """
+    model_ids = list(
+        ModelInfo.objects.filter(model_octo_profile=profile_uuid).values_list('model_id', flat=True)
+    )
+    if not model_ids:
+        return []
+    return list(
+        ChatSummary.objects.filter(model_id__in=model_ids)
+        .order_by(F('last_message_at').desc(nulls_last=True), 'chat_url')
+        .values('chat_url', 'last_paid_at')
+    )
+
+
+def active_profile_chats(profile_uuid: str) -> set[str]:
+    """Чаты профиля, по которым уже есть задача в очереди или в работе (включая чаты пакетов)"""
+    chats = set()
+    jobs = ParseJob.objects.filter(profile_uuid=profile_uuid, status__in=ParseJob.ACTIVE_STATUSES)
+    for chat_url, chat_urls in jobs.values_list('chat_url', 'chat_urls'):
+        chats.add(chat_url)
+        chats.update(chat_urls or [])
+    return chats
+
+
+def schedule_parsing(now: datetime.datetime | None = None) -> int:
+    """Ставит в очередь обновление всех чатов активных профилей, у которых истек интервал
+
+    Чаты профиля обновляются пакетными задачами (одна сессия профиля на все
+    чаты): чаты с оплатой за последние PARSER_SCHEDULER_PAID_WINDOW часов -
+    отдельным пакетом с повышенным приоритетом, остальные - пакетом с
+    плановым приоритетом. Пакеты каждого профиля сдвигаются на случайную
+    задержку (до PARSER_SCHEDULER_MAX_JITTER секунд, но не больше половины
+    интервала), чтобы профили не запускались одновременно. Профили блокируются
+    через SKIP LOCKED, поэтому несколько воркеров могут планировать параллельно
+    без дублей.
+
+    Returns:
+        Количество поставленных задач
+    """
+    now = now or timezone.now()
+    paid_since = now - datetime.timedelta(hours=settings.PARSER_SCHEDULER_PAID_WINDOW)
+    enqueued = 0
+
+    with transaction.atomic():
+        profiles = Profile.objects.select_for_update(skip_locked=True).filter(is_active=True)
+        for profile in profiles:
+            if not profile_is_due(profile, now):
+                continue
+
+            # Чаты, по которым уже есть задача в очереди или в работе, не дублируем
+            active_chats = active_profile_chats(profile.uuid)
+
+            max_jitter = min(settings.PARSER_SCHEDULER_MAX_JITTER, profile.parsing_interval * 60 / 2)
+            scheduled_at = now + datetime.timedelta(seconds=random.uniform(0, max_jitter))
+
+            paid_chats, other_chats = [], []
+            for chat in profile_chats(profile.uuid):
+                if chat['chat_url'] in active_chats:
+                    continue
+                paid_recently = chat['last_paid_at'] is not None and chat['last_paid_at'] >= paid_since
+                (paid_chats if paid_recently else other_chats).append(chat['chat_url'])
+
+            jobs = 0
+            for chat_urls, priority in ((paid_chats, ParseJob.PRIORITY_PAID), (other_chats, ParseJob.PRIORITY_SCHEDULED)):
+                if chat_urls:
+                    enqueue_batch_job(
+                        profile.uuid, chat_urls, update_only=True, priority=priority, scheduled_at=scheduled_at,
+                    )
+                    jobs += 1
+            enqueued += jobs
+
+            # last_parsed_at - время последнего планового запуска профиля
+            profile.last_parsed_at = now
+            profile.save(update_fields=['last_parsed_at'])
+
+            if jobs:
+                print(f"🗓️ Scheduled {len(paid_chats) + len(other_chats)} chat update(s) in {jobs} batch job(s) "
+                      f"for profile {profile.uuid[:8]} at {scheduled_at:%H:%M:%S}")
+
+    return enqueued
@@ -3,17 +3,164 @@ from django.utils import timezone
 import requests
 import asyncio
 import datetime
-from playwright.async_api import async_playwright, Response, Page, Browser
-from asgiref.sync import sync_to_async
+import html
+import re
+import threading
+import time
+import weakref
+import zoneinfo
+from urllib.parse import parse_qs, urlencode, urlsplit
+import httpx
+from playwright.async_api import async_playwright, Response, Request, Page, Browser
 
-from .models import Profile, ChatMessage, FullChatMessage, ModelInfo
+from .models import Profile, ChatMessage, FullChatMessage
+from .ingest import acopy_ingest_messages, aingest_messages, aload_high_water_mark, aload_model_info, message_fingerprint
 from .exceptions import (
     LoginPageException,
+    MessageSaveError,
     OctoProfileStartException,
     OctoProfileAlreadyStartedException,
 )
 
 
+class OctoProfileRegistry:
+    """Кэш состояния профилей локального Octo, индексированный по uuid
+
+    Список профилей запрашивается у Octo не чаще раза в interval секунд
+    (воркер обновляет его фоновым опросом), все остальные вызовы читают
+    словарь: статус, ws_endpoint и время запуска профиля - O(1) без запроса к Octo.
+    Запуск и остановка профиля через клиент сразу отражаются в реестре.
+    """
+
+    def __init__(self, interval: float | None = None):
+        self.interval = interval if interval is not None else settings.OCTO_REGISTRY_INTERVAL
+        self.profiles: dict[str, dict] = {}
+        self.updated_at: float | None = None  # time.monotonic() последнего опроса
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def stale(self) -> bool:
+        return self.updated_at is None or time.monotonic() - self.updated_at >= self.interval
+
+    def update(self, profiles: list[dict], active: list[dict]):
+        """Заменяет снимок: все профили из /api/profiles, запущенные (с ws_endpoint) из /api/profiles/active"""
+        indexed = {}
+        for profile in profiles:
+            if profile.get('uuid'):
+                indexed[profile['uuid']] = dict(profile)
+        for profile in active:
+            if profile.get('uuid'):
+                indexed[profile['uuid']] = {**indexed.get(profile['uuid'], {}), **profile, 'status': 'running'}
+        for uuid, profile in indexed.items():
+            previous = self.profiles.get(uuid)
+            if profile.get('status') == 'running':
+                if previous and previous.get('status') == 'running':
+                    profile.setdefault('started_at', previous.get('started_at'))
+                else:
+                    profile.setdefault('started_at', timezone.now())
+        self.profiles = indexed
+        self.updated_at = time.monotonic()
+
+    def mark(self, uuid: str, status: str, data: dict | None = None):
+        """Локально отмечает запуск или остановку профиля до следующего опроса"""
+        profile = {**self.profiles.get(uuid, {'uuid': uuid}), **(data or {}), 'status': status}
+        if status == 'running':
+            profile['started_at'] = timezone.now()
+        else:
+            profile.pop('ws_endpoint', None)
+        self.profiles[uuid] = profile
+
+    def refresh(self, fetch, force: bool = False):
+        """Синхронное обновление снимка, если он устарел (fetch -> (profiles, active) или None)"""
+        if not force and not self.stale:
+            return
+        with self._lock:
+            if not force and not self.stale:
+                return
+            data = fetch()
+            if data is not None:
+                self.update(*data)
+
+    async def refresh_async(self, fetch, force: bool = False):
+        """То же для event loop: пока идет один опрос, остальные читают текущий снимок"""
+        if not force and not self.stale:
+            return
+        if self._refreshing and self.updated_at is not None:
+            return
+        self._refreshing = True
+        try:
+            data = await fetch()
+            if data is not None:
+                self.update(*data)
+        finally:
+            self._refreshing = False
+
+    def get(self, uuid: str) -> dict | None:
+        return self.profiles.get(uuid)
+
+    def is_running(self, uuid: str) -> bool | None:
+        """Запущен ли профиль; None - реестр еще ни разу не обновлялся"""
+        if self.updated_at is None and uuid not in self.profiles:
+            return None
+        profile = self.profiles.get(uuid)
+        return profile is not None and profile.get('status') == 'running'
+
+    def running(self) -> list[dict]:
+        return [profile for profile in self.profiles.values() if profile.get('status') == 'running']
+
+    def reached(self, uuid: str, running: bool) -> bool:
+        """Профиль в нужном состоянии: запущен и отдает ws_endpoint (running=True) или не запущен"""
+        profile = self.profiles.get(uuid)
+        if running:
+            return bool(profile and profile.get('status') == 'running' and profile.get('ws_endpoint'))
+        return not (profile and profile.get('status') == 'running')
+
+
+# Реестр профилей процесса: общий для всех клиентов Octo и парсеров
+profile_registry = OctoProfileRegistry()
+
+
+class OctoAuthCache:
+    """Кэш авторизации в Octo: до истечения срока повторный логин не нужен
+
+    Общий для всех клиентов процесса (клиенты создаются на каждый запрос),
+    ключ - адрес API и учетная запись.
+    """
+
+    def __init__(self):
+        self.expires: dict[tuple, float] = {}
+
+    def valid(self, key: tuple) -> bool:
+        return self.expires.get(key, 0) > time.monotonic()
+
+    def remember(self, key: tuple, ttl: float):
+        self.expires[key] = time.monotonic() + ttl
+
+    def invalidate(self, key: tuple):
+        self.expires.pop(key, None)
+
+
+octo_auth_cache = OctoAuthCache()
+
+
+def backoff_delays(initial: float | None = None, maximum: float | None = None):
+    """Бесконечная последовательность пауз опроса: initial, 2*initial, ... до maximum"""
+    delay = initial if initial is not None else settings.OCTO_POLL_INITIAL_DELAY
+    maximum = maximum if maximum is not None else settings.OCTO_POLL_MAX_DELAY
+    while True:
+        yield delay
+        delay = min(delay * 2, maximum)
+
+
+def is_octo_auth_error(status_code: int, text: str) -> bool:
+    """Ответ Octo означает, что сессия не авторизована"""
+    if status_code in (401, 403):
+        return True
+    text = (text or '').lower()
+    return any(marker in text for marker in ('not logged', 'unauthorized', 'login required'))
+
+
 class OctoClient:
     """Client for interacting with Octo Browser API"""
     
@@ -23,12 +170,32 @@ class OctoClient:
     email: str
     password: str
 
+    # Наборы флагов Chromium для запуска профиля. lean отключает загрузку картинок,
+    # звук и фоновые сетевые задачи браузера - профилю для парсинга они не нужны
+    FLAG_PRESETS = {
+        'default': ["--disable-dev-shm-usage"],
+        'lean': [
+            "--disable-dev-shm-usage",
+            "--blink-settings=imagesEnabled=false",
+            "--mute-audio",
+            "--autoplay-policy=user-gesture-required",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-sync",
+        ],
+    }
+
     def __init__(self, email: str, password: str, host: str = "octo", port: int = 58888):
         self.host = host
         self.port = port
         self.email = email
         self.password = password
         self.base_local_url = f"http://{self.host}:{self.port}"
+        self.auth_key = (self.base_local_url, self.email)
+        # Одна сессия на клиента - keep-alive соединения к локальному API Octo
+        self.session = requests.Session()
+        self.timeout = settings.OCTO_HTTP_TIMEOUT
+        self.start_timeout = settings.OCTO_START_TIMEOUT  # Запуск профиля поднимает браузер и идет дольше
     
     @classmethod
     def init_from_settings(cls):
@@ -41,11 +208,17 @@ class OctoClient:
 
     def check_auth(self):
         # Check cloud API instead of local API
+        cache_key = ('cloud', settings.OCTO_API_TOKEN)
+        if octo_auth_cache.valid(cache_key):
+            return True
+        
         api_url = "https://app.octobrowser.net/api/v2/automation/profiles"
         headers = {"X-Octo-Api-Token": settings.OCTO_API_TOKEN}
         
         try:
-            response = requests.get(api_url, headers=headers, timeout=10)
+            response = self.session.get(api_url, headers=headers, timeout=self.timeout)
+            if response.ok:
+                octo_auth_cache.remember(cache_key, settings.OCTO_AUTH_TTL)
             return response.ok
         except Exception as e:
             print(f"API check failed: {e}")
@@ -57,7 +230,7 @@ class OctoClient:
             "email": self.email,
             "password": self.password
         }
-        response = requests.post(api_url, json=payload)
+        response = self.session.post(api_url, json=payload, timeout=self.timeout)
 
         if response.ok:
             print("Login successful")
@@ -74,16 +247,43 @@ class OctoClient:
             print(response.text)
             return False
 
-    def start_profile(self, uuid: str, headless: bool = True, debug_port: bool = True, flags: list = ["--disable-dev-shm-usage"]):
+    def ensure_login(self) -> bool:
+        """Логин, только если закэшированная авторизация истекла или была сброшена"""
+        if octo_auth_cache.valid(self.auth_key):
+            return True
         if not self.login():
             return False
-    
-        # Всегда делаем force_stop перед запуском для гарантии чистого старта
-        print(f"🛑 Force stopping profile {uuid} before starting...")
-        self.force_stop_profile(uuid)
+        octo_auth_cache.remember(self.auth_key, settings.OCTO_AUTH_TTL)
+        return True
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Запрос к локальному API Octo; если сессия Octo истекла раньше кэша -
+        логин заново и одна повторная попытка"""
+        kwargs.setdefault('timeout', self.timeout)
+        response = self.session.request(method, f"{self.base_local_url}{path}", **kwargs)
+        if not response.ok and is_octo_auth_error(response.status_code, response.text):
+            print("🔑 Octo session expired, logging in again...")
+            octo_auth_cache.invalidate(self.auth_key)
+            if self.ensure_login():
+                response = self.session.request(method, f"{self.base_local_url}{path}", **kwargs)
+        return response
+
+    def start_profile(self, uuid: str, headless: bool = True, debug_port: bool = True,
+                      flags: list | None = None, flags_preset: str | None = None):
+        if flags is None:
+            flags = self.FLAG_PRESETS[flags_preset or settings.OCTO_FLAGS_PRESET]
         
-        import time
-        time.sleep(2)  # Ждем 2 секунды после остановки
+        if not self.ensure_login():
+            return False
+    
+        # force_stop перед запуском нужен, только если профиль может быть запущен
+        profile_registry.refresh(self.fetch_profiles)
+        if profile_registry.is_running(uuid) is False:
+            print(f"⏭️ Profile {uuid} is not running, skipping force stop")
+        else:
+            print(f"🛑 Force stopping profile {uuid} before starting...")
+            self.force_stop_profile(uuid)
+            self.wait_for_state(uuid, running=False)
         
         # Use local API for starting profile
         api_url = f"{self.base_local_url}/api/profiles/start"
@@ -99,13 +299,18 @@ class OctoClient:
         print(f"API URL: {api_url}")
         print(f"Payload: {payload}")
 
-        response = requests.post(api_url, json=payload)
+        response = self._request("POST", "/api/profiles/start", json=payload, timeout=self.start_timeout)
         print(f"Response Status: {response.status_code}")
         print(f"Response Text: {response.text}")
 
         if response.ok:
             print("✅ Профиль успешно запущен")
             resp_data = response.json()
+            if resp_data.get('ws_endpoint'):
+                profile_registry.mark(uuid, 'running', resp_data)
+            elif self.wait_for_state(uuid, running=True):
+                # Octo ответил раньше, чем браузер открыл CDP - берем ws_endpoint из опроса
+                resp_data = {**resp_data, **profile_registry.get(uuid)}
             return resp_data
         else:
             print("❌ Ошибка запуска профиля")
@@ -119,44 +324,57 @@ class OctoClient:
     
     def stop_profile(self, uuid: str):
         # Use local API for stopping profile (as in example)
-        api_url = f"{self.base_local_url}/api/profiles/stop"
-        payload = {"uuid": uuid}
-        response = requests.post(api_url, json=payload)
+        response = self._request("POST", "/api/profiles/stop", json={"uuid": uuid})
         if response.ok:
             print("Profile stopped successfully")
+            profile_registry.mark(uuid, 'stopped')
             return True
         return False
     
     def force_stop_profile(self, uuid: str):
         # Use local API force_stop exactly as in example
-        api_url = f"{self.base_local_url}/api/profiles/force_stop"
-        payload = {"uuid": uuid}
-        response = requests.post(api_url, json=payload)
+        response = self._request("POST", "/api/profiles/force_stop", json={"uuid": uuid})
         if response.ok:
             print("Profile stopped successfully")
+            profile_registry.mark(uuid, 'stopped')
             return True
         return False
 
+    def fetch_profiles(self) -> tuple[list, list] | None:
+        """Все профили и запущенные профили (с ws_endpoint) напрямую из Octo - для обновления реестра"""
+        response = self._request("GET", "/api/profiles")
+        if not response.ok:
+            return None
+        active_response = self._request("GET", "/api/profiles/active")
+        return response.json(), active_response.json() if active_response.ok else []
+
+    def wait_for_state(self, uuid: str, running: bool, timeout: float | None = None) -> bool:
+        """Опрашивает Octo с экспоненциальной паузой, пока профиль не остановится
+        (running=False) или не запустится с ws_endpoint (running=True)
+
+        Returns:
+            True, если состояние достигнуто, False - по истечении timeout (OCTO_READY_TIMEOUT)
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.OCTO_READY_TIMEOUT)
+        for delay in backoff_delays():
+            profile_registry.refresh(self.fetch_profiles, force=True)
+            if profile_registry.reached(uuid, running):
+                return True
+            if time.monotonic() + delay > deadline:
+                print(f"⚠️ Profile {uuid} did not become {'ready' if running else 'stopped'} in time")
+                return False
+            time.sleep(delay)
+
     def get_running_profiles(self):
-        api_url = f"{self.base_local_url}/api/profiles"
-        response = requests.get(api_url)
-        
-        if response.ok:
-            data = response.json()
-            running = [p for p in data if p.get('status') == 'running']
-            return running
-        return []
+        profile_registry.refresh(self.fetch_profiles)
+        return profile_registry.running()
     
     def get_profile_info(self, uuid: str):
         """Получить полную информацию о профиле (включая ws_endpoint если запущен)"""
-        api_url = f"{self.base_local_url}/api/profiles"
-        response = requests.get(api_url)
-        
-        if response.ok:
-            data = response.json()
-            for profile in data:
-                if profile.get('uuid') == uuid and profile.get('status') == 'running':
-                    return profile
+        profile_registry.refresh(self.fetch_profiles)
+        profile = profile_registry.get(uuid)
+        if profile and profile.get('status') == 'running':
+            return profile
         return None
 
     def force_stop_all_profiles(self):
@@ -172,41 +390,440 @@ class OctoClient:
         return stopped_count
 
     def force_restart_profile(self, uuid: str, max_attempts: int = 3):
-        import time
-        
         for attempt in range(max_attempts):
             print(f"Attempt {attempt + 1} to restart profile {uuid}")
-            
+
             self.stop_profile(uuid)
-            time.sleep(5)
-            
+            if not self.wait_for_state(uuid, running=False):
+                # Обычная остановка не сработала - останавливаем принудительно
+                self.force_stop_profile(uuid)
+                self.wait_for_state(uuid, running=False)
+
             try:
                 response_data = self.start_profile(uuid)
                 print(f"Successfully restarted profile {uuid}")
                 return response_data
-            except OctoProfileAlreadyStartedException:
+            except Exception as e:
+                print(f"Restart attempt {attempt + 1} failed: {e}")
                 if attempt == max_attempts - 1:
-                    try:
-                        self.force_stop_profile(uuid)
-                        time.sleep(10)
-                        response_data = self.start_profile(uuid)
-                        return response_data
-                    except Exception as e:
-                        print(f"Final restart attempt failed: {e}")
-                        raise
-                else:
-                    print(f"Profile still running after stop, waiting...")
-                    time.sleep(10)
-                    continue
+                    raise
+
+        raise Exception(f"Failed to restart profile {uuid} after {max_attempts} attempts")
+
+
+class AsyncOctoClient:
+    """Async client for Octo Browser local API
+
+    Работает через один httpx.AsyncClient с пулом keep-alive соединений и
+    таймаутами, поэтому воркер может параллельно запускать и останавливать
+    много профилей, не блокируя event loop.
+    """
+
+    def __init__(self, email: str, password: str, host: str = "octo", port: int = 58888):
+        self.host = host
+        self.port = port
+        self.email = email
+        self.password = password
+        self.base_local_url = f"http://{self.host}:{self.port}"
+        self.auth_key = (self.base_local_url, self.email)
+        self.start_timeout = settings.OCTO_START_TIMEOUT
+        self.client = httpx.AsyncClient(
+            base_url=self.base_local_url,
+            timeout=httpx.Timeout(settings.OCTO_HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.OCTO_HTTP_POOL_SIZE,
+                max_keepalive_connections=settings.OCTO_HTTP_POOL_SIZE,
+            ),
+        )
+
+    @classmethod
+    def init_from_settings(cls):
+        return cls(
+            email=settings.OCTO_EMAIL,
+            password=settings.OCTO_PASSWORD,
+            host=settings.OCTO_HOST,
+            port=settings.OCTO_PORT
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def login(self):
+        response = await self.client.post("/api/auth/login", json={"email": self.email, "password": self.password})
+        if response.is_success:
+            print("Login successful")
+            return True
+        try:
+            if response.json().get('error') == 'Already logged in':
+                print("Already logged in")
+                return True
+        except Exception:
+            pass
+        print("Login failed")
+        print(response.text)
+        return False
+
+    async def ensure_login(self) -> bool:
+        """Логин, только если закэшированная авторизация истекла или была сброшена"""
+        if octo_auth_cache.valid(self.auth_key):
+            return True
+        if not await self.login():
+            return False
+        octo_auth_cache.remember(self.auth_key, settings.OCTO_AUTH_TTL)
+        return True
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Запрос к локальному API Octo; если сессия Octo истекла раньше кэша -
+        логин заново и одна повторная попытка"""
+        response = await self.client.request(method, path, **kwargs)
+        if not response.is_success and is_octo_auth_error(response.status_code, response.text):
+            print("🔑 Octo session expired, logging in again...")
+            octo_auth_cache.invalidate(self.auth_key)
+            if await self.ensure_login():
+                response = await self.client.request(method, path, **kwargs)
+        return response
+
+    async def start_profile(self, uuid: str, headless: bool = True, debug_port: bool = True,
+                            flags: list | None = None, flags_preset: str | None = None):
+        if flags is None:
+            flags = OctoClient.FLAG_PRESETS[flags_preset or settings.OCTO_FLAGS_PRESET]
+
+        if not await self.ensure_login():
+            return False
+
+        # force_stop перед запуском нужен, только если профиль может быть запущен
+        await self.refresh_registry()
+        if profile_registry.is_running(uuid) is False:
+            print(f"⏭️ Profile {uuid} is not running, skipping force stop")
+        else:
+            print(f"🛑 Force stopping profile {uuid} before starting...")
+            await self.force_stop_profile(uuid)
+            await self.wait_for_state(uuid, running=False)
+
+        payload = {
+            "uuid": uuid,
+            "headless": headless,
+            "debug_port": debug_port,
+            "flags": flags
+        }
+        print(f"🚀 Запускаем профиль UUID: {uuid}")
+        response = await self._request("POST", "/api/profiles/start", json=payload, timeout=self.start_timeout)
+        print(f"Response Status: {response.status_code}")
+
+        if response.is_success:
+            print("✅ Профиль успешно запущен")
+            resp_data = response.json()
+            if resp_data.get('ws_endpoint'):
+                profile_registry.mark(uuid, 'running', resp_data)
+            elif await self.wait_for_state(uuid, running=True):
+                # Octo ответил раньше, чем браузер открыл CDP - берем ws_endpoint из опроса
+                resp_data = {**resp_data, **profile_registry.get(uuid)}
+            return resp_data
+
+        print("❌ Ошибка запуска профиля")
+        try:
+            resp_data = response.json()
+        except Exception:
+            resp_data = None
+        print(f"Response: {response.text}")
+        raise OctoProfileStartException(resp_data or "Failed to start profile")
+
+    async def stop_profile(self, uuid: str):
+        response = await self._request("POST", "/api/profiles/stop", json={"uuid": uuid})
+        if response.is_success:
+            print("Profile stopped successfully")
+            profile_registry.mark(uuid, 'stopped')
+            return True
+        return False
+
+    async def force_stop_profile(self, uuid: str):
+        response = await self._request("POST", "/api/profiles/force_stop", json={"uuid": uuid})
+        if response.is_success:
+            print("Profile stopped successfully")
+            profile_registry.mark(uuid, 'stopped')
+            return True
+        return False
+
+    async def fetch_profiles(self) -> tuple[list, list] | None:
+        """Все профили и запущенные профили (с ws_endpoint) напрямую из Octo - для обновления реестра"""
+        response = await self._request("GET", "/api/profiles")
+        if not response.is_success:
+            return None
+        active_response = await self._request("GET", "/api/profiles/active")
+        return response.json(), active_response.json() if active_response.is_success else []
+
+    async def refresh_registry(self, force: bool = False):
+        await profile_registry.refresh_async(self.fetch_profiles, force=force)
+
+    async def wait_for_state(self, uuid: str, running: bool, timeout: float | None = None) -> bool:
+        """Опрашивает Octo с экспоненциальной паузой, пока профиль не остановится
+        (running=False) или не запустится с ws_endpoint (running=True)
+
+        Returns:
+            True, если состояние достигнуто, False - по истечении timeout (OCTO_READY_TIMEOUT)
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.OCTO_READY_TIMEOUT)
+        for delay in backoff_delays():
+            await self.refresh_registry(force=True)
+            if profile_registry.reached(uuid, running):
+                return True
+            if time.monotonic() + delay > deadline:
+                print(f"⚠️ Profile {uuid} did not become {'ready' if running else 'stopped'} in time")
+                return False
+            await asyncio.sleep(delay)
+
+    async def get_running_profiles(self) -> list[dict]:
+        await self.refresh_registry()
+        return profile_registry.running()
+
+    async def get_active_profile(self, uuid: str) -> dict | None:
+        """Запущенный профиль с ws_endpoint из реестра или None"""
+        await self.refresh_registry()
+        profile = profile_registry.get(uuid)
+        if profile and profile.get('status') == 'running' and profile.get('ws_endpoint'):
+            return profile
+        return None
+
+    async def force_restart_profile(self, uuid: str, max_attempts: int = 3):
+        for attempt in range(max_attempts):
+            print(f"Attempt {attempt + 1} to restart profile {uuid}")
+
+            await self.stop_profile(uuid)
+            if not await self.wait_for_state(uuid, running=False):
+                # Обычная остановка не сработала - останавливаем принудительно
+                await self.force_stop_profile(uuid)
+                await self.wait_for_state(uuid, running=False)
+
+            try:
+                response_data = await self.start_profile(uuid)
+                print(f"Successfully restarted profile {uuid}")
+                return response_data
             except Exception as e:
                 print(f"Restart attempt {attempt + 1} failed: {e}")
                 if attempt == max_attempts - 1:
                     raise
-                time.sleep(5)
-        
+
         raise Exception(f"Failed to restart profile {uuid} after {max_attempts} attempts")
 
 
+# Один AsyncOctoClient (и пул соединений) на event loop: httpx-клиент нельзя делить между циклами
+_async_octo_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOctoClient]" = weakref.WeakKeyDictionary()
+
+
+def async_octo_client() -> AsyncOctoClient:
+    """Общий AsyncOctoClient текущего event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_octo_clients.get(loop)
+    if client is None:
+        client = _async_octo_clients[loop] = AsyncOctoClient.init_from_settings()
+    return client
+
+
+async def close_async_octo_client():
+    """Закрывает пул соединений AsyncOctoClient текущего event loop"""
+    client = _async_octo_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class WarmProfile:
+    """Запущенный профиль Octo с открытым CDP-подключением"""
+
+    def __init__(self, uuid: str, ws_endpoint: str, browser: Browser):
+        self.uuid = uuid
+        self.ws_endpoint = ws_endpoint
+        self.browser = browser
+        self.in_use = True
+        self.idle_since: float | None = None  # time.monotonic() освобождения
+
+
+class ProfilePool:
+    """Пул теплых профилей: после задачи профиль не останавливается
+
+    Браузер профиля вместе с CDP-подключением ждет следующую задачу этого
+    профиля до idle_ttl секунд, так что подряд идущие задачи одной модели не
+    платят за запуск браузера. Простаивающие дольше idle_ttl профили
+    останавливает reap_idle, лишние сверх max_idle - сразу, начиная с
+    самого давнего. idle_ttl=0 - профиль останавливается после каждой задачи.
+    Пул, как и AsyncOctoClient, принадлежит одному event loop.
+    """
+
+    def __init__(self, octo: AsyncOctoClient, idle_ttl: float | None = None, max_idle: int | None = None):
+        self.octo = octo
+        self.idle_ttl = idle_ttl if idle_ttl is not None else settings.OCTO_PROFILE_IDLE_TTL
+        self.max_idle = max_idle if max_idle is not None else settings.OCTO_PROFILE_POOL_SIZE
+        self.profiles: dict[str, WarmProfile] = {}
+        self._playwright = None
+
+    async def acquire(self, uuid: str) -> WarmProfile | None:
+        """Теплый профиль с живым подключением или None (тогда профиль нужно запустить)"""
+        warm = self.profiles.get(uuid)
+        if warm is None or warm.in_use:
+            return None
+        if not warm.browser.is_connected() or profile_registry.is_running(uuid) is False:
+            # Профиль остановили снаружи (Stop в интерфейсе, перезапуск Octo)
+            print(f"⚠️ Warm profile {uuid} is gone, starting it again")
+            await self._close(warm, stop=False)
+            return None
+        warm.in_use = True
+        warm.idle_since = None
+        print(f"♻️ Reusing warm profile {uuid}")
+        return warm
+
+    async def connect(self, uuid: str, ws_endpoint: str) -> WarmProfile:
+        """Подключается к только что запущенному профилю и отдает его задаче"""
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        browser = await self._playwright.chromium.connect_over_cdp(ws_endpoint)
+        warm = self.profiles[uuid] = WarmProfile(uuid, ws_endpoint, browser)
+        return warm
+
+    async def release(self, warm: WarmProfile, keep: bool = True):
+        """Возвращает профиль в пул; keep=False - задача упала, подключение закрываем
+
+        Упавший профиль не останавливаем (как и раньше): следующий запуск
+        все равно начнется с force_stop.
+        """
+        warm.in_use = False
+        if keep and self.idle_ttl > 0 and warm.browser.is_connected():
+            warm.idle_since = time.monotonic()
+            await self._evict_overflow()
+            return
+        await self._close(warm, stop=keep)
+
+    async def reap_idle(self) -> int:
+        """Останавливает профили, простаивающие дольше idle_ttl"""
+        now = time.monotonic()
+        expired = self._detach([
+            warm for warm in self.profiles.values()
+            if not warm.in_use and now - warm.idle_since >= self.idle_ttl
+        ])
+        for warm in expired:
+            print(f"💤 Stopping idle profile {warm.uuid}")
+            await self._close(warm, stop=True)
+        return len(expired)
+
+    async def _evict_overflow(self):
+        idle = sorted((warm for warm in self.profiles.values() if not warm.in_use), key=lambda warm: warm.idle_since)
+        for warm in self._detach(idle[:max(0, len(idle) - self.max_idle)]):
+            print(f"💤 Warm pool is full, stopping profile {warm.uuid}")
+            await self._close(warm, stop=True)
+
+    def _detach(self, profiles: list[WarmProfile]) -> list[WarmProfile]:
+        """Убирает профили из пула до первого await
+
+        Пока закрывается один профиль, задача может взять через acquire
+        другой из того же списка - поэтому из пула они убираются все сразу,
+        а закрываются уже отсоединенные.
+        """
+        for warm in profiles:
+            if self.profiles.get(warm.uuid) is warm:
+                del self.profiles[warm.uuid]
+        return profiles
+
+    async def _close(self, warm: WarmProfile, stop: bool):
+        self._detach([warm])
+        try:
+            await warm.browser.close()
+        except Exception as e:
+            print(f"Error closing browser connection of profile {warm.uuid}: {e}")
+        if stop:
+            try:
+                await self.octo.stop_profile(warm.uuid)
+            except Exception as e:
+                print(f"Error stopping profile {warm.uuid}: {e}")
+
+    async def close(self):
+        """Останавливает все профили пула и драйвер Playwright"""
+        for warm in list(self.profiles.values()):
+            await self._close(warm, stop=True)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+_profile_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ProfilePool]" = weakref.WeakKeyDictionary()
+
+
+def profile_pool() -> ProfilePool:
+    """Пул теплых профилей текущего event loop"""
+    loop = asyncio.get_running_loop()
+    pool = _profile_pools.get(loop)
+    if pool is None:
+        pool = _profile_pools[loop] = ProfilePool(async_octo_client())
+    return pool
+
+
+async def close_profile_pool():
+    """Останавливает теплые профили текущего event loop (вызывать до close_async_octo_client)"""
+    pool = _profile_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+async def open_warm_profile(parser) -> tuple[WarmProfile | None, dict | None]:
+    """Теплый профиль из пула или запуск профиля парсера с подключением по CDP
+
+    Returns:
+        (профиль, None) или (None, результат для run() - ошибка запуска или отмена)
+    """
+    pool = profile_pool()
+    warm = await pool.acquire(parser.profile_uuid)
+    if warm is not None:
+        return warm, None
+
+    try:
+        response_data = await parser.octo.start_profile(parser.profile_uuid)
+    except OctoProfileAlreadyStartedException:
+        print("Profile already started, using existing profile")
+        try:
+            response_data = await parser.octo.get_active_profile(parser.profile_uuid)
+            if response_data is None:
+                response_data = await parser.octo.force_restart_profile(parser.profile_uuid)
+        except Exception as e:
+            print(f"Error getting active profile info: {e}")
+            try:
+                response_data = await parser.octo.force_restart_profile(parser.profile_uuid)
+            except Exception as restart_error:
+                print(f"Force restart failed: {restart_error}")
+                return None, {'status': 'error', 'message': f'Failed to get profile: {str(e)}'}
+    except OctoProfileStartException as e:
+        error_message = e.args[0]
+        print(f"Profile start error: {error_message}")
+        # Проверяем, не была ли запрошена остановка
+        if parser.stop_requested:
+            return None, {'status': 'cancelled', 'message': 'Parser stopped by user'}
+        return None, {'status': 'error', 'message': 'Failed to start profile'}
+
+    if not response_data:
+        if parser.stop_requested:
+            return None, {'status': 'cancelled', 'message': 'Parser stopped by user'}
+        return None, {'status': 'error', 'message': 'Failed to start profile'}
+
+    # Проверяем флаг остановки перед подключением
+    if parser.stop_requested:
+        print("🛑 Stop requested before connecting, stopping profile...")
+        try:
+            await parser.octo.stop_profile(parser.profile_uuid)
+        except Exception:
+            pass
+        return None, {'status': 'cancelled', 'message': 'Parser stopped by user'}
+
+    try:
+        ws_endpoint = response_data['ws_endpoint'].replace('127.0.0.1', 'octo')
+        return await pool.connect(parser.profile_uuid, ws_endpoint), None
+    except BaseException as e:
+        # Профиль запущен, но в пул не попал: без остановки он остался бы работать без владельца
+        try:
+            await parser.octo.stop_profile(parser.profile_uuid)
+        except Exception as stop_error:
+            print(f"Error stopping profile {parser.profile_uuid} after failed connect: {stop_error}")
+        if not isinstance(e, Exception):
+            raise  # Отмена задачи
+        print(f"Error connecting to profile browser: {e}")
+        return None, {'status': 'error', 'message': f'Failed to connect to profile: {str(e)}'}
+
+
 class OctoAPIClient:
     """Client for Octo Browser REST API"""
     
@@ -240,34 +857,545 @@ class OctoAPIClient:
         return resp_data.get('data', [])
 
 
-class ChatParser:
+# Расширения файлов по типам ресурсов: блокировка идет по URL, чтобы запросы
+# документа, скриптов и XHR не проходили через Python
+RESOURCE_TYPE_EXTENSIONS = {
+    'image': ('jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp'),
+    'media': ('mp4', 'webm', 'mov', 'm4v', 'm3u8', 'mp3', 'm4a', 'ogg', 'wav'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+}
+
+
+class ResourceBlockPolicy:
+    """Блокировка тяжелых ресурсов и трекеров на странице парсера
+
+    Картинки, видео, шрифты (по расширению в URL) и запросы к трекерам
+    блокирует сам браузер через CDP Network.setBlockedURLs: остальные
+    запросы не перехватываются и идут мимо Python с обычным HTTP-кешем.
+    Без CDP-сессии - page.route только на узкие шаблоны этих же URL.
     """
-    Парсер для полного сбора сообщений из чата OnlyFans
+
+    def __init__(self, resource_types: list[str], blocked_domains: list[str]):
+        self.extensions = []
+        for resource_type in resource_types:
+            extensions = RESOURCE_TYPE_EXTENSIONS.get(resource_type)
+            if extensions is None:
+                print(f"⚠️ Unknown resource type to block: {resource_type}")
+                continue
+            self.extensions.extend(extensions)
+        self.blocked_domains = [domain.lower() for domain in blocked_domains]
+
+    @classmethod
+    def from_settings(cls):
+        """Политика из настроек или None, если блокировка выключена"""
+        if not settings.PARSER_BLOCK_RESOURCES:
+            return None
+        return cls(settings.PARSER_BLOCKED_RESOURCE_TYPES, settings.PARSER_BLOCKED_DOMAINS)
+
+    def blocked_urls(self) -> list[str]:
+        """Шаблоны для Network.setBlockedURLs (* - любые символы)"""
+        patterns = [f"*.{ext}" for ext in self.extensions] + [f"*.{ext}?*" for ext in self.extensions]
+        for domain in self.blocked_domains:
+            patterns += [f"*://{domain}/*", f"*.{domain}/*"]
+        return patterns
+
+    def route_globs(self) -> list[str]:
+        """Те же шаблоны в glob-синтаксисе page.route"""
+        globs = [f"**/*.{ext}" for ext in self.extensions] + [f"**/*.{ext}?*" for ext in self.extensions]
+        for domain in self.blocked_domains:
+            globs += [f"*://{domain}/**", f"*://*.{domain}/**"]
+        return globs
+
+    async def apply(self, page: Page):
+        try:
+            cdp = await page.context.new_cdp_session(page)
+            await cdp.send("Network.enable")
+            await cdp.send("Network.setBlockedURLs", {"urls": self.blocked_urls()})
+            return
+        except Exception as e:
+            print(f"⚠️ CDP resource blocking unavailable, using page.route: {e}")
+        for glob in self.route_globs():
+            await page.route(glob, lambda route: route.abort())
+
+
+# Режимы сбора сообщений (PARSER_EXTRACTION_MODE)
+EXTRACTION_MODES = ('observer', 'dom', 'api')
+
+# Общие скрипты сбора сообщений со страницы чата. __EXTRACTOR__ заменяется на
+# функцию платформы (messageEl) => данные сообщения | null (см. MESSAGE_EXTRACTOR_JS)
+DOM_EXTRACT_ALL_JS = """
+    (selector) => {
+        const extract = __EXTRACTOR__;
+        const messagesData = [];
+        document.querySelectorAll(selector).forEach((messageEl) => {
+            try {
+                const data = extract(messageEl);
+                if (data) messagesData.push(data);
+            } catch (e) {
+                console.error('Error parsing message:', e);
+            }
+        });
+        return messagesData;
+    }
+"""
+
+# Инкрементальный сбор: MutationObserver разбирает только вставленные узлы сообщений
+# и складывает их в очередь на странице, Python забирает из нее только дельту
+DOM_CAPTURE_INSTALL_JS = """
+    (selector) => {
+        if (window.__aisexterCapture) return false;
+        const extract = __EXTRACTOR__;
+        // Узел -> хэш последних отданных данных: тот же узел с новым содержимым
+        // (дорисованное время, перерисовка, правка текста) отдается снова
+        const state = { queue: [], captured: new WeakMap() };
+        const hash = (text) => {
+            let h = 5381;
+            for (let i = 0; i < text.length; i++) h = ((h << 5) + h + text.charCodeAt(i)) | 0;
+            return h;
+        };
+        const capture = (messageEl) => {
+            try {
+                const data = extract(messageEl);
+                // Узел без контента не помечаем - он попадет в очередь после отрисовки
+                if (!data) return;
+                const key = hash(JSON.stringify(data));
+                if (state.captured.get(messageEl) === key) return;
+                state.captured.set(messageEl, key);
+                state.queue.push(data);
+            } catch (e) {
+                console.error('Error parsing message:', e);
+            }
+        };
+        document.querySelectorAll(selector).forEach(capture);
+        state.observer = new MutationObserver((mutations) => {
+            for (const mutation of mutations) {
+                const nodes = mutation.type === 'characterData' ? [mutation.target] : mutation.addedNodes;
+                for (const node of nodes) {
+                    const el = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+                    if (!el) continue;
+                    const messageEl = el.closest(selector);
+                    if (messageEl) capture(messageEl);
+                    if (node.nodeType === Node.ELEMENT_NODE) {
+                        node.querySelectorAll(selector).forEach(capture);
+                    }
+                }
+            }
+        });
+        state.observer.observe(document.body, { childList: true, subtree: true, characterData: true });
+        window.__aisexterCapture = state;
+        return true;
+    }
+"""
+
+DOM_CAPTURE_DRAIN_JS = """
+    () => window.__aisexterCapture ? window.__aisexterCapture.queue.splice(0) : null
+"""
+
+# GET к API OnlyFans через HTTP-клиент самого приложения (axios из модулей webpack):
+# его перехватчики подписывают запрос (sign/time зависят от пути и параметров).
+# Клиент ищется один раз и запоминается на странице
+ONLYFANS_API_GET_JS = """
+    async ({ path, params }) => {
+        let client = window.__aisexterApiClient;
+        if (!client) {
+            const chunkKey = Object.keys(window).find((key) => key.startsWith('webpackChunk'));
+            if (!chunkKey) return { error: 'webpack runtime not found' };
+            let require = null;
+            window[chunkKey].push([[Symbol('aisexter')], {}, (r) => { require = r; }]);
+            if (!require || !require.c) return { error: 'webpack module cache not found' };
+            const isClient = (value) => value && typeof value.get === 'function' && value.defaults
+                && value.interceptors && value.interceptors.request
+                && (value.interceptors.request.handlers || []).length > 0;
+            for (const module of Object.values(require.c)) {
+                const exports = module && module.exports;
+                if (!exports || (typeof exports !== 'object' && typeof exports !== 'function')) continue;
+                try {
+                    client = [exports, exports.default, ...Object.values(exports)].find(isClient);
+                } catch (e) {
+                    continue;
+                }
+                if (client) break;
+            }
+            if (!client) return { error: 'app API client not found' };
+            window.__aisexterApiClient = client;
+        }
+        try {
+            const base = (client.defaults.baseURL || '').replace(/\\/$/, '');
+            const url = base.endsWith('/api2/v2') ? path : '/api2/v2/' + path;
+            const response = await client.get(url, { params });
+            return { status: response.status, data: response.data };
+        } catch (e) {
+            return { error: String((e && e.message) || e), status: e && e.response ? e.response.status : null };
+        }
+    }
+"""
+
+# GET к API Fansly из вкладки (куки сессии) с заголовками запроса самого приложения;
+# fansly-client-ts - время запроса, поэтому обновляется для каждого повтора
+FANSLY_API_GET_JS = """
+    async ({ url, headers }) => {
+        try {
+            const response = await fetch(url, {
+                headers: { ...headers, 'fansly-client-ts': String(Date.now()) },
+                credentials: 'include',
+            });
+            if (!response.ok) return { status: response.status, error: response.statusText || 'HTTP error' };
+            return { status: response.status, data: await response.json() };
+        } catch (e) {
+            return { error: String((e && e.message) || e) };
+        }
+    }
+"""
+
+# Переход в другой чат роутером приложения (Vue у OnlyFans, Angular у Fansly слушают popstate).
+# Наблюдатель прошлого чата снимаем: его очередь относится к другому чату
+SPA_NAVIGATE_JS = """
+    (url) => {
+        if (window.__aisexterCapture) {
+            window.__aisexterCapture.observer.disconnect();
+            delete window.__aisexterCapture;
+        }
+        history.pushState({}, '', url);
+        window.dispatchEvent(new PopStateEvent('popstate', { state: {} }));
+    }
+"""
+
+
+async def navigate_in_app(page: Page, chat_url: str, message_selector: str, timeout: float = 10000) -> bool:
+    """Переход в чат без перезагрузки страницы и повторной загрузки приложения
+
+    Returns:
+        False, если вкладка открыта не на сайте чата или новый чат не отрисовался -
+        тогда нужен обычный page.goto
     """
+    target = urlsplit(chat_url)
+    if urlsplit(page.url).netloc != target.netloc:
+        return False
+    try:
+        previous = await page.query_selector(message_selector)
+        await page.evaluate(SPA_NAVIGATE_JS, chat_url)
+        await page.wait_for_function("path => location.pathname === path", arg=target.path, timeout=timeout)
+        if previous is not None:
+            # Сообщения прошлого чата должны смениться сообщениями нового
+            await page.wait_for_function("el => !el.isConnected", arg=previous, timeout=timeout)
+        return True
+    except Exception as e:
+        print(f"In-app navigation failed: {e}, loading the page")
+        return False
+
+
+class AdaptiveLoadTimer:
+    """Адаптивный таймаут ожидания подгрузки сообщений
+
+    Хранит экспоненциальное скользящее среднее задержек последних подгрузок
+    и ждет не дольше factor * среднее (в пределах minimum..maximum секунд),
+    поэтому на быстрых чатах пустые итерации прокрутки стоят доли секунды.
+    """
+
+    def __init__(self, initial: float = 2.0, minimum: float = 1.0, maximum: float = 10.0,
+                 factor: float = 3.0, alpha: float = 0.3):
+        self.average = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.alpha = alpha
+
+    @property
+    def timeout(self) -> float:
+        return min(self.maximum, max(self.minimum, self.average * self.factor))
+
+    def record(self, latency: float):
+        self.average = self.alpha * latency + (1 - self.alpha) * self.average
+
+
+_WRITER_STOP = object()
+
+
+class MessageWriter:
+    """Фоновая запись собранных сообщений в БД
+
+    Сбор кладет записи в ограниченную очередь и сразу продолжает прокрутку,
+    задача-писатель сбрасывает их пачками по batch_size или раз в
+    flush_interval секунд. Когда БД не успевает, очередь заполняется и put
+    ждет - сбор притормаживает вместо роста памяти. close() дописывает все,
+    что осталось в очереди.
+
+    Пачку, которая не записалась, писатель повторяет до max_retries раз
+    (не забирая новые записи из очереди), затем делит пополам, пока не
+    отделит строки, которые не записываются, - они отбрасываются и
+    учитываются в failed. close() в этом случае поднимает MessageSaveError.
+    """
+
+    def __init__(self, save, batch_size: int | None = None, flush_interval: float | None = None,
+                 max_queue: int | None = None, max_retries: int | None = None):
+        self.save = save  # Асинхронная запись пачки list[dict]
+        self.batch_size = batch_size or settings.PARSER_WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.PARSER_WRITER_FLUSH_INTERVAL
+        self.max_retries = max_retries or settings.PARSER_WRITER_MAX_RETRIES
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue or settings.PARSER_WRITER_QUEUE_SIZE)
+        self.pending: list[dict] = []  # Забрано из очереди, но еще не записано
+        self.task: asyncio.Task | None = None
+        self.failed: int = 0  # Сколько сообщений отброшено из-за ошибок записи
+        self.last_error: str = ''
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def put(self, message: dict):
+        if self.task is None or self.task.done():
+            # Писатель не запущен или упал - не блокируемся, close() допишет
+            self.pending.append(message)
+            return
+        await self.queue.put(message)
+
+    async def _run(self):
+        deadline = None  # Время принудительной записи неполной пачки
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is _WRITER_STOP:
+                await self._flush()
+                return
+            if item is not None:
+                self.pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if len(self.pending) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                await self._flush()
+                deadline = None
+
+    async def _flush(self):
+        # Пока пачка пишется (с повторами), очередь не читается - put ждет
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            print(f"💾 Saving batch: {len(batch)} messages ({self.queue.qsize()} more queued)")
+            await self._write(batch, self.max_retries)
+
+    async def _write(self, batch: list[dict], attempts: int):
+        """Записывает пачку, при ошибках повторяет и делит пополам до отдельных строк"""
+        delays = backoff_delays(settings.PARSER_WRITER_RETRY_DELAY, settings.PARSER_WRITER_RETRY_DELAY * 8)
+        for attempt in range(1, attempts + 1):
+            try:
+                await self.save(batch)
+                return
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Error saving batch of {len(batch)} (attempt {attempt}/{attempts}): {e}")
+            if attempt < attempts:
+                await asyncio.sleep(next(delays))
+        if len(batch) == 1:
+            self.failed += 1
+            print(f"❌ Message dropped after failed save: {str(batch[0])[:200]}")
+            return
+        # Половины пишем по одной попытке: повторы уже не помогли, ищем плохие строки
+        middle = len(batch) // 2
+        await self._write(batch[:middle], 1)
+        await self._write(batch[middle:], 1)
+
+    async def close(self):
+        """Дописывает очередь и останавливает писателя (при завершении, остановке или сбое сбора)
+
+        Raises:
+            MessageSaveError: часть сообщений не удалось записать
+        """
+        if self.task is not None and not self.task.done():
+            await self.queue.put(_WRITER_STOP)
+            await self.task
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _WRITER_STOP:
+                self.pending.append(item)
+        await self._flush()
+        if self.failed:
+            raise MessageSaveError(f"{self.failed} messages were not saved: {self.last_error}")
+
+
+class ParseCheckpoint:
+    """Точка продолжения полного парсинга
+
+    Уже сохраненный диапазон истории чата: курсор API (минимальный id на
+    платформе) и время самого старого и самого нового сохраненного сообщения.
+    Повторный запуск выгружает из API сообщения новее диапазона (пришедшие
+    после прерывания) и продолжает с курсора вглубь истории; при прокрутке UI
+    сообщения внутри диапазона не собираются повторно.
+    """
+
+    def __init__(self, api_cursor: int | None = None, oldest_timestamp: datetime.datetime | None = None,
+                 newest_timestamp: datetime.datetime | None = None):
+        self.api_cursor = api_cursor
+        self.oldest_timestamp = oldest_timestamp
+        self.newest_timestamp = newest_timestamp
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> 'ParseCheckpoint':
+        data = data or {}
+        oldest = data.get('oldest_timestamp')
+        newest = data.get('newest_timestamp')
+        return cls(
+            api_cursor=data.get('api_cursor'),
+            oldest_timestamp=datetime.datetime.fromisoformat(oldest) if oldest else None,
+            newest_timestamp=datetime.datetime.fromisoformat(newest) if newest else None,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'api_cursor': self.api_cursor,
+            'oldest_timestamp': self.oldest_timestamp.isoformat() if self.oldest_timestamp else None,
+            'newest_timestamp': self.newest_timestamp.isoformat() if self.newest_timestamp else None,
+        }
+
+    @staticmethod
+    def _aware(timestamp: datetime.datetime) -> datetime.datetime:
+        return timezone.make_aware(timestamp) if timezone.is_naive(timestamp) else timestamp
+
+    def advance(self, platform_message_id, timestamp):
+        """Учитывает сохраненное сообщение (timestamp - распарсенное время без fallback)"""
+        if platform_message_id and str(platform_message_id).isdigit():
+            message_id = int(platform_message_id)
+            self.api_cursor = message_id if self.api_cursor is None else min(self.api_cursor, message_id)
+        if isinstance(timestamp, datetime.datetime):
+            timestamp = self._aware(timestamp)
+            if self.oldest_timestamp is None or timestamp < self.oldest_timestamp:
+                self.oldest_timestamp = timestamp
+            if self.newest_timestamp is None or timestamp > self.newest_timestamp:
+                self.newest_timestamp = timestamp
+
+    def covers(self, timestamp) -> bool:
+        """Сообщение внутри сохраненного диапазона - уже выгружено прерванным запуском
+
+        Границы не входят: сообщения той же минуты, что и крайние сохраненные,
+        собираются снова (повтор отбросит запись в базу). Checkpoint без
+        newest_timestamp (старый формат) ограничен только снизу.
+        """
+        if self.oldest_timestamp is None or not isinstance(timestamp, datetime.datetime):
+            return False
+        timestamp = self._aware(timestamp)
+        if self.newest_timestamp is not None and timestamp >= self.newest_timestamp:
+            return False
+        return timestamp > self.oldest_timestamp
+
+
+async def wait_for_messages_load(page: Page, selector: str, count_before: int, is_messages_response,
+                                 timer: AdaptiveLoadTimer, grace: float = 1.0) -> bool:
+    """Ожидание подгрузки новых сообщений после прокрутки
+
+    Возвращается, как только число узлов сообщений выросло. Если ответ API сообщений
+    пришел, а DOM за grace секунд не изменился - подгружать больше нечего.
+    Задержка успешной подгрузки обновляет timer.
+
+    Returns:
+        True, если сообщения подгрузились
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    timeout_ms = timer.timeout * 1000
+    count_task = asyncio.ensure_future(page.wait_for_function(
+        "([selector, count]) => document.querySelectorAll(selector).length > count",
+        arg=[selector, count_before],
+        timeout=timeout_ms,
+        polling=100,
+    ))
+    response_task = asyncio.ensure_future(page.wait_for_event(
+        "response", predicate=is_messages_response, timeout=timeout_ms
+    ))
+    try:
+        done, _ = await asyncio.wait({count_task, response_task}, return_when=asyncio.FIRST_COMPLETED)
+        if count_task not in done and response_task.exception() is None:
+            # Ответ пришел - даем странице отрисовать сообщения
+            await asyncio.wait({count_task}, timeout=grace)
+        loaded = count_task.done() and count_task.exception() is None
+        if loaded:
+            timer.record(loop.time() - started)
+        return loaded
+    finally:
+        for task in (count_task, response_task):
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(count_task, response_task, return_exceptions=True)
+
+
+class BaseChatParser:
+    """Общая часть парсеров чатов: запуск профиля, фоновая запись, checkpoint и дедупликация
+
+    Платформа задает MESSAGE_SELECTOR и MESSAGE_EXTRACTOR_JS (сбор из DOM),
+    handle_response/_process_message (ответы API), _parse_date и navigate
+    (прокрутка своего контейнера сообщений).
+    """
+    
+    PLATFORM = ''  # Название платформы для логов
+    CONTAINER_SELECTOR = ''  # Контейнер сообщений: его появление значит, что чат открылся
+    MAX_IDLE_SCROLLS = 5  # Прокрутки подряд без новых сообщений, после которых история считается загруженной
+    MESSAGE_SELECTOR = ''
+    MESSAGE_EXTRACTOR_JS = ''
+    DOM_EXTRACT_ALL_SCRIPT = ''
+    DOM_CAPTURE_INSTALL_SCRIPT = ''
     
-    def __init__(self, profile_uuid: str, chat_url: str, update_only: bool = False):
+    def __init__(self, profile_uuid: str, chat_url: str, update_only: bool = False, extraction_mode: str | None = None,
+                 checkpoint: dict | None = None):
         self.profile_uuid = profile_uuid
         self.chat_url = chat_url
         self.messages: list[dict] = []
         self.scroll_count: int = 0
         self.max_scrolls: int = 50
         self.model_user_id = None
-        self.octo = OctoClient.init_from_settings()
-        self.last_saved_count: int = 0
-        self.save_batch_size: int = 100
+        self.octo: AsyncOctoClient | None = None  # Общий клиент event loop, в котором запущен run()
+        self.last_queued_count: int = 0  # Сколько из self.messages уже передано на запись
+        self.writer: MessageWriter | None = None  # Фоновая запись, запускается с первым сообщением
         self.stop_requested: bool = False  # Флаг для остановки парсинга по запросу
+        self.spa_navigation: bool = False  # Открывать чат роутером SPA в уже загруженной вкладке (пакетная задача)
         self.update_only: bool = update_only  # Режим только обновления (без полной прокрутки)
+        # Режим сбора: 'observer' - только новые узлы через MutationObserver, 'dom' - полный проход по DOM,
+        # 'api' - постраничная выгрузка из API сообщений (при отказе API - прокрутка в режиме observer)
+        self.extraction_mode: str = extraction_mode or settings.PARSER_EXTRACTION_MODE
+        if self.extraction_mode not in EXTRACTION_MODES:
+            print(f"⚠️ Unknown extraction mode {self.extraction_mode!r}, using 'observer'")
+            self.extraction_mode = 'observer'
+        self.load_timer = AdaptiveLoadTimer()  # Таймаут подгрузки по недавним задержкам
+        self.resource_policy = ResourceBlockPolicy.from_settings()  # None - грузить все ресурсы страницы
+        self.history_exhausted: bool = False  # API сообщил, что более старых сообщений нет
+        self.ingest_stats: dict = {'inserted': 0, 'skipped': 0}  # Итоги записи в FullChatMessage
+        self.seen_fingerprints: set[str] = set()  # Индекс уже собранных сообщений для дедупликации за O(1)
+        self.seen_message_ids: set[str] = set()  # id на платформе уже собранных сообщений из API
+        # High-water mark режима обновления: новейшие сохраненные сообщения чата,
+        # встретив любое из них, дальше в историю не идем
+        self.known_fingerprints: set[str] = set()
+        self.known_message_ids: set[str] = set()
+        self.reached_known: bool = False
+        # Checkpoint прерванного полного парсинга: продолжаем с него, уже сохраненную историю пропускаем
+        self.resume_from = ParseCheckpoint() if update_only else ParseCheckpoint.from_dict(checkpoint)
+        self.saved_checkpoint = ParseCheckpoint.from_dict(self.resume_from.to_dict())  # Обновляется после каждой записи
+        self.api_cursor: int | None = None  # id самого старого сообщения, полученного из API в текущем проходе
+        self.reached_saved: bool = False  # Встретилось сообщение из диапазона checkpoint
+        # model_id и model_name из ModelInfo по profile_uuid, заполняются в load_state
+        self.model_id: str | None = None
+        self.model_name: str | None = None
+        self.backfill: bool = False  # Первичный парсинг чата без сохраненных сообщений: запись через COPY
+        self.page_timezone: datetime.tzinfo | None = None  # Часовой пояс браузера: в нем показано время в DOM
+    
+    async def load_state(self):
+        """Данные парсера из БД: модель профиля, high-water mark режима обновления
+        и режим первичной загрузки (backfill)
         
-        # Получаем model_id и model_name из ModelInfo по profile_uuid
+        Читаются асинхронно перед парсингом, а не в __init__: создание
+        парсера не обращается к базе и не блокирует event loop.
+        """
         try:
-            model_info = ModelInfo.objects.filter(model_octo_profile=profile_uuid).first()
-            self.model_id = model_info.model_id if model_info else None
-            self.model_name = model_info.model_name if model_info else None
-            print(f"🔍 Found model_id: {self.model_id}, model_name: {self.model_name} for profile {profile_uuid}")
+            self.model_id, self.model_name = await aload_model_info(self.profile_uuid)
+            print(f"🔍 Found model_id: {self.model_id}, model_name: {self.model_name} for profile {self.profile_uuid}")
         except Exception as e:
             print(f"⚠️ Error getting model_id: {e}")
             self.model_id = None
             self.model_name = None
+        if self.update_only:
+            self.known_fingerprints, self.known_message_ids = await aload_high_water_mark(self.chat_url)
+        elif settings.PARSER_BACKFILL_COPY:
+            saved_fingerprints, saved_ids = await aload_high_water_mark(self.chat_url, window=1)
+            self.backfill = not saved_fingerprints and not saved_ids
+            if self.backfill:
+                print(f"📥 First parse of {self.chat_url}: backfill via COPY")
     
     async def run(self):
         """Основной метод запуска парсера"""
@@ -276,117 +1404,723 @@ class ChatParser:
             print("🛑 Stop requested before starting, aborting...")
             return {'status': 'cancelled', 'message': 'Parser stopped by user'}
         
+        await self.load_state()
+        self.octo = async_octo_client()
+        pool = profile_pool()
+        # Профиль, оставшийся теплым после прошлой задачи, берем вместе с подключением
+        warm, error = await open_warm_profile(self)
+        if error is not None:
+            return error
+        
+        parsing_successful = False
+        keep_profile = False
         try:
-            response_data = self.octo.start_profile(self.profile_uuid)
-        except OctoProfileAlreadyStartedException:
-            print("Profile already started, using existing profile")
-            try:
-                profiles_response = requests.get(
-                    f"{self.octo.base_local_url}/api/profiles/active",
-                    timeout=10
-                )
-                if profiles_response.ok:
-                    active_profiles = profiles_response.json()
-                    for profile in active_profiles:
-                        if profile.get('uuid') == self.profile_uuid:
-                            response_data = profile
-                            break
-                    else:
-                        response_data = await sync_to_async(self.octo.force_restart_profile)(self.profile_uuid)
-                else:
-                    response_data = await sync_to_async(self.octo.force_restart_profile)(self.profile_uuid)
-            except Exception as e:
-                print(f"Error getting active profile info: {e}")
-                try:
-                    response_data = await sync_to_async(self.octo.force_restart_profile)(self.profile_uuid)
-                except Exception as restart_error:
-                    print(f"Force restart failed: {restart_error}")
-                    return {'status': 'error', 'message': f'Failed to get profile: {str(e)}'}
-                
-        except OctoProfileStartException as e:
-            error_message = e.args[0]
-            print(f"Profile start error: {error_message}")
-            # Проверяем, не была ли запрошена остановка
+            await self.parse(warm.browser)
+            parsing_successful = True
+        except MessageSaveError as e:
+            # Браузер в порядке - профиль остается теплым, но задача завершается ошибкой
+            keep_profile = True
+            print(f"❌ {e}")
+            return {'status': 'error', 'message': str(e), **self.ingest_stats}
+        except LoginPageException:
+            print("Login page detected - session may have expired")
             if self.stop_requested:
                 return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            return {'status': 'error', 'message': 'Failed to start profile'}
-
-        if not response_data:
-            # Проверяем флаг остановки
+            return {'status': 'error', 'message': 'Login page detected'}
+        except Exception as e:
+            # Если была запрошена остановка, не считаем это ошибкой
             if self.stop_requested:
+                print("🛑 Stop requested during parsing")
                 return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            return {'status': 'error', 'message': 'Failed to start profile'}
+            print(f"Error during parsing: {e}")
+            return {'status': 'error', 'message': f'Parsing error: {str(e)}'}
+        finally:
+            # После успешной задачи профиль остается теплым для следующей задачи этого профиля
+            await pool.release(warm, keep=parsing_successful or keep_profile)
+        
+        if parsing_successful:
+            print(f"✅ {self.PLATFORM} parsing completed. Collected {len(self.messages)} messages.")
 
-        # Проверяем флаг остановки перед подключением
+        return {'status': 'ok' if parsing_successful else 'error', **self.ingest_stats}
+    
+    async def check_if_login_page(self, page: Page) -> bool:
+        """Проверка, является ли страница страницей логина"""
+        try:
+            login_indicators = [
+                'input[type="email"]',
+                'input[type="password"]',
+                'button[type="submit"]',
+                '.login-form',
+                '#login',
+                '[data-testid="login"]'
+            ]
+            
+            for selector in login_indicators:
+                if await page.query_selector(selector):
+                    return True
+            
+            current_url = page.url
+            if 'login' in current_url.lower() or 'signin' in current_url.lower():
+                return True
+                
+            return False
+        except Exception as e:
+            print(f"Error checking login page: {e}")
+            return False
+    
+    @staticmethod
+    def _is_messages_response(response: Response) -> bool:
+        """Ответ API со страницей сообщений чата"""
+        raise NotImplementedError
+    
+    def handle_request(self, request: Request):
+        """Запрос вкладки (платформа может запомнить заголовки запросов самого приложения)"""
+        pass
+    
+    async def handle_response(self, response: Response):
+        """Обработка ответа API платформы (сообщения чата)"""
+        raise NotImplementedError
+    
+    def _parse_date(self, date_str):
+        """Время сообщения из API или DOM платформы"""
+        raise NotImplementedError
+    
+    async def _fetch_api_page(self, page: Page, cursor: int | None) -> tuple[list, bool] | None:
+        """Страница истории из API сообщений, запрошенная изнутри вкладки
+
+        Returns:
+            (сообщения API от новых к старым, есть ли более старые) или None, если API недоступен
+        """
+        return None
+    
+    async def _paginate_api(self, page: Page) -> bool:
+        """Постраничная выгрузка истории чата из API сообщений платформы
+        
+        Курсор - id самого старого полученного сообщения, выгрузка идет, пока
+        API отдает более старые сообщения (в режиме обновления - до уже
+        сохраненных). Сообщения идут в тот же конвейер записи, что и при прокрутке.
+        
+        Returns:
+            True, если история выгружена; False, если API недоступен и нужно прокручивать UI
+        """
+        pages = 0
+        while not self.stop_requested:
+            result = await self._fetch_api_page(page, self.api_cursor)
+            if result is None:
+                if pages:
+                    # Выгрузка оборвалась посередине: досчитываем прокруткой, checkpoint уже у курсора
+                    print(f"⚠️ API mode: {self.PLATFORM} API failed after {pages} page(s), falling back to scrolling")
+                return False
+            page_messages, has_more = result
+            for message in page_messages:
+                await self._process_message(message)
+                if self.reached_known or self.reached_saved:
+                    # Дальше в странице только более старые, уже сохраненные сообщения
+                    break
+                message_id = message.get('id')
+                if message_id and str(message_id).isdigit():
+                    message_id = int(message_id)
+                    self.api_cursor = message_id if self.api_cursor is None else min(self.api_cursor, message_id)
+            pages += 1
+            print(f"📥 {self.PLATFORM} API page {pages}: {len(page_messages)} messages "
+                  f"(collected {len(self.messages)}, cursor {self.api_cursor})")
+            
+            await self._save_messages_batch()
+            
+            if self.reached_known:
+                print(f"📥 API mode: reached known {self.PLATFORM} messages after {pages} page(s)")
+                break
+            if self.reached_saved:
+                print(f"📥 API mode: reached the checkpoint range after {pages} page(s)")
+                break
+            if not has_more or not page_messages:
+                self.history_exhausted = True
+                break
+        
+        return True
+    
+    async def _load_history_via_api(self, page: Page) -> bool:
+        """История чата из API; продолжение прерванного парсинга - в два прохода
+        
+        Сначала от новейшего сообщения до сохраненного диапазона (сообщения,
+        пришедшие после прерывания), затем с курсора checkpoint вглубь истории:
+        уже выгруженную часть повторно не запрашиваем.
+        """
+        self.api_cursor = None
+        if self.resume_from.api_cursor is None:
+            return await self._paginate_api(page)
+        print(f"⏩ Resuming from checkpoint: new messages first, then from API cursor {self.resume_from.api_cursor}")
+        if not await self._paginate_api(page):
+            return False
+        self.reached_saved = False
+        self.history_exhausted = False
+        self.api_cursor = self.resume_from.api_cursor
+        return await self._paginate_api(page)
+    
+    async def _prepare_scroll(self, page: Page):
+        """Подготовка к прокрутке истории (поиск контейнера и т.п.)"""
+    
+    async def _scroll_to_top(self, page: Page):
+        """Первая прокрутка контейнера сообщений к началу"""
+        raise NotImplementedError
+    
+    async def _scroll_up(self, page: Page) -> dict:
+        """Очередная прокрутка вверх; at_top в ответе - контейнер уже в самом верху"""
+        raise NotImplementedError
+    
+    async def navigate(self, page: Page):
+        """Навигация по чату с прокруткой контейнера сообщений"""
+        await self._open_chat(page)
+        await self._detect_page_timezone(page)
+        
+        if await self.check_if_login_page(page):
+            print("Warning: Login page indicators detected, but continuing...")
+        
+        try:
+            await page.wait_for_selector(self.CONTAINER_SELECTOR, timeout=10000)
+            print(f"✅ {self.PLATFORM} chat messages container loaded")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not find {self.PLATFORM} messages container: {e}")
+            if await self.check_if_login_page(page):
+                print("Confirmed: Login page detected (no messages container)")
+                raise LoginPageException()
+        
+        # Режим API: выгружаем историю запросами, без прокрутки UI
+        # (в режиме обновления - только до уже сохраненных сообщений).
+        # Прерванный парсинг с курсором API продолжаем запросами в любом режиме
+        if self.extraction_mode == 'api' or self.resume_from.api_cursor is not None:
+            if await self._load_history_via_api(page):
+                print(f"📊 Total messages collected: {len(self.messages)}")
+                await self._save_messages_batch()
+                return
+            if self.extraction_mode == 'api':
+                self.extraction_mode = 'observer'
+        if self.resume_from.oldest_timestamp is not None:
+            print(f"⏩ Resuming from checkpoint: skipping saved messages from {self.resume_from.oldest_timestamp} "
+                  f"to {self.resume_from.newest_timestamp or 'now'}")
+        
+        if self.extraction_mode == 'observer':
+            await self._install_capture(page)
+        
+        # Режим обновления: собираем видимые сообщения и прокручиваем вверх,
+        # только пока не встретим уже сохраненное сообщение
+        if self.update_only:
+            print(f"🔄 Update mode: scrolling back to {len(self.known_fingerprints)} known messages")
+            await page.wait_for_timeout(2 * 1000)  # Ждем загрузки текущих сообщений
+            await self._collect_messages(page)
+            if self.reached_known:
+                print(f"📊 Reached known messages without scrolling. Total messages collected: {len(self.messages)}")
+                await self._save_messages_batch()
+                return
+        
+        await self._scroll_history(page)
+        
+        # Финальный сбор сообщений
+        await self._collect_messages(page)
+        
+        print(f"📊 Total messages collected: {len(self.messages)}")
+        
+        await self._save_messages_batch()
+    
+    async def _count_messages(self, page: Page) -> int:
+        return await page.evaluate(
+            "(selector) => document.querySelectorAll(selector).length", self.MESSAGE_SELECTOR
+        )
+    
+    async def _scroll_history(self, page: Page):
+        """Прокрутка к началу чата (в режиме обновления - до уже сохраненных сообщений)"""
+        scroll_attempts = 0
+        no_new_content_count = 0
+        
+        await self._prepare_scroll(page)
+        
+        # Делаем первый скролл вверх, чтобы дойти до начала
+        initial_count = await self._count_messages(page)
+        await self._scroll_to_top(page)
+        await wait_for_messages_load(
+            page, self.MESSAGE_SELECTOR, initial_count, self._is_messages_response, self.load_timer
+        )
+        
+        while not self.stop_requested:
+            scroll_attempts += 1
+            print(f"📜 Scrolling {self.PLATFORM} chat... attempt {scroll_attempts} (collected {len(self.messages)} messages so far)")
+            
+            messages_before = await self._count_messages(page)
+            scroll_info = await self._scroll_up(page)
+            
+            # Ждем ответа API или появления новых узлов, но не дольше адаптивного таймаута
+            await wait_for_messages_load(
+                page, self.MESSAGE_SELECTOR, messages_before, self._is_messages_response, self.load_timer
+            )
+            
+            messages_after = await self._count_messages(page)
+            print(f"📊 Messages in DOM: before={messages_before}, after={messages_after}")
+            
+            if scroll_info.get('at_top'):
+                no_new_content_count += 1
+            
+            if messages_after == messages_before:
+                no_new_content_count += 1
+                print(f"⏸️ No new messages loaded (count: {no_new_content_count}/{self.MAX_IDLE_SCROLLS}, "
+                      f"wait {self.load_timer.timeout:.1f}s)")
+                
+                if no_new_content_count >= self.MAX_IDLE_SCROLLS or self.history_exhausted:
+                    print(f"✅ Reached the beginning of the {self.PLATFORM} chat! Total scrolls: {scroll_attempts}")
+                    print(f"📝 Total messages in DOM: {messages_after}")
+                    break
+            else:
+                no_new_content_count = 0
+                print(f"✨ Loaded {messages_after - messages_before} new messages, continuing...")
+                
+                # Наблюдатель отдает только дельту, поэтому забираем ее на каждой итерации;
+                # полный проход по DOM - раз в 10 прокруток (в режиме обновления - каждый раз,
+                # чтобы не прокрутить дальше уже сохраненных сообщений)
+                if self.extraction_mode == 'observer' or self.update_only or scroll_attempts % 10 == 0:
+                    await self._collect_messages(page)
+                    await self._save_messages_batch()
+                    if self.reached_known:
+                        print(f"✅ Reached known messages after {scroll_attempts} scrolls")
+                        break
+        
         if self.stop_requested:
-            print("🛑 Stop requested before connecting, stopping profile...")
+            print(f"🛑 Parsing stopped by user after {scroll_attempts} attempts")
+        else:
+            print(f"✅ Finished scrolling after {scroll_attempts} attempts")
+    
+    async def _open_chat(self, page: Page):
+        """Открывает чат во вкладке: роутером SPA в пакетной задаче или загрузкой страницы"""
+        print(f"🎯 Navigating to {self.PLATFORM} chat: {self.chat_url}")
+        # В пакетной задаче приложение уже загружено во вкладке - переходим в чат его роутером
+        if self.spa_navigation and await navigate_in_app(page, self.chat_url, self.MESSAGE_SELECTOR):
+            return
+        try:
+            # Используем domcontentloaded вместо load для более быстрой загрузки
+            # и добавляем timeout для избежания бесконечного ожидания
+            await page.goto(self.chat_url, wait_until="domcontentloaded", timeout=60000)
+        except Exception as e:
+            # Если не удалось загрузить, пробуем еще раз с более мягкими параметрами
+            print(f"First navigation attempt failed: {e}, retrying with networkidle...")
             try:
-                self.octo.stop_profile(self.profile_uuid)
-            except:
-                pass
-            return {'status': 'cancelled', 'message': 'Parser stopped by user'}
+                await page.goto(self.chat_url, wait_until="networkidle", timeout=90000)
+                await page.wait_for_timeout(3 * 1000)
+            except Exception as retry_error:
+                print(f"Navigation retry also failed: {retry_error}")
+                # Не поднимаем исключение сразу - возможно страница все же загрузилась частично
+                await page.wait_for_timeout(3 * 1000)
+    
+    async def _detect_page_timezone(self, page: Page):
+        """Часовой пояс браузера профиля: время сообщений в DOM показано в нем, а не в поясе сервера"""
+        if self.page_timezone is not None:
+            return
+        try:
+            name = await page.evaluate("() => Intl.DateTimeFormat().resolvedOptions().timeZone")
+            self.page_timezone = zoneinfo.ZoneInfo(name)
+        except Exception as e:
+            print(f"⚠️ Could not detect {self.PLATFORM} page timezone, using server time: {e}")
+    
+    def _page_now(self) -> datetime.datetime:
+        """Текущее время браузера без пояса (для дат DOM вида 'Yesterday 11:05 pm')"""
+        if self.page_timezone is None:
+            return datetime.datetime.now()
+        return datetime.datetime.now(self.page_timezone).replace(tzinfo=None)
+    
+    async def _install_capture(self, page: Page):
+        """Установка MutationObserver, который копит на странице только новые сообщения"""
+        try:
+            await page.evaluate(self.DOM_CAPTURE_INSTALL_SCRIPT, self.MESSAGE_SELECTOR)
+        except Exception as e:
+            print(f"❌ Error installing {self.PLATFORM} message observer: {e}")
+    
+    async def _drain_captured_messages(self, page: Page):
+        """Забирает со страницы только сообщения, накопленные наблюдателем с прошлого вызова"""
+        try:
+            messages_data = await page.evaluate(DOM_CAPTURE_DRAIN_JS)
+            if messages_data is None:
+                # Страница перезагрузилась и потеряла наблюдатель - ставим его заново
+                await self._install_capture(page)
+                messages_data = await page.evaluate(DOM_CAPTURE_DRAIN_JS) or []
+            
+            new_count = 0
+            for message_data in messages_data:
+                if self._remember_message(message_data):
+                    new_count += 1
+            if new_count:
+                print(f"✅ Collected {new_count} new {self.PLATFORM} messages from observer (total: {len(self.messages)})")
+        except Exception as e:
+            print(f"❌ Error draining captured {self.PLATFORM} messages: {e}")
+    
+    async def _collect_messages(self, page: Page):
+        """Сбор сообщений в выбранном режиме (дельта наблюдателя или полный проход по DOM)"""
+        if self.extraction_mode == 'observer':
+            await self._drain_captured_messages(page)
+        else:
+            await self._collect_messages_from_dom(page)
+    
+    async def _collect_messages_from_dom(self, page: Page):
+        """Сбор сообщений полным проходом по DOM"""
+        try:
+            messages_data = await page.evaluate(self.DOM_EXTRACT_ALL_SCRIPT, self.MESSAGE_SELECTOR)
+            
+            for message_data in messages_data:
+                if self._remember_message(message_data):
+                    user_id_info = f"(user_id: {message_data['from_user_id']})" if message_data['from_user_id'] else "(no user_id)"
+                    print(f"✅ Collected {self.PLATFORM} message from {message_data['from_username']} {user_id_info}: "
+                          f"{message_data['message_text'][:50]}...")
+            
+            print(f"📊 Total messages collected from {self.PLATFORM} DOM: {len(messages_data)}")
+            
+        except Exception as e:
+            print(f"❌ Error collecting messages from {self.PLATFORM} DOM: {e}")
+    
+    async def parse(self, browser: Browser):
+        """Основной метод парсинга (подключенный браузер профиля выдает ProfilePool)"""
+        page = None
+        try:
+            if self.stop_requested:
+                print("🛑 Stop requested before opening page, aborting...")
+                return
 
-        ws_endpoint = response_data['ws_endpoint'].replace('127.0.0.1', 'octo')
+            context = browser.contexts[0]
+            page = await context.new_page()
+            if self.resource_policy is not None:
+                await self.resource_policy.apply(page)
+            
+            await self.parse_page(page)
+            
+        except Exception as e:
+            # Если была запрошена остановка, не поднимаем исключение
+            if self.stop_requested:
+                print("🛑 Stop requested, parsing aborted")
+                return
+            print(f"❌ Error during {self.PLATFORM} parsing: {e}")
+            raise
+        finally:
+            if page is not None:
+                await page.close()
+            
+            try:
+                await self.finish_saving()
+            except MessageSaveError:
+                raise
+            except Exception as e:
+                print(f"❌ Error in final save: {e}")
+    
+    async def parse_page(self, page: Page, router: "ResponseRouter | None" = None):
+        """Парсинг чата в уже открытой вкладке (пакетная задача открывает в ней все чаты по очереди)
+
+        С router ответы вкладки приходят от общего обработчика контекста, без него
+        парсер подписывается на события самой вкладки.
+        """
+        if router is None:
+            page.on("request", self.handle_request)
+            page.on("response", self._on_response)
+        try:
+            if self.stop_requested:
+                print("🛑 Stop requested before navigation, aborting...")
+                return
+            await self.navigate(page)
+        finally:
+            if router is None:
+                # Вкладка переходит к следующему чату - его запросы этому парсеру не нужны
+                page.remove_listener("request", self.handle_request)
+                page.remove_listener("response", self._on_response)
+    
+    def _on_response(self, response: Response):
+        asyncio.create_task(self.handle_response(response))
+    
+    def checkpoint(self) -> dict:
+        """Checkpoint по уже сохраненным сообщениям (для продолжения после сбоя или остановки)"""
+        return self.saved_checkpoint.to_dict()
+    
+    async def _save_messages_batch(self):
+        """Передает новые собранные сообщения фоновой записи (ждет, только если запись отстает)"""
+        new_messages = self.messages[self.last_queued_count:]
+        if not new_messages:
+            return
+        if self.writer is None:
+            if self.backfill:
+                # Большие пачки: COPY выгоден на тысячах строк
+                self.writer = MessageWriter(
+                    self._save_messages,
+                    batch_size=settings.PARSER_BACKFILL_BATCH_SIZE,
+                    flush_interval=settings.PARSER_BACKFILL_FLUSH_INTERVAL,
+                )
+            else:
+                self.writer = MessageWriter(self._save_messages)
+            self.writer.start()
+        self.last_queued_count = len(self.messages)
+        for message_data in new_messages:
+            await self.writer.put(message_data)
+    
+    async def finish_saving(self):
+        """Передает остаток и дожидается записи всей очереди
+        
+        Raises:
+            MessageSaveError: часть сообщений не записана (checkpoint остался до них)
+        """
+        await self._save_messages_batch()
+        if self.writer is not None:
+            try:
+                await self.writer.close()
+            finally:
+                self.writer = None
+    
+    def _message_identity(self, message_data: dict) -> tuple:
+        """user_id, нормализованное время и fingerprint сообщения (одни и те же для API и DOM)
+        
+        Время и fingerprint считаются один раз и запоминаются в message_data:
+        дедупликация в памяти и запись в базу используют один и тот же ключ, даже
+        если относительная дата DOM ('7:21 pm') к записи указывала бы на другой день.
+        """
+        # Определяем user_id:
+        # - Если сообщение от модели → используем model_name
+        # - Если от пользователя → используем from_user_id
+        if message_data.get('is_from_model', False):
+            user_id = self.model_name if self.model_name else 'Model'
+        else:
+            user_id = message_data.get('from_user_id', '') or ''
+        if 'fingerprint' in message_data:
+            return user_id, message_data['timestamp'], message_data['fingerprint']
+        
+        # Парсим timestamp из message_date (время сообщения, а не время парсинга)
+        timestamp = None
+        if message_data.get('message_date'):
+            # Если message_date уже datetime объект - используем его
+            if isinstance(message_data['message_date'], datetime.datetime):
+                timestamp = message_data['message_date']
+            else:
+                # Пытаемся распарсить строку (может быть "9 pm", "Oct 31, 2025 02:37" и т.д.)
+                timestamp = self._parse_date(str(message_data['message_date']))
+        # Время из DOM без пояса показано в поясе браузера
+        if timestamp is not None and timezone.is_naive(timestamp) and self.page_timezone is not None:
+            timestamp = timestamp.replace(tzinfo=self.page_timezone)
+        
+        # Fingerprint считаем до fallback, чтобы повторный парсинг давал тот же ключ
+        fingerprint = message_fingerprint(
+            self.chat_url, message_data.get('is_from_model', False), timestamp, message_data['message_text']
+        )
+        message_data['timestamp'], message_data['fingerprint'] = timestamp, fingerprint
+        return user_id, timestamp, fingerprint
+    
+    def _remember_message(self, message_data: dict) -> bool:
+        """Добавляет сообщение в self.messages, если его fingerprint или id на платформе еще не встречались
+        
+        Ключ тот же, что у записи в базу (_message_identity), поэтому сообщение,
+        пришедшее и из API, и из DOM, собирается один раз. Уже сохраненное сообщение из high-water mark не добавляется, а отмечает,
+        что новые сообщения закончились (self.reached_known). Сообщения, которые
+        сохранил прерванный запуск (новее checkpoint), пропускаются.
+        """
+        _, timestamp, fingerprint = self._message_identity(message_data)
+        message_id = message_data.get('platform_message_id')
+        if fingerprint in self.seen_fingerprints or (message_id and message_id in self.seen_message_ids):
+            return False
+        self.seen_fingerprints.add(fingerprint)
+        if message_id:
+            self.seen_message_ids.add(message_id)
+        if self.resume_from.covers(timestamp):
+            self.reached_saved = True
+            return False
+        if fingerprint in self.known_fingerprints or (message_id and message_id in self.known_message_ids):
+            self.reached_known = True
+            return False
+        self.messages.append(message_data)
+        return True
+    
+    def _fallback_timestamp(self) -> datetime.datetime:
+        """Время сообщения, дату которого не удалось распарсить"""
+        return datetime.datetime.now()
+    
+    def _build_full_message(self, message_data: dict) -> FullChatMessage:
+        """Преобразование собранного сообщения в несохраненный FullChatMessage"""
+        # is_from_model из данных сообщения (API или класс узла сообщения в DOM)
+        is_from_model = message_data.get('is_from_model', False)
+        user_id, timestamp, fingerprint = self._message_identity(message_data)
         
-        parsing_successful = False
-        try:
-            await self.parse(ws_endpoint)
-            parsing_successful = True
-        except LoginPageException:
-            print("Login page detected - session may have expired")
-            if self.stop_requested:
-                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            return {'status': 'error', 'message': 'Login page detected'}
-        except Exception as e:
-            # Если была запрошена остановка, не считаем это ошибкой
-            if self.stop_requested:
-                print("🛑 Stop requested during parsing")
-                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            print(f"Error during parsing: {e}")
-            return {'status': 'error', 'message': f'Parsing error: {str(e)}'}
+        # Если не удалось распарсить - используем fallback платформы
+        if timestamp is None:
+            timestamp = self._fallback_timestamp()
+            print(f"⚠️ Warning: Could not parse message_date '{message_data.get('message_date')}', using {timestamp} as fallback")
+        
+        return FullChatMessage(
+            user_id=user_id,
+            chat_url=self.chat_url,
+            is_from_model=is_from_model,
+            message=message_data['message_text'],
+            timestamp=timestamp,
+            is_paid=message_data.get('is_paid', False),
+            amount_paid=message_data.get('amount_paid', 0) or 0,
+            model_id=self.model_id,
+            fingerprint=fingerprint,
+            platform_message_id=message_data.get('platform_message_id')
+        )
+    
+    async def _save_messages(self, messages_to_save: list[dict]) -> dict:
+        """Сохранение списка сообщений (только в FullChatMessage) одной пачкой"""
+        if not self.model_id:
+            print(f"⚠️ Warning: model_id not found, skipping message save")
+            return {'inserted': 0, 'skipped': len(messages_to_save)}
         
-        if parsing_successful and len(self.messages) > 0:
-            print(f"✅ OnlyFans parsing completed. Collected {len(self.messages)} messages. Stopping profile.")
-            self.octo.stop_profile(self.profile_uuid)
+        rows = [self._build_full_message(message_data) for message_data in messages_to_save]
+        result = await (acopy_ingest_messages(rows) if self.backfill else aingest_messages(rows))
+        self.ingest_stats['inserted'] += result['inserted']
+        self.ingest_stats['skipped'] += result['skipped']
+        # После отброшенных строк checkpoint не двигаем: продолжение должно собрать их заново
+        if self.writer is not None and self.writer.failed:
+            return result
+        for message_data in messages_to_save:
+            self.saved_checkpoint.advance(message_data.get('platform_message_id'), self._message_identity(message_data)[1])
+        print(f"💾 Saved {result['inserted']} new {self.PLATFORM} messages to FullChatMessage with model_id: {self.model_id} "
+              f"(skipped {result['skipped']} duplicates)")
+        return result
+
 
-        return {'status': 'ok' if parsing_successful else 'error'}
+class ChatParser(BaseChatParser):
+    """
+    Парсер для полного сбора сообщений из чата OnlyFans
+    """
     
-    async def check_if_login_page(self, page: Page) -> bool:
-        """Проверка, является ли страница страницей логина"""
-        try:
-            login_indicators = [
-                'input[type="email"]',
-                'input[type="password"]',
-                'button[type="submit"]',
-                '.login-form',
-                '#login',
-                '[data-testid="login"]'
-            ]
+    PLATFORM = 'OnlyFans'
+    CONTAINER_SELECTOR = '.b-chat__messages'
+    API_PAGE_SIZE = 100
+    # Селектор узла сообщения и функция (messageEl) => данные сообщения | null для OnlyFans
+    MESSAGE_SELECTOR = '.b-chat__message'
+    MESSAGE_EXTRACTOR_JS = """
+        (messageEl) => {
+            const textEl = messageEl.querySelector('.b-chat__message__text');
+            const messageText = textEl ? textEl.textContent.trim() : '';
             
-            for selector in login_indicators:
-                if await page.query_selector(selector):
-                    return True
+            if (!messageText) return null;
             
-            current_url = page.url
-            if 'login' in current_url.lower() or 'signin' in current_url.lower():
-                return True
-                
-            return False
-        except Exception as e:
-            print(f"Error checking login page: {e}")
-            return False
-        
+            const isFromMe = messageEl.classList.contains('m-from-me');
+            const fromUsername = isFromMe ? 'Model' : 'User';
+            
+            // Ищем время сообщения - может быть в разных местах
+            let messageTime = '';
+            const timeEl = messageEl.querySelector('.b-chat__message__time span');
+            if (timeEl) {
+                messageTime = timeEl.textContent.trim();
+            }
+            
+            // Ищем информацию о платном сообщении и цене
+            // Обычно это текст типа "$8.88 not paid yet, 4:57 am" или "$8.88 not paid yet"
+            let isPaid = false;
+            let amountPaid = 0;
+            
+            // Ищем специальные элементы с информацией о платеже (обычно под текстом сообщения)
+            // Ищем все элементы внутри messageEl, которые могут содержать информацию о платеже
+            const allTextNodes = messageEl.innerText || messageEl.textContent || '';
+            
+            // Более точный паттерн: ищем "$XX.XX not paid" или "$XX.XX paid" или просто цену в формате "$XX.XX"
+            // который находится отдельно от основного текста сообщения
+            const paidMessagePattern = /\\$([\\d,]+(?:\\.\\d{2})?)\\s+(?:not\\s+)?paid/i;
+            const paidMatch = allTextNodes.match(paidMessagePattern);
+            
+            if (paidMatch) {
+                isPaid = true;
+                // Извлекаем цену, убирая запятые и символ доллара
+                const priceStr = paidMatch[1].replace(/,/g, '');
+                amountPaid = parseFloat(priceStr);
+            
+                // Если в тексте есть время, используем его вместо времени из timeEl
+                // Формат: "$8.88 not paid yet, 4:57 am"
+                const timePattern = /(\\d{1,2}:?\\d{0,2}\\s*(?:am|pm)|\\d{1,2}:\\d{2})/i;
+                const timeMatch = allTextNodes.match(timePattern);
+                if (timeMatch && !messageTime) {
+                    // Проверяем, что время не является частью основного текста сообщения
+                    const timeIndex = allTextNodes.indexOf(timeMatch[1]);
+                    const messageTextIndex = allTextNodes.indexOf(messageText);
+                    // Если время находится после текста сообщения, используем его
+                    if (timeIndex > messageTextIndex + messageText.length) {
+                        messageTime = timeMatch[1].trim();
+                    }
+                }
+            } else {
+                // Также проверяем паттерн только с ценой "$XX.XX" если он находится отдельно
+                const priceOnlyPattern = /\\$([\\d,]+(?:\\.\\d{2})?)/;
+                const priceMatch = allTextNodes.match(priceOnlyPattern);
+                if (priceMatch) {
+                    // Проверяем, что цена не является частью основного текста сообщения
+                    const priceIndex = allTextNodes.indexOf(priceMatch[0]);
+                    const messageTextIndex = allTextNodes.indexOf(messageText);
+                    // Если цена находится после текста сообщения или в отдельном блоке
+                    if (priceIndex > messageTextIndex + messageText.length || 
+                        !messageText.includes(priceMatch[0])) {
+                        isPaid = true;
+                        const priceStr = priceMatch[1].replace(/,/g, '');
+                        amountPaid = parseFloat(priceStr);
+                    }
+                }
+            }
+            
+            // Если время все еще не найдено, ищем в других местах
+            if (!messageTime) {
+                // Пробуем найти текст с временем в других селекторах
+                const allText = messageEl.innerText || messageEl.textContent || '';
+                const timePattern2 = /(\\d{1,2}:?\\d{0,2}\\s*(?:am|pm)|\\d{1,2}:\\d{2})/i;
+                const timeMatch2 = allText.match(timePattern2);
+                if (timeMatch2) {
+                    messageTime = timeMatch2[1].trim();
+                }
+            }
+            
+            const avatarEl = messageEl.querySelector('.g-avatar__placeholder');
+            const fromUserId = avatarEl ? avatarEl.textContent.trim() : '';
+            
+            return {
+                from_user_id: fromUserId,
+                from_username: fromUsername,
+                message_text: messageText,
+                message_date: messageTime,
+                is_from_model: isFromMe,
+                is_paid: isPaid,
+                amount_paid: amountPaid
+            };
+        }
+    """
+    DOM_EXTRACT_ALL_SCRIPT = DOM_EXTRACT_ALL_JS.replace('__EXTRACTOR__', MESSAGE_EXTRACTOR_JS)
+    DOM_CAPTURE_INSTALL_SCRIPT = DOM_CAPTURE_INSTALL_JS.replace('__EXTRACTOR__', MESSAGE_EXTRACTOR_JS)
+    
+    def __init__(self, profile_uuid: str, chat_url: str, update_only: bool = False, extraction_mode: str | None = None,
+                 checkpoint: dict | None = None):
+        super().__init__(profile_uuid, chat_url, update_only=update_only, extraction_mode=extraction_mode,
+                         checkpoint=checkpoint)
+        match = re.search(r'/chats/chat/(\d+)', chat_url)
+        self.chat_user_id: str | None = match.group(1) if match else None  # id собеседника из URL чата
+        self.model_user_id = self.profile_uuid
+    
+    @staticmethod
+    def _is_messages_response(response: Response) -> bool:
+        """Ответ API со страницей сообщений чата OnlyFans (/api2/v2/chats/{id}/messages)"""
+        parts = urlsplit(response.url)
+        return (
+            (parts.hostname or '').endswith("onlyfans.com")
+            and re.search(r'/api2/v2/chats/\d+/messages/?$', parts.path) is not None
+        )
+    
+    def _is_own_messages_response(self, response: Response) -> bool:
+        """Страница сообщений именно этого чата (id собеседника из URL чата)"""
+        return bool(self.chat_user_id) and re.search(
+            rf'/chats/{self.chat_user_id}/messages/?$', urlsplit(response.url).path
+        ) is not None
+    
     async def handle_response(self, response: Response):
         """Обработка ответов API для сбора сообщений OnlyFans"""
-        if "onlyfans.com/api2/v2/chats" in response.url and "/messages" in response.url:
-            if "application/json" in response.headers.get("content-type", ""):
-                try:
-                    json_body = await response.json()
-                    if 'list' in json_body:
-                        for message in json_body['list']:
-                            await self._process_message(message)
-                except Exception as e:
-                    print(f"Failed to parse OnlyFans messages: {e}")
+        if not self._is_messages_response(response):
+            return
+        # После перехода роутером SPA еще могут прийти ответы предыдущего чата:
+        # их сообщения и hasMore к этому чату не относятся
+        if self.chat_user_id and not self._is_own_messages_response(response):
+            return
+        if "application/json" in response.headers.get("content-type", ""):
+            try:
+                json_body = await response.json()
+                if 'list' in json_body:
+                    for message in json_body['list']:
+                        await self._process_message(message)
+                if json_body.get('hasMore') is False:
+                    self.history_exhausted = True
+            except Exception as e:
+                print(f"Failed to parse OnlyFans messages: {e}")
     
     async def _process_message(self, message: dict):
         """Обработка сообщения OnlyFans"""
@@ -395,7 +2129,11 @@ class ChatParser:
             from_user_id = from_user.get('id')
             from_username = from_user.get('username', '')
             
-            is_from_model = from_user_id == self.model_user_id
+            # В чате двое: всё, что отправил не собеседник из URL, отправила модель
+            if self.chat_user_id and from_user_id:
+                is_from_model = str(from_user_id) != self.chat_user_id
+            else:
+                is_from_model = from_user_id == self.model_user_id
             
             # Проверяем информацию о платном сообщении из API
             is_paid = False
@@ -413,18 +2151,22 @@ class ChatParser:
                 if not amount_paid and price:
                     amount_paid = float(price)
             
+            # Текст в API приходит с HTML-разметкой, в DOM - уже как textContent
+            message_text = html.unescape(re.sub(r'<[^>]+>', '', message.get('text') or '')).strip()
+            
             message_data = {
+                'platform_message_id': str(message['id']) if message.get('id') else None,
                 'from_user_id': str(from_user_id) if from_user_id else None,
                 'from_username': from_username,
-                'message_text': message.get('text', ''),
+                'message_text': message_text,
                 'message_date': self._parse_date(message.get('createdAt')),
                 'is_from_model': is_from_model,
                 'is_paid': is_paid,
                 'amount_paid': amount_paid
             }
             
-            self.messages.append(message_data)
-            print(f"Collected message from {from_username}: {message_data['message_text'][:50]}...")
+            if self._remember_message(message_data):
+                print(f"Collected message from {from_username}: {message_data['message_text'][:50]}...")
             
         except Exception as e:
             print(f"Error processing OnlyFans message: {e}")
@@ -503,7 +2245,7 @@ class ChatParser:
                     hour = 0
                 
                 # Создаем datetime с текущей датой и распарсенным временем
-                now = datetime.datetime.now()
+                now = self._page_now()
                 result = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
                 
                 # Если было "Yesterday", вычитаем один день
@@ -527,7 +2269,7 @@ class ChatParser:
                     hour = 0
                 
                 # Создаем datetime с текущей датой и распарсенным временем
-                now = datetime.datetime.now()
+                now = self._page_now()
                 result = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
                 
                 # Если было "Yesterday", вычитаем один день
@@ -541,56 +2283,31 @@ class ChatParser:
         # Если не получилось - возвращаем None (будет использовано текущее время как fallback)
         return None
     
-    async def navigate(self, page: Page, browser: Browser):
-        """Навигация по чату с прокруткой контейнера сообщений"""
-        print(f"Navigating to chat: {self.chat_url}")
-        try:
-            # Используем domcontentloaded вместо load для более быстрой загрузки
-            # и добавляем timeout для избежания бесконечного ожидания
-            await page.goto(self.chat_url, wait_until="domcontentloaded", timeout=60000)
-            await page.wait_for_timeout(5 * 1000)
-        except Exception as e:
-            # Если не удалось загрузить, пробуем еще раз с более мягкими параметрами
-            print(f"First navigation attempt failed: {e}, retrying with networkidle...")
-            try:
-                await page.goto(self.chat_url, wait_until="networkidle", timeout=90000)
-                await page.wait_for_timeout(3 * 1000)
-            except Exception as retry_error:
-                print(f"Navigation retry also failed: {retry_error}")
-                # Не поднимаем исключение сразу - возможно страница все же загрузилась частично
-                await page.wait_for_timeout(3 * 1000)
-        
-        if await self.check_if_login_page(page):
-            print("Warning: Login page indicators detected, but continuing...")
-        
-        self.model_user_id = self.profile_uuid
+    async def _fetch_api_page(self, page: Page, cursor: int | None) -> tuple[list, bool] | None:
+        """Страница истории через API-клиент самого приложения OnlyFans
         
+        Каждый запрос к API OnlyFans подписан (заголовки sign/time зависят от
+        пути и параметров), поэтому чужие заголовки повторить нельзя: запрос
+        отправляет клиент приложения, перехватчики которого его и подписывают.
+        """
+        if not self.chat_user_id:
+            print("⚠️ API mode: cannot get chat id from URL, falling back to scrolling")
+            return None
+        params = {'limit': self.API_PAGE_SIZE, 'order': 'desc', 'skip_users': 'all'}
+        if cursor is not None:
+            params['id'] = cursor
         try:
-            await page.wait_for_selector('.b-chat__messages', timeout=10000)
-            print("Chat messages container loaded")
+            result = await page.evaluate(ONLYFANS_API_GET_JS, {'path': f'chats/{self.chat_user_id}/messages', 'params': params})
         except Exception as e:
-            print(f"Warning: Could not find chat messages container: {e}")
-            if await self.check_if_login_page(page):
-                print("Confirmed: Login page detected (no messages container)")
-                await page.close()
-                await browser.close()
-                raise LoginPageException()
-        
-        # Если это режим обновления - собираем только текущие сообщения без прокрутки
-        if self.update_only:
-            print("🔄 Update mode: collecting current visible messages only")
-            await page.wait_for_timeout(2 * 1000)  # Ждем загрузки текущих сообщений
-            await self._collect_messages_from_dom(page)
-            print(f"Total messages collected: {len(self.messages)}")
-            if len(self.messages) > self.last_saved_count:
-                await self._save_messages_batch()
-            return
-        
-        # Обычный режим полного парсинга с прокруткой
-        scroll_attempts = 0
-        no_new_content_count = 0
-        
-        # Делаем первый скролл вверх, чтобы дойти до начала
+            print(f"⚠️ API mode: request failed: {e}")
+            return None
+        if result.get('error') or not isinstance(result.get('data'), dict):
+            print(f"⚠️ API mode: {result.get('status')} {result.get('error')}, falling back to scrolling")
+            return None
+        data = result['data']
+        return data.get('list') or [], bool(data.get('hasMore'))
+    
+    async def _scroll_to_top(self, page: Page):
         await page.evaluate("""
             () => {
                 const messagesContainer = document.querySelector('.b-chat__messages');
@@ -599,491 +2316,339 @@ class ChatParser:
                 }
             }
         """)
-        await page.wait_for_timeout(3 * 1000)
-        
-        while not self.stop_requested:
-            scroll_attempts += 1
-            print(f"Scrolling chat messages... attempt {scroll_attempts} (collected {len(self.messages)} messages so far)")
+    
+    async def _scroll_up(self, page: Page) -> dict:
+        """OnlyFans подгружает историю, когда контейнер прокручен в самый верх"""
+        await self._scroll_to_top(page)
+        return {}
+
+
+class ChatParserFansly(BaseChatParser):
+    """
+    Парсер для полного сбора сообщений из чата Fansly
+    """
+    
+    PLATFORM = 'Fansly'
+    # В Fansly сообщения находятся в app-group-message-collection
+    CONTAINER_SELECTOR = 'app-group-message-collection'
+    MAX_IDLE_SCROLLS = 3  # Меньше, чем у OnlyFans: верх контейнера проверяется по scrollTop
+    API_PAGE_SIZE = 50
+    # Заголовки запроса сообщений приложения, которые нужны для повтора: авторизация и
+    # fansly-client-* (fansly-client-check зависит только от пути, не от параметров запроса)
+    API_REPLAY_HEADERS = ('authorization', 'accept')
+    # Селектор узла сообщения и функция (messageEl) => данные сообщения | null для Fansly
+    MESSAGE_SELECTOR = 'app-group-message'
+    MESSAGE_EXTRACTOR_JS = """
+        (messageEl) => {
+            // Текст сообщения находится в .message-text
+            const textEl = messageEl.querySelector('.message-text');
+            let messageText = textEl ? textEl.textContent.trim() : '';
+            
+            // Проверяем наличие медиа контента
+            // Медиа может быть в самом сообщении или в родительских элементах
+            // Структура: message embed > message-attachment > app-group-message-attachment
+            const hasMediaInElement = messageEl.querySelector('.message-attachment') || 
+                                     messageEl.querySelector('message-attachment') ||
+                                     messageEl.querySelector('app-group-message-attachment');
+            
+            // Проверяем родительские элементы
+            const parentMessageEmbed = messageEl.closest('.message.embed');
+            const hasMediaInParent = parentMessageEmbed && (
+                parentMessageEmbed.querySelector('.message-attachment') ||
+                parentMessageEmbed.querySelector('message-attachment') ||
+                parentMessageEmbed.querySelector('app-group-message-attachment')
+            );
+            
+            const hasMedia = hasMediaInElement || hasMediaInParent;
+            
+            // Если нет текста, но есть медиа - используем "Media" и помечаем как платное
+            if (!messageText && hasMedia) {
+                messageText = 'Media';
+            }
+            
+            // Пропускаем сообщения без текста и без медиа
+            if (!messageText) return null;
             
-            messages_before = await page.evaluate("""
-                () => {
-                    const messages = document.querySelectorAll('.b-chat__message');
-                    return messages.length;
+            // Определяем, от кого сообщение (my-message = от модели)
+            const isFromModel = messageEl.classList.contains('my-message');
+            
+            // Ищем timestamp - время находится в span.margin-right-text внутри .timestamp
+            // .timestamp находится на уровне родителя, не внутри app-group-message
+            // Структура: <app-group-message-collection><div class="flex-row"><div class="flex-col width-100"><div><app-group-message>...</app-group-message></div><div class="timestamp"><span class="margin-right-text">...</span></div></div></div></app-group-message-collection>
+            let messageTime = '';
+            
+            // Метод 1: Ищем через closest в app-group-message-collection
+            const messageCollection = messageEl.closest('app-group-message-collection');
+            if (messageCollection && !messageTime) {
+                const timestampEl = messageCollection.querySelector('.timestamp');
+                if (timestampEl) {
+                    const timeSpan = timestampEl.querySelector('span.margin-right-text');
+                    if (timeSpan) {
+                        messageTime = timeSpan.textContent.trim();
+                    } else {
+                        messageTime = timestampEl.textContent.trim();
+                    }
                 }
-            """)
+            }
             
-            await page.evaluate("""
-                () => {
-                    const messagesContainer = document.querySelector('.b-chat__messages');
-                    if (messagesContainer) {
-                        messagesContainer.scrollTop = 0;
+            // Метод 2: Ищем через closest в flex-col.width-100 (контейнер сообщения)
+            if (!messageTime) {
+                const parentFlexCol = messageEl.closest('.flex-col.width-100');
+                if (parentFlexCol) {
+                    const timestampEl = parentFlexCol.querySelector('.timestamp');
+                    if (timestampEl) {
+                        const timeSpan = timestampEl.querySelector('span.margin-right-text');
+                        if (timeSpan) {
+                            messageTime = timeSpan.textContent.trim();
+                        } else {
+                            messageTime = timestampEl.textContent.trim();
+                        }
                     }
                 }
-            """)
+            }
             
-            # Увеличиваем таймаут, чтобы загрузились новые сообщения
-            await page.wait_for_timeout(5 * 1000)
+            // Метод 3: Пробуем найти через родительские элементы
+            if (!messageTime) {
+                let parent = messageEl.parentElement;
+                let attempts = 0;
+                while (parent && attempts < 5) {
+                    const timestampEl = parent.querySelector('.timestamp');
+                    if (timestampEl) {
+                        const timeSpan = timestampEl.querySelector('span.margin-right-text');
+                        if (timeSpan) {
+                            messageTime = timeSpan.textContent.trim();
+                        } else {
+                            messageTime = timestampEl.textContent.trim();
+                        }
+                        break;
+                    }
+                    parent = parent.parentElement;
+                    attempts++;
+                }
+            }
             
-            messages_after = await page.evaluate("""
-                () => {
-                    const messages = document.querySelectorAll('.b-chat__message');
-                    return messages.length;
+            // Метод 4: Последняя попытка - ищем в самом элементе (на случай другой структуры)
+            if (!messageTime) {
+                const timestampEl = messageEl.querySelector('.timestamp');
+                if (timestampEl) {
+                    const timeSpan = timestampEl.querySelector('span.margin-right-text');
+                    if (timeSpan) {
+                        messageTime = timeSpan.textContent.trim();
+                    } else {
+                        messageTime = timestampEl.textContent.trim();
+                    }
                 }
-            """)
+            }
             
-            print(f"Messages in DOM: before={messages_before}, after={messages_after}")
+            // Проверяем платное сообщение
+            // В Fansly весь контент делится на купленный и некупленный
+            // Бесплатно отправленный отображается по дефолту как купленный
+            // Нужно проверить наличие purchased-content или purchased-avatar (включая not-purchased)
+            let isPaid = false;
+            let amountPaid = 0;
             
-            if messages_after == messages_before:
-                no_new_content_count += 1
-                print(f"No new messages loaded (count: {no_new_content_count}/5)")
-                
-                if no_new_content_count >= 5:
-                    print(f"Reached the beginning of the chat! Total scrolls: {scroll_attempts}")
-                    print(f"Total messages in DOM: {messages_after}")
-                    break
-            else:
-                no_new_content_count = 0
-                print(f"Loaded {messages_after - messages_before} new messages, continuing...")
-                
-                if scroll_attempts % 10 == 0:
-                    await self._collect_messages_from_dom(page)
-                    if len(self.messages) - self.last_saved_count >= self.save_batch_size:
-                        await self._save_messages_batch()
-        
-        if self.stop_requested:
-            print(f"🛑 Parsing stopped by user after {scroll_attempts} attempts")
-        else:
-            print(f"Finished scrolling after {scroll_attempts} attempts")
-        
-        await self._collect_messages_from_dom(page)
-        
-        print(f"Total messages collected: {len(self.messages)}")
-        
-        if len(self.messages) > self.last_saved_count:
-            await self._save_messages_batch()
-    
-    async def _collect_messages_from_dom(self, page: Page):
-        """Сбор сообщений напрямую из DOM"""
-        try:
-            messages_data = await page.evaluate("""
-                () => {
-                    const messages = document.querySelectorAll('.b-chat__message');
-                    const messagesData = [];
-                    
-                    messages.forEach((messageEl, index) => {
-                        try {
-                            const textEl = messageEl.querySelector('.b-chat__message__text');
-                            const messageText = textEl ? textEl.textContent.trim() : '';
-                            
-                            if (!messageText) return;
-                            
-                            const isFromMe = messageEl.classList.contains('m-from-me');
-                            const fromUsername = isFromMe ? 'Model' : 'User';
-                            
-                            // Ищем время сообщения - может быть в разных местах
-                            let messageTime = '';
-                            const timeEl = messageEl.querySelector('.b-chat__message__time span');
-                            if (timeEl) {
-                                messageTime = timeEl.textContent.trim();
-                            }
-                            
-                            // Ищем информацию о платном сообщении и цене
-                            // Обычно это текст типа "$8.88 not paid yet, 4:57 am" или "$8.88 not paid yet"
-                            let isPaid = false;
-                            let amountPaid = 0;
-                            
-                            // Ищем специальные элементы с информацией о платеже (обычно под текстом сообщения)
-                            // Ищем все элементы внутри messageEl, которые могут содержать информацию о платеже
-                            const allTextNodes = messageEl.innerText || messageEl.textContent || '';
-                            
-                            // Более точный паттерн: ищем "$XX.XX not paid" или "$XX.XX paid" или просто цену в формате "$XX.XX"
-                            // который находится отдельно от основного текста сообщения
-                            const paidMessagePattern = /\\$([\\d,]+(?:\\.\\d{2})?)\\s+(?:not\\s+)?paid/i;
-                            const paidMatch = allTextNodes.match(paidMessagePattern);
-                            
-                            if (paidMatch) {
-                                isPaid = true;
-                                // Извлекаем цену, убирая запятые и символ доллара
-                                const priceStr = paidMatch[1].replace(/,/g, '');
-                                amountPaid = parseFloat(priceStr);
-                                
-                                // Если в тексте есть время, используем его вместо времени из timeEl
-                                // Формат: "$8.88 not paid yet, 4:57 am"
-                                const timePattern = /(\\d{1,2}:?\\d{0,2}\\s*(?:am|pm)|\\d{1,2}:\\d{2})/i;
-                                const timeMatch = allTextNodes.match(timePattern);
-                                if (timeMatch && !messageTime) {
-                                    // Проверяем, что время не является частью основного текста сообщения
-                                    const timeIndex = allTextNodes.indexOf(timeMatch[1]);
-                                    const messageTextIndex = allTextNodes.indexOf(messageText);
-                                    // Если время находится после текста сообщения, используем его
-                                    if (timeIndex > messageTextIndex + messageText.length) {
-                                        messageTime = timeMatch[1].trim();
-                                    }
-                                }
-                            } else {
-                                // Также проверяем паттерн только с ценой "$XX.XX" если он находится отдельно
-                                const priceOnlyPattern = /\\$([\\d,]+(?:\\.\\d{2})?)/;
-                                const priceMatch = allTextNodes.match(priceOnlyPattern);
-                                if (priceMatch) {
-                                    // Проверяем, что цена не является частью основного текста сообщения
-                                    const priceIndex = allTextNodes.indexOf(priceMatch[0]);
-                                    const messageTextIndex = allTextNodes.indexOf(messageText);
-                                    // Если цена находится после текста сообщения или в отдельном блоке
-                                    if (priceIndex > messageTextIndex + messageText.length || 
-                                        !messageText.includes(priceMatch[0])) {
-                                        isPaid = true;
-                                        const priceStr = priceMatch[1].replace(/,/g, '');
-                                        amountPaid = parseFloat(priceStr);
-                                    }
-                                }
-                            }
-                            
-                            // Если время все еще не найдено, ищем в других местах
-                            if (!messageTime) {
-                                // Пробуем найти текст с временем в других селекторах
-                                const allText = messageEl.innerText || messageEl.textContent || '';
-                                const timePattern2 = /(\\d{1,2}:?\\d{0,2}\\s*(?:am|pm)|\\d{1,2}:\\d{2})/i;
-                                const timeMatch2 = allText.match(timePattern2);
-                                if (timeMatch2) {
-                                    messageTime = timeMatch2[1].trim();
-                                }
-                            }
-                            
-                            const avatarEl = messageEl.querySelector('.g-avatar__placeholder');
-                            const fromUserId = avatarEl ? avatarEl.textContent.trim() : '';
-                            
-                            messagesData.push({
-                                from_user_id: fromUserId,
-                                from_username: fromUsername,
-                                message_text: messageText,
-                                message_date: messageTime,
-                                is_from_model: isFromMe,
-                                is_paid: isPaid,
-                                amount_paid: amountPaid
-                            });
-                        } catch (e) {
-                            console.error('Error parsing message:', e);
-                        }
-                    });
-                    
-                    return messagesData;
+            // Если сообщение содержит только медиа (messageText === 'Media'), оно всегда платное
+            if (messageText === 'Media') {
+                isPaid = true;
+            } else {
+                // Ищем purchased-content или purchased-avatar внутри сообщения или его attachment
+                const purchasedContent = messageEl.querySelector('.purchased-content');
+                const purchasedAvatar = messageEl.querySelector('.purchased-avatar');
+                const messageAttachment = messageEl.querySelector('message-attachment');
+            
+                // Если есть message-attachment, ищем внутри него
+                let attachmentPurchasedContent = null;
+                let attachmentPurchasedAvatar = null;
+                if (messageAttachment) {
+                    attachmentPurchasedContent = messageAttachment.querySelector('.purchased-content');
+                    attachmentPurchasedAvatar = messageAttachment.querySelector('.purchased-avatar');
                 }
-            """)
             
-            for message_data in messages_data:
-                if not any(msg['message_text'] == message_data['message_text'] and 
-                          msg['from_username'] == message_data['from_username'] 
-                          for msg in self.messages):
-                    self.messages.append(message_data)
-                    print(f"Collected DOM message from {message_data['from_username']}: {message_data['message_text'][:50]}...")
+                // Если найден любой из индикаторов платного контента - это платное сообщение
+                if (purchasedContent || purchasedAvatar || attachmentPurchasedContent || attachmentPurchasedAvatar) {
+                    isPaid = true;
+                    // Пытаемся найти цену
+                    const allText = messageEl.innerText || messageEl.textContent || '';
+                    const pricePattern = /\\$([\\d,]+(?:\\.\\d{2})?)/;
+                    const priceMatch = allText.match(pricePattern);
+                    if (priceMatch) {
+                        const priceStr = priceMatch[1].replace(/,/g, '');
+                        amountPaid = parseFloat(priceStr);
+                    }
+                }
+            }
             
-            print(f"Total messages collected from DOM: {len(messages_data)}")
+            // Извлекаем user ID из аватара (находится в родительском контейнере)
+            let fromUserId = '';
             
-        except Exception as e:
-            print(f"Error collecting messages from DOM: {e}")
-    
-    async def parse(self, ws_endpoint: str):
-        """Основной метод парсинга"""
-        async with async_playwright() as p:
-            page = None
-            browser = None
-            try:
-                # Проверяем флаг остановки перед подключением
-                if self.stop_requested:
-                    print("🛑 Stop requested before connecting, aborting...")
-                    return
-                    
-                browser = await p.chromium.connect_over_cdp(ws_endpoint)
-                context = browser.contexts[0]
-                page = await context.new_page()
-                
-                page.on("response", lambda response: asyncio.create_task(self.handle_response(response)))
-                
-                # Проверяем флаг остановки перед навигацией
-                if self.stop_requested:
-                    print("🛑 Stop requested before navigation, aborting...")
-                    return
-                
-                await self.navigate(page, browser)
-                
-            except Exception as e:
-                # Если была запрошена остановка, не поднимаем исключение
-                if self.stop_requested:
-                    print("🛑 Stop requested, parsing aborted")
-                    return
-                print(f"Error during parsing: {e}")
-                raise
-            finally:
-                if page is not None:
-                    await page.close()
-                if browser is not None:
-                    await browser.close()
-                
-                try:
-                    await sync_to_async(self.save_messages)()
-                except Exception as e:
-                    print(f"Error in final save: {e}")
-    
-    async def _save_messages_batch(self):
-        """Периодическое сохранение батча новых сообщений"""
-        new_messages = self.messages[self.last_saved_count:]
-        if not new_messages:
-            return
-        
-        print(f"💾 Saving batch: {len(new_messages)} new messages (total collected: {len(self.messages)})")
-        
-        try:
-            await sync_to_async(self._save_messages_sync)(new_messages)
-            self.last_saved_count = len(self.messages)
-            print(f"✅ Batch saved successfully! Total saved so far: {self.last_saved_count}")
-        except Exception as e:
-            print(f"❌ Error saving batch: {e}")
-    
-    def _save_messages_sync(self, messages_to_save: list[dict]):
-        """Синхронное сохранение списка сообщений OnlyFans (только в FullChatMessage)"""
-        saved_full_count = 0
-        
-        for message_data in messages_to_save:
-            try:
-                # Сохраняем только в FullChatMessage (без Profile и ChatMessage)
-                if self.model_id:
-                    # Определяем is_from_model из данных сообщения (парсили из DOM по классу m-from-me)
-                    is_from_model = message_data.get('is_from_model', False)
-                    
-                    # Определяем user_id:
-                    # - Если сообщение от модели → используем model_name
-                    # - Если от пользователя → используем from_user_id
-                    if is_from_model:
-                        user_id = self.model_name if self.model_name else 'Model'
-                    else:
-                        user_id = message_data.get('from_user_id', '')
-                    
-                    # Проверяем, не существует ли уже такое сообщение (по chat_url и message)
-                    existing_full = FullChatMessage.objects.filter(
-                        chat_url=self.chat_url,
-                        message=message_data['message_text'],
-                        model_id=self.model_id
-                    ).first()
-                    
-                    if not existing_full:
-                        # Парсим timestamp из message_date (время сообщения, а не время парсинга)
-                        timestamp = None
-                        if message_data.get('message_date'):
-                            # Если message_date уже datetime объект - используем его
-                            if isinstance(message_data['message_date'], datetime.datetime):
-                                timestamp = message_data['message_date']
-                            else:
-                                # Пытаемся распарсить строку (может быть "9 pm", "Oct 31, 2025 02:37" и т.д.)
-                                timestamp = self._parse_date(str(message_data['message_date']))
-                        
-                        # Если не удалось распарсить - используем текущее время как fallback
-                        if timestamp is None:
-                            print(f"⚠️ Warning: Could not parse message_date '{message_data.get('message_date')}', using current time as fallback")
-                            timestamp = datetime.datetime.now()
-                        
-                        # Получаем информацию о платном сообщении из message_data
-                        is_paid = message_data.get('is_paid', False)
-                        amount_paid = message_data.get('amount_paid', 0) or 0
-                        
-                        FullChatMessage.objects.create(
-                            user_id=user_id,
-                            chat_url=self.chat_url,
-                            is_from_model=is_from_model,
-                            message=message_data['message_text'],
-                            timestamp=timestamp,
-                            is_paid=is_paid,
-                            amount_paid=amount_paid,
-                            model_id=self.model_id
-                        )
-                        saved_full_count += 1
-                        
-                        # Логирование для отладки
-                        user_type = "model" if is_from_model else "user"
-                        print(f"💾 Saved message from {user_type}: user_id={user_id}")
-                else:
-                    print(f"⚠️ Warning: model_id not found, skipping message save")
-                        
-            except Exception as e:
-                print(f"Error saving message: {e}")
-        
-        if self.model_id:
-            print(f"💾 Saved {saved_full_count} new OnlyFans messages to FullChatMessage with model_id: {self.model_id}")
-    
-    def save_messages(self):
-        """Сохранение всех оставшихся сообщений в базу данных"""
-        new_messages = self.messages[self.last_saved_count:]
-        if new_messages:
-            print(f"💾 Final save: {len(new_messages)} remaining messages")
-            self._save_messages_sync(new_messages)
-            self.last_saved_count = len(self.messages)
-        else:
-            print("✅ All messages already saved during parsing")
-
-
-class ChatParserFansly:
-    """
-    Парсер для полного сбора сообщений из чата Fansly
-    """
-    
-    def __init__(self, profile_uuid: str, chat_url: str, update_only: bool = False):
-        self.profile_uuid = profile_uuid
-        self.chat_url = chat_url
-        self.messages: list[dict] = []
-        self.scroll_count: int = 0
-        self.max_scrolls: int = 50
-        self.model_user_id = None
-        self.octo = OctoClient.init_from_settings()
-        self.last_saved_count: int = 0
-        self.save_batch_size: int = 100
-        self.stop_requested: bool = False
-        self.update_only: bool = update_only
-        
-        # Получаем model_id и model_name из ModelInfo по profile_uuid
-        try:
-            model_info = ModelInfo.objects.filter(model_octo_profile=profile_uuid).first()
-            self.model_id = model_info.model_id if model_info else None
-            self.model_name = model_info.model_name if model_info else None
-            print(f"🔍 Found model_id: {self.model_id}, model_name: {self.model_name} for profile {profile_uuid}")
-        except Exception as e:
-            print(f"⚠️ Error getting model_id: {e}")
-            self.model_id = None
-            self.model_name = None
-    
-    async def run(self):
-        """Основной метод запуска парсера Fansly"""
-        if self.stop_requested:
-            print("🛑 Stop requested before starting, aborting...")
-            return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-        
-        try:
-            response_data = self.octo.start_profile(self.profile_uuid)
-        except OctoProfileAlreadyStartedException:
-            print("Profile already started, using existing profile")
-            try:
-                profiles_response = requests.get(
-                    f"{self.octo.base_local_url}/api/profiles/active",
-                    timeout=10
-                )
-                if profiles_response.ok:
-                    active_profiles = profiles_response.json()
-                    for profile in active_profiles:
-                        if profile.get('uuid') == self.profile_uuid:
-                            response_data = profile
-                            break
-                    else:
-                        response_data = await sync_to_async(self.octo.force_restart_profile)(self.profile_uuid)
-                else:
-                    response_data = await sync_to_async(self.octo.force_restart_profile)(self.profile_uuid)
-            except Exception as e:
-                print(f"Error getting active profile info: {e}")
-                try:
-                    response_data = await sync_to_async(self.octo.force_restart_profile)(self.profile_uuid)
-                except Exception as restart_error:
-                    print(f"Force restart failed: {restart_error}")
-                    return {'status': 'error', 'message': f'Failed to get profile: {str(e)}'}
-                
-        except OctoProfileStartException as e:
-            error_message = e.args[0]
-            print(f"Profile start error: {error_message}")
-            if self.stop_requested:
-                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            return {'status': 'error', 'message': 'Failed to start profile'}
-
-        if not response_data:
-            if self.stop_requested:
-                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            return {'status': 'error', 'message': 'Failed to start profile'}
-
-        if self.stop_requested:
-            print("🛑 Stop requested before connecting, stopping profile...")
-            try:
-                self.octo.stop_profile(self.profile_uuid)
-            except:
-                pass
-            return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-
-        ws_endpoint = response_data['ws_endpoint'].replace('127.0.0.1', 'octo')
+            // Аватар находится на уровень выше, ищем его в родительском контейнере
+            // Структура: <div class="flex-row"><app-account-avatar><a href="/username"></a></app-account-avatar><div><app-group-message>...</app-group-message></div></div>
+            const parentContainer = messageEl.parentElement?.parentElement?.parentElement;
+            if (parentContainer) {
+                const avatarEl = parentContainer.querySelector('app-account-avatar a[href]');
+                if (avatarEl) {
+                    const href = avatarEl.getAttribute('href');
+                    // Извлекаем username из href типа "/alan_90"
+                    fromUserId = href ? href.replace('/', '').trim() : '';
+                }
+            }
+            
+            // Если не нашли через родителя, пробуем поискать в ближайшем контейнере
+            if (!fromUserId) {
+                const closestRow = messageEl.closest('.flex-row');
+                if (closestRow) {
+                    const avatarEl = closestRow.querySelector('app-account-avatar a[href]');
+                    if (avatarEl) {
+                        const href = avatarEl.getAttribute('href');
+                        fromUserId = href ? href.replace('/', '').trim() : '';
+                    }
+                }
+            }
+            
+            // Используем fromUserId как username, если есть
+            const finalUsername = isFromModel ? 'Model' : (fromUserId || 'User');
+            
+            return {
+                from_user_id: fromUserId,
+                from_username: finalUsername,
+                message_text: messageText,
+                message_date: messageTime,
+                is_from_model: isFromModel,
+                is_paid: isPaid,
+                amount_paid: amountPaid
+            };
+        }
+    """
+    DOM_EXTRACT_ALL_SCRIPT = DOM_EXTRACT_ALL_JS.replace('__EXTRACTOR__', MESSAGE_EXTRACTOR_JS)
+    DOM_CAPTURE_INSTALL_SCRIPT = DOM_CAPTURE_INSTALL_JS.replace('__EXTRACTOR__', MESSAGE_EXTRACTOR_JS)
+    
+    def __init__(self, profile_uuid: str, chat_url: str, update_only: bool = False, extraction_mode: str | None = None,
+                 checkpoint: dict | None = None):
+        super().__init__(profile_uuid, chat_url, update_only=update_only, extraction_mode=extraction_mode,
+                         checkpoint=checkpoint)
+        match = re.search(r'/messages/(\d+)', chat_url)
+        self.chat_group_id: str | None = match.group(1) if match else None  # id группы (диалога) из URL чата
+        self.api_endpoint: str | None = None  # Адрес запроса сообщений приложения (без параметров)
+        self.api_headers: dict | None = None  # Его заголовки для повтора со своим курсором
+    
+    @staticmethod
+    def _extract_api_messages(json_body) -> list | None:
+        """Список сообщений из ответа API Fansly или None, если это не страница сообщений"""
+        if isinstance(json_body, list):
+            return json_body
+        if not isinstance(json_body, dict):
+            return None
+        payload = json_body.get('response')
+        if isinstance(payload, list):
+            return payload
+        if isinstance(payload, dict) and isinstance(payload.get('messages'), list):
+            return payload['messages']
+        return None
+    
+    @staticmethod
+    def _is_messages_response(response: Response) -> bool:
+        """Ответ API Fansly со страницей сообщений группы (/api/v1/message?groupId=...)"""
+        parts = urlsplit(response.url)
+        return (
+            (parts.hostname or '').endswith("fansly.com")
+            and parts.path.rstrip('/').endswith("/api/v1/message")
+            and "groupId" in parse_qs(parts.query)
+        )
+    
+    def _is_own_messages_response(self, response: Response) -> bool:
+        """Страница сообщений именно этого чата (groupId из URL чата)"""
+        return bool(self.chat_group_id) and parse_qs(urlsplit(response.url).query).get('groupId') == [self.chat_group_id]
+    
+    def handle_request(self, request: Request):
+        """Запоминает адрес и заголовки запроса сообщений, который отправило само приложение Fansly"""
+        if self.api_headers is not None or request.method != 'GET':
+            return
+        if not (self._is_messages_response(request) and self._is_own_messages_response(request)):
+            return
+        parts = urlsplit(request.url)
+        self.api_endpoint = f"{parts.scheme}://{parts.netloc}{parts.path}"
+        self.api_headers = {
+            name: value for name, value in request.headers.items()
+            if name in self.API_REPLAY_HEADERS or name.startswith('fansly-client-')
+        }
+    
+    async def _fetch_api_page(self, page: Page, cursor: int | None) -> tuple[list, bool] | None:
+        """Страница истории повтором запроса сообщений приложения Fansly со своим курсором before
         
-        parsing_successful = False
-        try:
-            await self.parse(ws_endpoint)
-            parsing_successful = True
-        except LoginPageException:
-            print("Login page detected - session may have expired")
-            if self.stop_requested:
-                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            return {'status': 'error', 'message': 'Login page detected'}
-        except Exception as e:
-            if self.stop_requested:
-                print("🛑 Stop requested during parsing")
-                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
-            print(f"Error during parsing: {e}")
-            return {'status': 'error', 'message': f'Parsing error: {str(e)}'}
+        Запрос уходит из вкладки (fetch с куками сессии) с заголовками запроса,
+        который приложение отправило при открытии чата; fansly-client-ts обновляется.
+        """
+        if not self.chat_group_id:
+            print("⚠️ API mode: cannot get Fansly group id from URL, falling back to scrolling")
+            return None
+        # Ждем, пока приложение само запросит сообщения, чтобы взять его заголовки
+        for _ in range(50):
+            if self.api_headers is not None or self.stop_requested:
+                break
+            await asyncio.sleep(0.2)
+        if self.api_headers is None:
+            print("⚠️ API mode: no Fansly messages request captured, falling back to scrolling")
+            return None
         
-        if parsing_successful and len(self.messages) > 0:
-            print(f"✅ Fansly parsing completed. Collected {len(self.messages)} messages. Stopping profile.")
-            self.octo.stop_profile(self.profile_uuid)
-
-        return {'status': 'ok' if parsing_successful else 'error'}
-    
-    async def check_if_login_page(self, page: Page) -> bool:
-        """Проверка, является ли страница страницей логина Fansly"""
+        params = {'groupId': self.chat_group_id, 'limit': self.API_PAGE_SIZE, 'ngsw-bypass': 'true'}
+        if cursor is not None:
+            params['before'] = cursor
+        url = f"{self.api_endpoint}?{urlencode(params)}"
         try:
-            login_indicators = [
-                'input[type="email"]',
-                'input[type="password"]',
-                'button[type="submit"]',
-                '.login-form',
-                '#login',
-                '[data-testid="login"]'
-            ]
-            
-            for selector in login_indicators:
-                if await page.query_selector(selector):
-                    return True
-            
-            current_url = page.url
-            if 'login' in current_url.lower() or 'signin' in current_url.lower():
-                return True
-                
-            return False
+            result = await page.evaluate(FANSLY_API_GET_JS, {'url': url, 'headers': self.api_headers})
         except Exception as e:
-            print(f"Error checking login page: {e}")
-            return False
+            print(f"⚠️ API mode: Fansly request failed: {e}")
+            return None
+        page_messages = self._extract_api_messages(result.get('data'))
+        if result.get('error') or page_messages is None:
+            print(f"⚠️ API mode: {result.get('status')} {result.get('error')} for {url}, falling back to scrolling")
+            return None
+        # Fansly не сообщает hasMore: история закончилась на пустой странице
+        return page_messages, bool(page_messages)
     
     async def handle_response(self, response: Response):
         """Обработка ответов API для сбора сообщений Fansly"""
-        if "fansly.com/api" in response.url and "message" in response.url.lower():
-            if "application/json" in response.headers.get("content-type", ""):
-                try:
-                    json_body = await response.json()
-                    # Fansly API может возвращать данные в разных структурах
-                    if 'response' in json_body and isinstance(json_body['response'], list):
-                        for message in json_body['response']:
-                            await self._process_message(message)
-                    elif isinstance(json_body, list):
-                        for message in json_body:
-                            await self._process_message(message)
-                except Exception as e:
-                    print(f"Failed to parse Fansly messages from API: {e}")
+        if not self._is_messages_response(response):
+            return
+        own_group = self._is_own_messages_response(response)
+        if self.chat_group_id and not own_group:
+            return  # Сообщения другой группы (превью диалогов и т.п.)
+        if "application/json" in response.headers.get("content-type", ""):
+            try:
+                json_body = await response.json()
+                # Fansly API может возвращать данные в разных структурах
+                messages = self._extract_api_messages(json_body)
+                for message in messages or []:
+                    await self._process_message(message)
+                # Пустая страница сообщений этого чата - более старых сообщений нет
+                if own_group and messages == []:
+                    self.history_exhausted = True
+            except Exception as e:
+                print(f"Failed to parse Fansly messages from API: {e}")
     
     async def _process_message(self, message: dict):
         """Обработка сообщения Fansly из API"""
         try:
             # Fansly API структура может отличаться
-            from_user_id = message.get('accountId') or message.get('fromAccountId')
+            from_user_id = message.get('senderId') or message.get('accountId') or message.get('fromAccountId')
             
             is_from_model = str(from_user_id) == str(self.model_id) if from_user_id and self.model_id else False
             
-            # Проверяем информацию о платном сообщении
+            # Проверяем информацию о платном сообщении (цена у сообщения или у вложений)
             is_paid = False
             amount_paid = 0
             
-            if message.get('price'):
+            price = message.get('price') or sum(
+                float(attachment.get('price') or 0) for attachment in message.get('attachments') or []
+            )
+            if price:
                 is_paid = True
-                amount_paid = float(message.get('price', 0))
+                amount_paid = float(price)
+            
+            message_id = message.get('id')
             
             message_data = {
+                'platform_message_id': str(message_id) if message_id else None,
                 'from_user_id': str(from_user_id) if from_user_id else None,
                 'from_username': message.get('username', 'User'),
                 'message_text': message.get('content', ''),
@@ -1093,8 +2658,8 @@ class ChatParserFansly:
                 'amount_paid': amount_paid
             }
             
-            self.messages.append(message_data)
-            print(f"Collected Fansly message: {message_data['message_text'][:50]}...")
+            if self._remember_message(message_data):
+                print(f"Collected Fansly message: {message_data['message_text'][:50]}...")
             
         except Exception as e:
             print(f"Error processing Fansly message: {e}")
@@ -1138,7 +2703,7 @@ class ChatParserFansly:
                 month = months.get(month_abbr.lower()[:3])
                 if month:
                     # Используем текущий год
-                    now = datetime.datetime.now()
+                    now = self._page_now()
                     year = now.year
                     try:
                         return datetime.datetime(year, month, day, hour, minute, 0)
@@ -1174,59 +2739,18 @@ class ChatParserFansly:
             # Если timestamp в миллисекундах (больше 10 миллиардов)
             if timestamp > 10000000000:
                 timestamp = timestamp / 1000
-            return datetime.datetime.fromtimestamp(timestamp)
+            return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
         except (ValueError, TypeError):
             pass
         
         return None
     
-    async def navigate(self, page: Page, browser: Browser):
-        """Навигация по чату Fansly с прокруткой контейнера сообщений"""
-        print(f"🎯 Navigating to Fansly chat: {self.chat_url}")
-        try:
-            await page.goto(self.chat_url, wait_until="domcontentloaded", timeout=60000)
-            await page.wait_for_timeout(5 * 1000)
-        except Exception as e:
-            print(f"First navigation attempt failed: {e}, retrying with networkidle...")
-            try:
-                await page.goto(self.chat_url, wait_until="networkidle", timeout=90000)
-                await page.wait_for_timeout(3 * 1000)
-            except Exception as retry_error:
-                print(f"Navigation retry also failed: {retry_error}")
-                await page.wait_for_timeout(3 * 1000)
-        
-        if await self.check_if_login_page(page):
-            print("Warning: Login page indicators detected, but continuing...")
-        
-        # Ждем загрузки контейнера сообщений Fansly
-        try:
-            # В Fansly сообщения находятся в app-group-message-collection
-            await page.wait_for_selector('app-group-message-collection', timeout=10000)
-            print("✅ Fansly chat messages container loaded")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not find Fansly messages container: {e}")
-            if await self.check_if_login_page(page):
-                print("Confirmed: Login page detected (no messages container)")
-                await page.close()
-                await browser.close()
-                raise LoginPageException()
-        
-        # Если это режим обновления - собираем только текущие сообщения без прокрутки
-        if self.update_only:
-            print("🔄 Update mode: collecting current visible messages only")
-            await page.wait_for_timeout(2 * 1000)
-            await self._collect_messages_from_dom(page)
-            print(f"Total messages collected: {len(self.messages)}")
-            if len(self.messages) > self.last_saved_count:
-                await self._save_messages_batch()
-            return
-        
-        # Обычный режим полного парсинга с прокруткой
-        scroll_attempts = 0
-        no_new_content_count = 0
-        
-        # Находим правильный скроллируемый контейнер для Fansly
-        # Проверяем несколько возможных контейнеров
+    def _fallback_timestamp(self) -> datetime.datetime:
+        """Время без даты не угадываем: 1970-01-01 00:00:00"""
+        return datetime.datetime(1970, 1, 1, 0, 0, 0)
+    
+    async def _prepare_scroll(self, page: Page):
+        """Находит скроллируемый контейнер Fansly (для диагностики в логах)"""
         scroll_container_info = await page.evaluate("""
             () => {
                 // Пробуем найти скроллируемый контейнер
@@ -1266,8 +2790,8 @@ class ChatParserFansly:
         """)
         
         print(f"🔍 Scroll container detection: {scroll_container_info}")
-        
-        # Делаем первый скролл вверх, чтобы дойти до начала
+    
+    async def _scroll_to_top(self, page: Page):
         await page.evaluate("""
             () => {
                 // Пробуем разные контейнеры в порядке приоритета
@@ -1285,442 +2809,323 @@ class ChatParserFansly:
                 }
             }
         """)
-        await page.wait_for_timeout(3 * 1000)
-        
-        while not self.stop_requested:
-            scroll_attempts += 1
-            print(f"📜 Scrolling Fansly chat... attempt {scroll_attempts} (collected {len(self.messages)} messages so far)")
-            
-            # Считаем количество сообщений до прокрутки
-            messages_before = await page.evaluate("""
-                () => {
-                    const messages = document.querySelectorAll('app-group-message');
-                    return messages.length;
-                }
-            """)
-            
-            # Прокручиваем вверх к началу чата
-            scroll_info = await page.evaluate("""
-                () => {
-                    // Ищем контейнер с прокруткой (в порядке приоритета)
-                    const container = document.querySelector('.message-content-list') ||
-                                    document.querySelector('.message-collection-wrapper') ||
-                                    document.querySelector('app-group-message-container') ||
-                                    document.querySelector('app-group-message-collection') ||
-                                    document.querySelector('.message-collection');
-                    if (container) {
-                        const scrollTopBefore = container.scrollTop;
-                        const scrollHeight = container.scrollHeight;
-                        const clientHeight = container.clientHeight;
-                        
-                        // Прокручиваем большим шагом вверх
-                        container.scrollBy(0, -2000);
-                        
-                        const scrollTopAfter = container.scrollTop;
-                        
-                        return {
-                            found: true,
-                            selector: container.tagName + '.' + container.className,
-                            scrollTopBefore: scrollTopBefore,
-                            scrollTopAfter: scrollTopAfter,
-                            scrollHeight: scrollHeight,
-                            clientHeight: clientHeight,
-                            scrollDelta: scrollTopBefore - scrollTopAfter
-                        };
-                    } else {
-                        window.scrollBy(0, -2000);
-                        return { found: false, usedWindow: true };
-                    }
-                }
-            """)
-            
-            print(f"📊 Scroll info: {scroll_info}")
-            
-            # Увеличиваем таймаут для Fansly, чтобы загрузились новые сообщения
-            await page.wait_for_timeout(5 * 1000)
-            
-            # Считаем количество сообщений после прокрутки
-            messages_after = await page.evaluate("""
-                () => {
-                    const messages = document.querySelectorAll('app-group-message');
-                    return messages.length;
-                }
-            """)
-            
-            print(f"📊 Messages in DOM: before={messages_before}, after={messages_after}")
-            
-            # Проверяем, достигли ли мы верха контейнера
-            if scroll_info.get('found') and scroll_info.get('scrollTopAfter', -1) == 0 and scroll_info.get('scrollDelta', 0) == 0:
-                print(f"✅ Reached the top of the container (scrollTop=0, no scroll delta)")
-                no_new_content_count += 1
-            
-            if messages_after == messages_before:
-                no_new_content_count += 1
-                print(f"⏸️ No new messages loaded (count: {no_new_content_count}/5)")
-                
-                if no_new_content_count >= 3:  # Уменьшаем с 5 до 3, так как теперь проверяем scrollTop
-                    print(f"✅ Reached the beginning of the Fansly chat! Total scrolls: {scroll_attempts}")
-                    print(f"📝 Total messages in DOM: {messages_after}")
-                    break
-            else:
-                no_new_content_count = 0
-                print(f"✨ Loaded {messages_after - messages_before} new messages, continuing...")
-                
-                # Периодически собираем сообщения и сохраняем
-                if scroll_attempts % 10 == 0:
-                    await self._collect_messages_from_dom(page)
-                    if len(self.messages) - self.last_saved_count >= self.save_batch_size:
-                        await self._save_messages_batch()
-        
-        if self.stop_requested:
-            print(f"🛑 Parsing stopped by user after {scroll_attempts} attempts")
-        else:
-            print(f"✅ Finished scrolling after {scroll_attempts} attempts")
-        
-        # Финальный сбор всех сообщений из DOM
-        await self._collect_messages_from_dom(page)
-        
-        print(f"📊 Total messages collected: {len(self.messages)}")
-        
-        if len(self.messages) > self.last_saved_count:
-            await self._save_messages_batch()
     
-    async def _collect_messages_from_dom(self, page: Page):
-        """Сбор сообщений напрямую из DOM Fansly"""
-        try:
-            messages_data = await page.evaluate("""
-                () => {
-                    const messages = document.querySelectorAll('app-group-message');
-                    const messagesData = [];
+    async def _scroll_up(self, page: Page) -> dict:
+        """Прокрутка контейнера Fansly на 2000px вверх; at_top - контейнер уже в самом верху"""
+        scroll_info = await page.evaluate("""
+            () => {
+                // Ищем контейнер с прокруткой (в порядке приоритета)
+                const container = document.querySelector('.message-content-list') ||
+                                document.querySelector('.message-collection-wrapper') ||
+                                document.querySelector('app-group-message-container') ||
+                                document.querySelector('app-group-message-collection') ||
+                                document.querySelector('.message-collection');
+                if (container) {
+                    const scrollTopBefore = container.scrollTop;
+                    const scrollHeight = container.scrollHeight;
+                    const clientHeight = container.clientHeight;
                     
-                    messages.forEach((messageEl, index) => {
-                        try {
-                            // Текст сообщения находится в .message-text
-                            const textEl = messageEl.querySelector('.message-text');
-                            let messageText = textEl ? textEl.textContent.trim() : '';
-                            
-                            // Проверяем наличие медиа контента
-                            // Медиа может быть в самом сообщении или в родительских элементах
-                            // Структура: message embed > message-attachment > app-group-message-attachment
-                            const hasMediaInElement = messageEl.querySelector('.message-attachment') || 
-                                                     messageEl.querySelector('message-attachment') ||
-                                                     messageEl.querySelector('app-group-message-attachment');
-                            
-                            // Проверяем родительские элементы
-                            const parentMessageEmbed = messageEl.closest('.message.embed');
-                            const hasMediaInParent = parentMessageEmbed && (
-                                parentMessageEmbed.querySelector('.message-attachment') ||
-                                parentMessageEmbed.querySelector('message-attachment') ||
-                                parentMessageEmbed.querySelector('app-group-message-attachment')
-                            );
-                            
-                            const hasMedia = hasMediaInElement || hasMediaInParent;
-                            
-                            // Если нет текста, но есть медиа - используем "Media" и помечаем как платное
-                            if (!messageText && hasMedia) {
-                                messageText = 'Media';
-                            }
-                            
-                            // Пропускаем сообщения без текста и без медиа
-                            if (!messageText) return;
-                            
-                            // Определяем, от кого сообщение (my-message = от модели)
-                            const isFromModel = messageEl.classList.contains('my-message');
-                            
-                            // Ищем timestamp - время находится в span.margin-right-text внутри .timestamp
-                            // .timestamp находится на уровне родителя, не внутри app-group-message
-                            // Структура: <app-group-message-collection><div class="flex-row"><div class="flex-col width-100"><div><app-group-message>...</app-group-message></div><div class="timestamp"><span class="margin-right-text">...</span></div></div></div></app-group-message-collection>
-                            let messageTime = '';
-                            
-                            // Метод 1: Ищем через closest в app-group-message-collection
-                            const messageCollection = messageEl.closest('app-group-message-collection');
-                            if (messageCollection && !messageTime) {
-                                const timestampEl = messageCollection.querySelector('.timestamp');
-                                if (timestampEl) {
-                                    const timeSpan = timestampEl.querySelector('span.margin-right-text');
-                                    if (timeSpan) {
-                                        messageTime = timeSpan.textContent.trim();
-                                    } else {
-                                        messageTime = timestampEl.textContent.trim();
-                                    }
-                                }
-                            }
-                            
-                            // Метод 2: Ищем через closest в flex-col.width-100 (контейнер сообщения)
-                            if (!messageTime) {
-                                const parentFlexCol = messageEl.closest('.flex-col.width-100');
-                                if (parentFlexCol) {
-                                    const timestampEl = parentFlexCol.querySelector('.timestamp');
-                                    if (timestampEl) {
-                                        const timeSpan = timestampEl.querySelector('span.margin-right-text');
-                                        if (timeSpan) {
-                                            messageTime = timeSpan.textContent.trim();
-                                        } else {
-                                            messageTime = timestampEl.textContent.trim();
-                                        }
-                                    }
-                                }
-                            }
-                            
-                            // Метод 3: Пробуем найти через родительские элементы
-                            if (!messageTime) {
-                                let parent = messageEl.parentElement;
-                                let attempts = 0;
-                                while (parent && attempts < 5) {
-                                    const timestampEl = parent.querySelector('.timestamp');
-                                    if (timestampEl) {
-                                        const timeSpan = timestampEl.querySelector('span.margin-right-text');
-                                        if (timeSpan) {
-                                            messageTime = timeSpan.textContent.trim();
-                                        } else {
-                                            messageTime = timestampEl.textContent.trim();
-                                        }
-                                        break;
-                                    }
-                                    parent = parent.parentElement;
-                                    attempts++;
-                                }
-                            }
-                            
-                            // Метод 4: Последняя попытка - ищем в самом элементе (на случай другой структуры)
-                            if (!messageTime) {
-                                const timestampEl = messageEl.querySelector('.timestamp');
-                                if (timestampEl) {
-                                    const timeSpan = timestampEl.querySelector('span.margin-right-text');
-                                    if (timeSpan) {
-                                        messageTime = timeSpan.textContent.trim();
-                                    } else {
-                                        messageTime = timestampEl.textContent.trim();
-                                    }
-                                }
-                            }
-                            
-                            // Проверяем платное сообщение
-                            // В Fansly весь контент делится на купленный и некупленный
-                            // Бесплатно отправленный отображается по дефолту как купленный
-                            // Нужно проверить наличие purchased-content или purchased-avatar (включая not-purchased)
-                            let isPaid = false;
-                            let amountPaid = 0;
-                            
-                            // Если сообщение содержит только медиа (messageText === 'Media'), оно всегда платное
-                            if (messageText === 'Media') {
-                                isPaid = true;
-                            } else {
-                                // Ищем purchased-content или purchased-avatar внутри сообщения или его attachment
-                                const purchasedContent = messageEl.querySelector('.purchased-content');
-                                const purchasedAvatar = messageEl.querySelector('.purchased-avatar');
-                                const messageAttachment = messageEl.querySelector('message-attachment');
-                                
-                                // Если есть message-attachment, ищем внутри него
-                                let attachmentPurchasedContent = null;
-                                let attachmentPurchasedAvatar = null;
-                                if (messageAttachment) {
-                                    attachmentPurchasedContent = messageAttachment.querySelector('.purchased-content');
-                                    attachmentPurchasedAvatar = messageAttachment.querySelector('.purchased-avatar');
-                                }
-                                
-                                // Если найден любой из индикаторов платного контента - это платное сообщение
-                                if (purchasedContent || purchasedAvatar || attachmentPurchasedContent || attachmentPurchasedAvatar) {
-                                    isPaid = true;
-                                    // Пытаемся найти цену
-                                    const allText = messageEl.innerText || messageEl.textContent || '';
-                                    const pricePattern = /\\$([\\d,]+(?:\\.\\d{2})?)/;
-                                    const priceMatch = allText.match(pricePattern);
-                                    if (priceMatch) {
-                                        const priceStr = priceMatch[1].replace(/,/g, '');
-                                        amountPaid = parseFloat(priceStr);
-                                    }
-                                }
-                            }
-                            
-                            // Извлекаем user ID из аватара (находится в родительском контейнере)
-                            let fromUserId = '';
-                            
-                            // Аватар находится на уровень выше, ищем его в родительском контейнере
-                            // Структура: <div class="flex-row"><app-account-avatar><a href="/username"></a></app-account-avatar><div><app-group-message>...</app-group-message></div></div>
-                            const parentContainer = messageEl.parentElement?.parentElement?.parentElement;
-                            if (parentContainer) {
-                                const avatarEl = parentContainer.querySelector('app-account-avatar a[href]');
-                                if (avatarEl) {
-                                    const href = avatarEl.getAttribute('href');
-                                    // Извлекаем username из href типа "/alan_90"
-                                    fromUserId = href ? href.replace('/', '').trim() : '';
-                                }
-                            }
-                            
-                            // Если не нашли через родителя, пробуем поискать в ближайшем контейнере
-                            if (!fromUserId) {
-                                const closestRow = messageEl.closest('.flex-row');
-                                if (closestRow) {
-                                    const avatarEl = closestRow.querySelector('app-account-avatar a[href]');
-                                    if (avatarEl) {
-                                        const href = avatarEl.getAttribute('href');
-                                        fromUserId = href ? href.replace('/', '').trim() : '';
-                                    }
-                                }
-                            }
-                            
-                            // Используем fromUserId как username, если есть
-                            const finalUsername = isFromModel ? 'Model' : (fromUserId || 'User');
-                            
-                            messagesData.push({
-                                from_user_id: fromUserId,
-                                from_username: finalUsername,
-                                message_text: messageText,
-                                message_date: messageTime,
-                                is_from_model: isFromModel,
-                                is_paid: isPaid,
-                                amount_paid: amountPaid
-                            });
-                        } catch (e) {
-                            console.error('Error parsing Fansly message:', e);
-                        }
-                    });
+                    // Прокручиваем большим шагом вверх
+                    container.scrollBy(0, -2000);
+                    
+                    const scrollTopAfter = container.scrollTop;
                     
-                    return messagesData;
+                    return {
+                        found: true,
+                        selector: container.tagName + '.' + container.className,
+                        scrollTopBefore: scrollTopBefore,
+                        scrollTopAfter: scrollTopAfter,
+                        scrollHeight: scrollHeight,
+                        clientHeight: clientHeight,
+                        scrollDelta: scrollTopBefore - scrollTopAfter
+                    };
+                } else {
+                    window.scrollBy(0, -2000);
+                    return { found: false, usedWindow: true };
                 }
-            """)
-            
-            # Добавляем только уникальные сообщения
-            for message_data in messages_data:
-                if not any(msg['message_text'] == message_data['message_text'] and 
-                          msg['from_username'] == message_data['from_username'] 
-                          for msg in self.messages):
-                    self.messages.append(message_data)
-                    user_id_info = f"(user_id: {message_data['from_user_id']})" if message_data['from_user_id'] else "(no user_id)"
-                    print(f"✅ Collected Fansly message from {message_data['from_username']} {user_id_info}: {message_data['message_text'][:50]}...")
-            
-            print(f"📊 Total messages collected from Fansly DOM: {len(messages_data)}")
-            
-        except Exception as e:
-            print(f"❌ Error collecting messages from Fansly DOM: {e}")
+            }
+        """)
+        print(f"📊 Scroll info: {scroll_info}")
+        # Проверяем, достигли ли мы верха контейнера
+        scroll_info['at_top'] = bool(
+            scroll_info.get('found') and scroll_info.get('scrollTopAfter', -1) == 0 and scroll_info.get('scrollDelta', 0) == 0
+        )
+        if scroll_info['at_top']:
+            print(f"✅ Reached the top of the container (scrollTop=0, no scroll delta)")
+        return scroll_info
+
+
+def detect_platform(chat_url: str) -> str:
+    """Определяет платформу по URL чата
     
-    async def parse(self, ws_endpoint: str):
-        """Основной метод парсинга Fansly"""
-        async with async_playwright() as p:
-            page = None
-            browser = None
-            try:
-                if self.stop_requested:
-                    print("🛑 Stop requested before connecting, aborting...")
-                    return
-                    
-                browser = await p.chromium.connect_over_cdp(ws_endpoint)
-                context = browser.contexts[0]
-                page = await context.new_page()
-                
-                # Подписываемся на ответы API
-                page.on("response", lambda response: asyncio.create_task(self.handle_response(response)))
-                
-                if self.stop_requested:
-                    print("🛑 Stop requested before navigation, aborting...")
-                    return
-                
-                await self.navigate(page, browser)
-                
-            except Exception as e:
+    Args:
+        chat_url: URL чата
+        
+    Returns:
+        'onlyfans' или 'fansly'
+    """
+    if 'fansly.com' in chat_url.lower():
+        return 'fansly'
+    elif 'onlyfans.com' in chat_url.lower():
+        return 'onlyfans'
+    else:
+        # По умолчанию возвращаем onlyfans для обратной совместимости
+        return 'onlyfans'
+
+
+def create_parser(profile_uuid: str, chat_url: str, update_only: bool = False, platform: str | None = None,
+                  checkpoint: dict | None = None):
+    """Создает парсер нужной платформы (ChatParser или ChatParserFansly)"""
+    platform = platform or detect_platform(chat_url)
+    if platform == 'fansly':
+        return ChatParserFansly(profile_uuid, chat_url, update_only=update_only, checkpoint=checkpoint)
+    return ChatParser(profile_uuid, chat_url, update_only=update_only, checkpoint=checkpoint)
+
+
+class ResponseRouter:
+    """Один обработчик запросов и ответов на весь контекст браузера профиля
+
+    Вкладки контекста регистрируются за парсерами своих чатов; запрос и ответ
+    уходят парсеру вкладки, которая их отправила, поэтому параллельные вкладки
+    не видят чужих сообщений.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.parsers: dict[Page, object] = {}
+        context.on("request", self._on_request)
+        context.on("response", self._on_response)
+
+    def register(self, page: Page, parser):
+        self.parsers[page] = parser
+
+    def unregister(self, page: Page):
+        self.parsers.pop(page, None)
+
+    def _parser_for(self, request):
+        try:
+            return self.parsers.get(request.frame.page)
+        except Exception:
+            return None  # Запрос service worker - не относится ни к одной вкладке
+
+    def _on_request(self, request: Request):
+        parser = self._parser_for(request)
+        if parser is not None:
+            parser.handle_request(request)
+
+    def _on_response(self, response: Response):
+        parser = self._parser_for(response.request)
+        if parser is not None:
+            asyncio.create_task(parser.handle_response(response))
+
+    def close(self):
+        self.context.remove_listener("request", self._on_request)
+        self.context.remove_listener("response", self._on_response)
+
+
+class BatchChatParser:
+    """Пакетный парсинг: чаты одного профиля в одной сессии браузера
+
+    Профиль запускается (или берется теплым из ProfilePool) один раз, чаты
+    парсятся в tabs вкладках одного контекста параллельно (куки общие), каждая
+    вкладка берет следующий чат из общей очереди и открывает его роутером SPA
+    без перезагрузки страницы. Финальная запись чата идет параллельно с
+    парсингом следующего. Упавший чат не останавливает пакет, кроме страницы
+    логина - сессия профиля недействительна для всех чатов.
+    """
+
+    def __init__(self, profile_uuid: str, chat_urls: list[str], update_only: bool = False,
+                 checkpoint: dict | None = None, tabs: int | None = None):
+        self.profile_uuid = profile_uuid
+        self.chat_urls = chat_urls
+        self.update_only = update_only
+        self.tabs = tabs or settings.PARSER_PROFILE_TABS
+        self.octo: AsyncOctoClient | None = None
+        # Checkpoint пакета: все чаты до chat_index записаны, из следующих записаны done;
+        # chats - checkpoint каждого прерванного чата (по одному на открытую вкладку)
+        checkpoint = checkpoint or {}
+        self.chat_index: int = checkpoint.get('chat_index', 0)
+        self.done: set[int] = set(checkpoint.get('done', []))
+        self.chat_checkpoints: dict[int, dict] = {
+            int(index): chat_checkpoint for index, chat_checkpoint in (checkpoint.get('chats') or {}).items()
+        }
+        if checkpoint.get('chat') and self.chat_index not in self.chat_checkpoints:
+            # Старый формат: checkpoint только чата chat_index
+            self.chat_checkpoints[self.chat_index] = checkpoint['chat']
+        self.parsers: dict[int, object] = {}  # Индекс чата -> парсер, чат которого еще не записан
+        self._stop_requested: bool = False
+        self.ingest_stats: dict = {'inserted': 0, 'skipped': 0}
+        self.failed_chats: list[dict] = []
+        self.save_failed: bool = False  # Сообщения какого-то чата не записались
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_requested
+
+    @stop_requested.setter
+    def stop_requested(self, value: bool):
+        self._stop_requested = value
+        for parser in self.parsers.values():
+            parser.stop_requested = value
+
+    def checkpoint(self) -> dict:
+        chat_checkpoints = dict(self.chat_checkpoints)
+        for index, parser in self.parsers.items():
+            chat_checkpoints[index] = parser.checkpoint()
+        return {
+            'chat_index': self.chat_index,
+            'done': sorted(self.done),
+            'chats': {str(index): chat_checkpoints[index] for index in sorted(chat_checkpoints)},
+        }
+
+    async def _create_parser(self, index: int):
+        parser = create_parser(
+            self.profile_uuid, self.chat_urls[index], update_only=self.update_only,
+            checkpoint=self.chat_checkpoints.get(index),
+        )
+        await parser.load_state()
+        parser.octo = self.octo
+        parser.stop_requested = self.stop_requested
+        self.parsers[index] = parser
+        return parser
+
+    async def _finish_chat(self, index: int, parser):
+        """Финальная запись чата; после нее checkpoint пакета переходит дальше
+
+        Если часть сообщений чата не записалась, чат не считается готовым:
+        checkpoint пакета остается на нем, а задача завершится ошибкой.
+        """
+        try:
+            await parser.finish_saving()
+        except MessageSaveError as e:
+            print(f"❌ Error in final save of {parser.chat_url}: {e}")
+            self.failed_chats.append({'chat_url': parser.chat_url, 'message': str(e)})
+            self.save_failed = True
+            return
+        except Exception as e:
+            print(f"❌ Error in final save of {parser.chat_url}: {e}")
+        for key in self.ingest_stats:
+            self.ingest_stats[key] += parser.ingest_stats.get(key, 0)
+        self.parsers.pop(index, None)
+        self.chat_checkpoints.pop(index, None)
+        self.done.add(index)
+        while self.chat_index in self.done:
+            self.done.discard(self.chat_index)
+            self.chat_index += 1
+
+    async def _run_tab(self, context, router: ResponseRouter, pending, first_parser):
+        """Вкладка: по очереди парсит чаты из общей очереди pending"""
+        page = await context.new_page()
+        if first_parser.resource_policy is not None:
+            await first_parser.resource_policy.apply(page)
+        saving = None
+        opened = False
+        try:
+            for index in pending:
                 if self.stop_requested:
-                    print("🛑 Stop requested, parsing aborted")
-                    return
-                print(f"❌ Error during Fansly parsing: {e}")
-                raise
-            finally:
-                if page is not None:
-                    await page.close()
-                if browser is not None:
-                    await browser.close()
-                
+                    break
+                parser = self.parsers.get(index) or await self._create_parser(index)
+                # Первый чат вкладки загружает приложение, остальные открываются его роутером
+                parser.spa_navigation = opened
+                opened = True
+                print(f"📂 Chat {index + 1}/{len(self.chat_urls)}: {parser.chat_url}")
+                router.register(page, parser)
                 try:
-                    await sync_to_async(self.save_messages)()
+                    await parser.parse_page(page, router=router)
+                except LoginPageException:
+                    raise
                 except Exception as e:
-                    print(f"❌ Error in final save: {e}")
-    
-    async def _save_messages_batch(self):
-        """Периодическое сохранение батча новых сообщений"""
-        new_messages = self.messages[self.last_saved_count:]
-        if not new_messages:
-            return
-        
-        print(f"💾 Saving Fansly batch: {len(new_messages)} new messages (total collected: {len(self.messages)})")
-        
+                    if not self.stop_requested:
+                        print(f"❌ Error parsing {parser.chat_url}: {e}")
+                        self.failed_chats.append({'chat_url': parser.chat_url, 'message': str(e)})
+                finally:
+                    router.unregister(page)
+                if self.stop_requested:
+                    break
+
+                # Запись этого чата идет, пока вкладка уже открывает и парсит следующий
+                if saving is not None:
+                    await saving
+                saving = asyncio.create_task(self._finish_chat(index, parser))
+        finally:
+            if saving is not None:
+                await saving
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    async def run(self):
+        """Основной метод запуска пакета"""
+        if self.stop_requested:
+            print("🛑 Stop requested before starting, aborting...")
+            return {'status': 'cancelled', 'message': 'Parser stopped by user'}
+
+        remaining = [index for index in range(self.chat_index, len(self.chat_urls)) if index not in self.done]
+        if not remaining:
+            return {'status': 'ok', 'chats': len(self.chat_urls), 'chats_done': self.chat_index, 'failed_chats': []}
+
+        self.octo = async_octo_client()
+        pool = profile_pool()
+        first = await self._create_parser(remaining[0])
+        warm, error = await open_warm_profile(first)
+        if error is not None:
+            return error
+
+        tabs = max(1, min(self.tabs, len(remaining)))
+        print(f"📦 Batch of {len(remaining)} chat(s) for profile {self.profile_uuid} in {tabs} tab(s)")
+        context = warm.browser.contexts[0]
+        router = ResponseRouter(context)
+        pending = iter(remaining)  # Общая очередь: каждая вкладка берет следующий чат
+        tasks = [asyncio.create_task(self._run_tab(context, router, pending, first)) for _ in range(tabs)]
+        session_ok = False
         try:
-            await sync_to_async(self._save_messages_sync)(new_messages)
-            self.last_saved_count = len(self.messages)
-            print(f"✅ Fansly batch saved successfully! Total saved so far: {self.last_saved_count}")
+            await asyncio.gather(*tasks)
+            session_ok = True
+        except LoginPageException:
+            print("Login page detected - session may have expired")
+            if self.stop_requested:
+                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
+            return {'status': 'error', 'message': 'Login page detected', **self.ingest_stats}
         except Exception as e:
-            print(f"❌ Error saving Fansly batch: {e}")
-    
-    def _save_messages_sync(self, messages_to_save: list[dict]):
-        """Синхронное сохранение списка сообщений Fansly (только в FullChatMessage)"""
-        saved_full_count = 0
-        
-        for message_data in messages_to_save:
-            try:
-                # Сохраняем только в FullChatMessage (без Profile и ChatMessage)
-                if self.model_id:
-                    # Определяем is_from_model из данных сообщения (парсили из DOM по классу my-message)
-                    is_from_model = message_data.get('is_from_model', False)
-                    
-                    # Определяем user_id:
-                    # - Если сообщение от модели → используем model_name
-                    # - Если от пользователя → используем from_user_id из href
-                    if is_from_model:
-                        user_id = self.model_name if self.model_name else 'Model'
-                    else:
-                        user_id = message_data.get('from_user_id', '')
-                    
-                    existing_full = FullChatMessage.objects.filter(
-                        chat_url=self.chat_url,
-                        message=message_data['message_text'],
-                        model_id=self.model_id
-                    ).first()
-                    
-                    if not existing_full:
-                        timestamp = None
-                        if message_data.get('message_date'):
-                            if isinstance(message_data['message_date'], datetime.datetime):
-                                timestamp = message_data['message_date']
-                            else:
-                                timestamp = self._parse_date(str(message_data['message_date']))
-                        
-                        if timestamp is None:
-                            print(f"⚠️ Warning: Could not parse message_date '{message_data.get('message_date')}', using 000000 (1970-01-01 00:00:00) as fallback")
-                            timestamp = datetime.datetime(1970, 1, 1, 0, 0, 0)
-                        
-                        is_paid = message_data.get('is_paid', False)
-                        amount_paid = message_data.get('amount_paid', 0) or 0
-                        
-                        FullChatMessage.objects.create(
-                            user_id=user_id,
-                            chat_url=self.chat_url,
-                            is_from_model=is_from_model,
-                            message=message_data['message_text'],
-                            timestamp=timestamp,
-                            is_paid=is_paid,
-                            amount_paid=amount_paid,
-                            model_id=self.model_id
-                        )
-                        saved_full_count += 1
-                        
-                        # Логирование для отладки
-                        user_type = "model" if is_from_model else "user"
-                        print(f"💾 Saved message from {user_type}: user_id={user_id}")
-                else:
-                    print(f"⚠️ Warning: model_id not found, skipping message save")
-                        
-            except Exception as e:
-                print(f"❌ Error saving Fansly message: {e}")
-        
-        if self.model_id:
-            print(f"💾 Saved {saved_full_count} new Fansly messages to FullChatMessage with model_id: {self.model_id}")
-    
-    def save_messages(self):
-        """Сохранение всех оставшихся сообщений Fansly в базу данных"""
-        new_messages = self.messages[self.last_saved_count:]
-        if new_messages:
-            print(f"💾 Final Fansly save: {len(new_messages)} remaining messages")
-            self._save_messages_sync(new_messages)
-            self.last_saved_count = len(self.messages)
-        else:
-            print("✅ All Fansly messages already saved during parsing")
+            if self.stop_requested:
+                print("🛑 Stop requested during parsing")
+                return {'status': 'cancelled', 'message': 'Parser stopped by user'}
+            print(f"Error during batch parsing: {e}")
+            return {'status': 'error', 'message': f'Parsing error: {str(e)}', **self.ingest_stats}
+        finally:
+            # Ошибка сессии в одной вкладке останавливает остальные
+            if not session_ok:
+                self.stop_requested = True
+            await asyncio.gather(*tasks, return_exceptions=True)
+            router.close()
+            # Прерванные чаты сохраняем, но checkpoint пакета остается на них - продолжим с этого места
+            for parser in self.parsers.values():
+                try:
+                    await parser.finish_saving()
+                except MessageSaveError as e:
+                    print(f"❌ Error in final save of {parser.chat_url}: {e}")
+                    self.save_failed = True
+                except Exception as e:
+                    print(f"❌ Error in final save of {parser.chat_url}: {e}")
+                for key in self.ingest_stats:
+                    self.ingest_stats[key] += parser.ingest_stats.get(key, 0)
+            await pool.release(warm, keep=session_ok)
 
+        print(f"✅ Batch completed: {self.chat_index}/{len(self.chat_urls)} chats, {len(self.failed_chats)} failed")
+        if self.save_failed:
+            return {
+                'status': 'error',
+                'message': 'Some messages were not saved',
+                'chats': len(self.chat_urls),
+                'chats_done': self.chat_index,
+                'failed_chats': self.failed_chats,
+                **self.ingest_stats,
+            }
+        return {
+            'status': 'ok',
+            'chats': len(self.chat_urls),
+            'chats_done': self.chat_index,
+            'failed_chats': self.failed_chats,
+            **self.ingest_stats,
+        }
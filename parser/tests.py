@@ -0,0 +1,362 @@
+import datetime
+import threading
+import unittest
+import zoneinfo
+from unittest import mock
+
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .exceptions import MessageSaveError
+from .ingest import message_fingerprint, rebuild_chat_summaries
+from .jobs import claim_next_job
+from .models import FullChatMessage, ModelInfo, ParseJob, Profile
+from .scheduler import profile_is_due, schedule_parsing
+from .services import AdaptiveLoadTimer, MessageWriter, ParseCheckpoint
+from .views import _message_cursor, _parse_message_cursor
+
+
+CHAT_URL = 'https://onlyfans.com/my/chats/chat/12345'
+
+
+class MessageFingerprintTests(SimpleTestCase):
+    """Ключ дедупликации: одно сообщение из API и из DOM дает один ключ"""
+
+    def test_same_minute_in_other_timezone_gives_same_key(self):
+        utc = datetime.datetime(2026, 10, 17, 9, 30, 5, tzinfo=datetime.timezone.utc)
+        kyiv = utc.astimezone(zoneinfo.ZoneInfo('Europe/Kyiv')).replace(second=48)
+        self.assertEqual(
+            message_fingerprint(CHAT_URL, True, utc, 'hello'),
+            message_fingerprint(CHAT_URL, True, kyiv, 'hello'),
+        )
+
+    def test_naive_time_is_taken_in_project_timezone(self):
+        naive = datetime.datetime(2026, 10, 17, 12, 30)
+        aware = naive.replace(tzinfo=zoneinfo.ZoneInfo('Europe/Moscow'))
+        self.assertEqual(
+            message_fingerprint(CHAT_URL, False, naive, 'hi'),
+            message_fingerprint(CHAT_URL, False, aware, 'hi'),
+        )
+
+    def test_whitespace_is_normalized(self):
+        timestamp = datetime.datetime(2026, 10, 17, 9, 30, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            message_fingerprint(CHAT_URL, True, timestamp, '  hello \n  world '),
+            message_fingerprint(CHAT_URL, True, timestamp, 'hello world'),
+        )
+
+    def test_sender_side_chat_and_minute_are_distinguished(self):
+        timestamp = datetime.datetime(2026, 10, 17, 9, 30, tzinfo=datetime.timezone.utc)
+        key = message_fingerprint(CHAT_URL, True, timestamp, 'hello')
+        self.assertNotEqual(key, message_fingerprint(CHAT_URL, False, timestamp, 'hello'))
+        self.assertNotEqual(key, message_fingerprint(CHAT_URL + '6', True, timestamp, 'hello'))
+        self.assertNotEqual(
+            key, message_fingerprint(CHAT_URL, True, timestamp + datetime.timedelta(minutes=1), 'hello')
+        )
+
+    def test_missing_timestamp_and_text(self):
+        self.assertEqual(len(message_fingerprint(CHAT_URL, False, None, None)), 32)
+        self.assertEqual(
+            message_fingerprint(CHAT_URL, False, None, ''),
+            message_fingerprint(CHAT_URL, False, 'not a datetime', ''),
+        )
+
+
+class MessageCursorTests(TestCase):
+    """Keyset-пагинация сообщений чата по (timestamp, id)"""
+
+    def setUp(self):
+        start = datetime.datetime(2026, 10, 17, 9, 0, tzinfo=datetime.timezone.utc)
+        # Пары сообщений с одинаковым временем: порядок внутри пары задает id
+        self.messages = [
+            FullChatMessage.objects.create(
+                user_id='1', chat_url=CHAT_URL, message=f'message {i}',
+                timestamp=start + datetime.timedelta(minutes=i // 2),
+            )
+            for i in range(7)
+        ]
+
+    def fetch(self, **params):
+        response = self.client.get(reverse('get_chat_messages'), {'chat_url': CHAT_URL, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_round_trip(self):
+        message = self.messages[3]
+        self.assertEqual(_parse_message_cursor(_message_cursor(message)), (message.timestamp, message.pk))
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(ValueError):
+            _parse_message_cursor('garbage')
+        response = self.client.get(reverse('get_chat_messages'), {'chat_url': CHAT_URL, 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_paging_older_visits_every_message_once(self):
+        data = self.fetch(limit=3)
+        seen = [m['id'] for m in data['messages']]
+        self.assertFalse(data['has_newer'])
+        while data['has_older']:
+            data = self.fetch(limit=3, cursor=data['older_cursor'])
+            seen = [m['id'] for m in data['messages']] + seen
+        self.assertEqual(seen, [m.pk for m in self.messages])
+
+    def test_paging_newer_from_cursor(self):
+        data = self.fetch(limit=2, direction='newer', cursor=_message_cursor(self.messages[2]))
+        self.assertEqual([m['id'] for m in data['messages']], [m.pk for m in self.messages[3:5]])
+        self.assertTrue(data['has_newer'])
+        data = self.fetch(limit=5, direction='newer', cursor=data['newer_cursor'])
+        self.assertEqual([m['id'] for m in data['messages']], [m.pk for m in self.messages[5:]])
+        self.assertFalse(data['has_newer'])
+
+
+@override_settings(PARSER_WRITER_RETRY_DELAY=0)
+class MessageWriterTests(SimpleTestCase):
+    """Фоновая запись: пачки, повторы и отделение строк, которые не записываются"""
+
+    def make_writer(self, fail=lambda batch: False, failures=0, **kwargs):
+        self.saved, self.calls = [], []
+        remaining = {'failures': failures}
+
+        async def save(batch):
+            self.calls.append(list(batch))
+            if remaining['failures'] > 0:
+                remaining['failures'] -= 1
+                raise RuntimeError('connection lost')
+            if fail(batch):
+                raise RuntimeError('bad row')
+            self.saved.extend(batch)
+
+        return MessageWriter(save, **{'batch_size': 4, 'flush_interval': 60, 'max_retries': 3, **kwargs})
+
+    async def test_writes_full_batches_and_rest_on_close(self):
+        writer = self.make_writer()
+        writer.start()
+        for i in range(10):
+            await writer.put({'n': i})
+        await writer.close()
+        self.assertEqual([m['n'] for m in self.saved], list(range(10)))
+        self.assertEqual([len(batch) for batch in self.calls], [4, 4, 2])
+
+    async def test_retries_transient_error(self):
+        writer = self.make_writer(failures=2)
+        writer.start()
+        for i in range(4):
+            await writer.put({'n': i})
+        await writer.close()
+        self.assertEqual(len(self.saved), 4)
+        self.assertEqual(len(self.calls), 3)
+
+    async def test_drops_only_bad_rows(self):
+        writer = self.make_writer(fail=lambda batch: any(m.get('bad') for m in batch))
+        writer.start()
+        for i in range(4):
+            await writer.put({'n': i, 'bad': i == 2})
+        with self.assertRaises(MessageSaveError):
+            await writer.close()
+        self.assertEqual([m['n'] for m in self.saved], [0, 1, 3])
+        self.assertEqual(writer.failed, 1)
+
+    async def test_put_without_running_writer_is_flushed_on_close(self):
+        writer = self.make_writer()
+        await writer.put({'n': 0})
+        await writer.close()
+        self.assertEqual(self.saved, [{'n': 0}])
+
+
+class ParseCheckpointTests(SimpleTestCase):
+    """Сохраненный диапазон прерванного полного парсинга"""
+
+    def setUp(self):
+        self.start = datetime.datetime(2026, 10, 17, 9, 0, tzinfo=datetime.timezone.utc)
+
+    def minutes(self, n):
+        return self.start + datetime.timedelta(minutes=n)
+
+    def test_advance_tracks_range_and_smallest_id(self):
+        checkpoint = ParseCheckpoint()
+        checkpoint.advance('500', self.minutes(5))
+        checkpoint.advance('300', self.minutes(1))
+        checkpoint.advance('900', self.minutes(9))
+        checkpoint.advance(None, self.minutes(-3))  # Сообщение из DOM без id
+        checkpoint.advance('abc', None)
+        self.assertEqual(checkpoint.api_cursor, 300)
+        self.assertEqual(checkpoint.oldest_timestamp, self.minutes(-3))
+        self.assertEqual(checkpoint.newest_timestamp, self.minutes(9))
+
+    def test_covers_excludes_both_bounds(self):
+        checkpoint = ParseCheckpoint(oldest_timestamp=self.minutes(0), newest_timestamp=self.minutes(10))
+        self.assertTrue(checkpoint.covers(self.minutes(5)))
+        self.assertFalse(checkpoint.covers(self.minutes(0)))
+        self.assertFalse(checkpoint.covers(self.minutes(10)))
+        self.assertFalse(checkpoint.covers(self.minutes(11)))
+        self.assertFalse(checkpoint.covers(None))
+
+    def test_old_format_is_bounded_only_below(self):
+        checkpoint = ParseCheckpoint.from_dict({'api_cursor': 7, 'oldest_timestamp': self.minutes(0).isoformat()})
+        self.assertTrue(checkpoint.covers(self.minutes(60)))
+        self.assertFalse(checkpoint.covers(self.minutes(-1)))
+
+    def test_empty_checkpoint_covers_nothing(self):
+        self.assertFalse(ParseCheckpoint.from_dict(None).covers(self.minutes(0)))
+
+    def test_dict_round_trip(self):
+        checkpoint = ParseCheckpoint(42, self.minutes(0), self.minutes(10))
+        restored = ParseCheckpoint.from_dict(checkpoint.to_dict())
+        self.assertEqual(restored.to_dict(), checkpoint.to_dict())
+        self.assertEqual(restored.newest_timestamp, self.minutes(10))
+
+
+class AdaptiveLoadTimerTests(SimpleTestCase):
+    """Таймаут подгрузки следует за недавними задержками в пределах minimum..maximum"""
+
+    def test_initial_timeout(self):
+        self.assertEqual(AdaptiveLoadTimer(initial=2.0, factor=3.0).timeout, 6.0)
+
+    def test_fast_loads_shrink_timeout_to_minimum(self):
+        timer = AdaptiveLoadTimer(minimum=1.0)
+        for _ in range(30):
+            timer.record(0.05)
+        self.assertEqual(timer.timeout, 1.0)
+
+    def test_slow_loads_grow_timeout_to_maximum(self):
+        timer = AdaptiveLoadTimer(maximum=10.0)
+        for _ in range(30):
+            timer.record(8.0)
+        self.assertEqual(timer.timeout, 10.0)
+
+    def test_record_is_exponential_moving_average(self):
+        timer = AdaptiveLoadTimer(initial=2.0, alpha=0.5)
+        timer.record(1.0)
+        self.assertAlmostEqual(timer.average, 1.5)
+
+
+@override_settings(PARSER_SCHEDULER_MAX_JITTER=600, PARSER_SCHEDULER_PAID_WINDOW=24)
+class SchedulerTests(TestCase):
+    """Плановое обновление чатов профилей по parsing_interval"""
+
+    def setUp(self):
+        self.now = datetime.datetime(2026, 10, 17, 12, 0, tzinfo=datetime.timezone.utc)
+        self.profile = Profile.objects.create(uuid='profile-1', is_active=True, model_name='m', parsing_interval=10)
+        ModelInfo.objects.create(model_name='m', group_id=1, model_id='7', model_octo_profile='profile-1')
+
+    def add_chat(self, n, hours_ago, is_paid=False):
+        chat_url = f'https://onlyfans.com/my/chats/chat/{n}'
+        FullChatMessage.objects.create(
+            user_id='1', chat_url=chat_url, message='hi', model_id='7', is_paid=is_paid,
+            timestamp=self.now - datetime.timedelta(hours=hours_ago), fingerprint=str(n),
+        )
+        return chat_url
+
+    def test_profile_is_due(self):
+        self.assertTrue(profile_is_due(self.profile, self.now))
+        self.profile.last_parsed_at = self.now - datetime.timedelta(minutes=9)
+        self.assertFalse(profile_is_due(self.profile, self.now))
+        self.profile.last_parsed_at = self.now - datetime.timedelta(minutes=10)
+        self.assertTrue(profile_is_due(self.profile, self.now))
+
+    def test_one_batch_per_priority(self):
+        paid = self.add_chat(1, hours_ago=2, is_paid=True)
+        old_paid = self.add_chat(2, hours_ago=48, is_paid=True)
+        other = self.add_chat(3, hours_ago=1)
+        rebuild_chat_summaries()
+
+        self.assertEqual(schedule_parsing(self.now), 2)
+        jobs = {job.priority: job for job in ParseJob.objects.all()}
+        self.assertEqual(jobs[ParseJob.PRIORITY_PAID].chat_urls, [paid])
+        self.assertEqual(jobs[ParseJob.PRIORITY_SCHEDULED].chat_urls, [other, old_paid])
+        self.assertTrue(all(job.update_only for job in jobs.values()))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.last_parsed_at, self.now)
+
+        # Интервал не истек - повторно не планируется
+        self.assertEqual(schedule_parsing(self.now + datetime.timedelta(minutes=5)), 0)
+
+    def test_chats_in_active_jobs_are_skipped(self):
+        busy = self.add_chat(1, hours_ago=1)
+        free = self.add_chat(2, hours_ago=1)
+        rebuild_chat_summaries()
+        ParseJob.objects.create(profile_uuid='profile-1', chat_url='x', chat_urls=['x', busy])
+
+        schedule_parsing(self.now)
+        job = ParseJob.objects.get(update_only=True)
+        self.assertEqual(job.chat_urls, [free])
+
+    def test_jitter_is_capped_by_half_interval(self):
+        self.add_chat(1, hours_ago=1)
+        rebuild_chat_summaries()
+        with mock.patch('parser.scheduler.random.uniform', side_effect=lambda low, high: high) as uniform:
+            schedule_parsing(self.now)
+        uniform.assert_called_once_with(0, 300)
+        job = ParseJob.objects.get()
+        self.assertEqual(job.scheduled_at, self.now + datetime.timedelta(seconds=300))
+
+
+class ClaimNextJobTests(TestCase):
+    """Выбор задачи из очереди: приоритет, время запуска, один профиль - одна задача"""
+
+    def create_job(self, profile_uuid, **kwargs):
+        return ParseJob.objects.create(
+            profile_uuid=profile_uuid, chat_url=f'https://onlyfans.com/my/chats/chat/{profile_uuid}', **kwargs
+        )
+
+    def test_highest_priority_then_oldest(self):
+        self.create_job('a', priority=ParseJob.PRIORITY_SCHEDULED)
+        first = self.create_job('b', priority=ParseJob.PRIORITY_MANUAL)
+        self.create_job('c', priority=ParseJob.PRIORITY_MANUAL)
+
+        job = claim_next_job('worker-1')
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.status, ParseJob.STATUS_RUNNING)
+        self.assertEqual(job.worker_id, 'worker-1')
+
+    def test_future_jobs_and_busy_profiles_are_skipped(self):
+        self.create_job('a', scheduled_at=timezone.now() + datetime.timedelta(hours=1))
+        self.create_job('b', status=ParseJob.STATUS_RUNNING)
+        self.create_job('b')
+        self.create_job('c')
+        expected = self.create_job('d')
+
+        job = claim_next_job('worker-1', exclude_profiles=['c'])
+        self.assertEqual(job.pk, expected.pk)
+        self.assertIsNone(claim_next_job('worker-1', exclude_profiles=['c']))
+
+    def test_one_running_job_per_profile(self):
+        self.create_job('a', status=ParseJob.STATUS_RUNNING)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_job('a', status=ParseJob.STATUS_RUNNING)
+        # Завершенные и ожидающие задачи профиля условию не мешают
+        self.create_job('a', status=ParseJob.STATUS_COMPLETED)
+        self.create_job('a')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'SKIP LOCKED needs PostgreSQL')
+class ClaimNextJobConcurrencyTests(TransactionTestCase):
+    """Параллельный claim не ждет чужую блокировку и не получает ту же задачу"""
+
+    def test_locked_job_is_skipped(self):
+        locked = ParseJob.objects.create(profile_uuid='a', chat_url='https://onlyfans.com/my/chats/chat/1')
+        free = ParseJob.objects.create(profile_uuid='b', chat_url='https://onlyfans.com/my/chats/chat/2')
+        row_locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            # Другое соединение держит строку задачи, как незавершенный claim другого воркера
+            try:
+                with transaction.atomic():
+                    ParseJob.objects.select_for_update().get(pk=locked.pk)
+                    row_locked.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        try:
+            self.assertTrue(row_locked.wait(10))
+            job = claim_next_job('worker-2')
+        finally:
+            release.set()
+            holder.join()
+        self.assertEqual(job.pk, free.pk)
@@ -4,10 +4,12 @@ from . import views
 urlpatterns = [
     path('chat-parser/', views.chat_parser_view, name='chat_parser'),
     path('api/start-chat-parsing/', views.start_chat_parsing, name='start_chat_parsing'),
+    path('api/start-batch-parsing/', views.start_batch_parsing, name='start_batch_parsing'),
     path('api/stop-chat-parsing/', views.stop_chat_parsing, name='stop_chat_parsing'),
     path('api/get-active-parsers/', views.get_active_parsers, name='get_active_parsers'),
     path('api/stop-all-parsers/', views.stop_all_parsers, name='stop_all_parsers'),
     path('api/update-chat/', views.update_chat, name='update_chat'),
+    path('api/chat-messages/', views.get_chat_messages, name='get_chat_messages'),
     path('view-chat/<int:profile_id>/', views.view_chat_messages, name='view_chat'),
     path('view-full-chat/', views.view_full_chat, name='view_full_chat'),
 ]
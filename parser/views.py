@@ -1,37 +1,20 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Count, Max
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+from django.utils.formats import date_format
 from collections import defaultdict
-import asyncio
-import threading
-from datetime import datetime
-from .models import Profile, ChatMessage, ModelInfo, FullChatMessage
-from .services import ChatParser, ChatParserFansly, OctoAPIClient, OctoClient
-from django.conf import settings
+import datetime
+from .models import Profile, ChatMessage, ModelInfo, FullChatMessage, ChatSummary
+from .services import OctoClient
+from .jobs import enqueue_batch_job, enqueue_job, request_cancel, start_job_runner, visible_jobs
 
-# Глобальный словарь для отслеживания активных потоков парсинга
-active_parsing_threads = {}
-threads_lock = threading.Lock()
 
-
-def detect_platform(chat_url: str) -> str:
-    """Определяет платформу по URL чата
-    
-    Args:
-        chat_url: URL чата
-        
-    Returns:
-        'onlyfans' или 'fansly'
-    """
-    if 'fansly.com' in chat_url.lower():
-        return 'fansly'
-    elif 'onlyfans.com' in chat_url.lower():
-        return 'onlyfans'
-    else:
-        # По умолчанию возвращаем onlyfans для обратной совместимости
-        return 'onlyfans'
+# Размер страницы сообщений в просмотре чата (get_chat_messages)
+CHAT_MESSAGES_PAGE_SIZE = 50
+CHAT_MESSAGES_MAX_PAGE_SIZE = 200
 
 
 def chat_parser_view(request):
@@ -58,20 +41,15 @@ def chat_parser_view(request):
         print(f"Error getting models from ModelInfo: {e}")
         profiles = []
     
-    # Получаем последние распарсенные чаты из FullChatMessage, сгруппированные по моделям
-    # Группируем по model_id и chat_url (chat_url = идентификатор чата)
-    all_chats = FullChatMessage.objects.exclude(
-        chat_url__isnull=True
-    ).exclude(
-        chat_url=''
-    ).values(
+    # Последние распарсенные чаты из сводки ChatSummary (обновляется при записи сообщений),
+    # сгруппированные по моделям
+    all_chats = ChatSummary.objects.values(
         'model_id',
         'chat_url',
-    ).annotate(
-        message_count=Count('id'),
-        last_message_date=Max('timestamp'),
-        user_id=Max('user_id')  # Берем user_id для отображения
-    ).order_by('model_id', '-last_message_date')
+        'user_id',
+        'message_count',
+        'last_message_at',
+    ).order_by('model_id', '-last_message_at')
     
     # Создаем словарь для связи model_id с именами моделей из ModelInfo
     model_infos_dict = {m.model_id: m.model_name for m in ModelInfo.objects.all()}
@@ -96,14 +74,14 @@ def chat_parser_view(request):
             'chat_url': chat_url,
             'user_id': chat['user_id'],  # Для отображения
             'message_count': chat['message_count'],
-            'last_message': chat['last_message_date']
+            'last_message': chat['last_message_at']
         })
         models_with_chats[model_id]['total_messages'] += chat['message_count']
         
         # Обновляем последнюю активность
         if models_with_chats[model_id]['last_activity'] is None or \
-           (chat['last_message_date'] and chat['last_message_date'] > models_with_chats[model_id]['last_activity']):
-            models_with_chats[model_id]['last_activity'] = chat['last_message_date']
+           (chat['last_message_at'] and chat['last_message_at'] > models_with_chats[model_id]['last_activity']):
+            models_with_chats[model_id]['last_activity'] = chat['last_message_at']
     
     # Сортируем модели по последней активности
     sorted_models = sorted(
@@ -135,81 +113,16 @@ def chat_parser_view(request):
             else:
                 print(f"🆕 New chat {chat_url}, using full parsing mode")
             
-            # Запускаем парсер в отдельном потоке
-            import logging
-            import traceback
-            logger = logging.getLogger(__name__)
+            # Ставим задачу в общую очередь и запускаем исполнителя в этом процессе
+            job = enqueue_job(profile_uuid, chat_url, update_only=update_only)
+            print(f"📥 Job {job.pk} queued ({job.platform}) for profile {profile_uuid} and URL {chat_url}")
+            start_job_runner()
             
-            def run_parser():
-                thread_id = threading.current_thread().ident
-                try:
-                    # Определяем платформу по URL
-                    platform = detect_platform(chat_url)
-                    print(f"🔍 Detected platform: {platform}")
-                    
-                    # Создаем парсер в зависимости от платформы
-                    if platform == 'fansly':
-                        parser = ChatParserFansly(profile_uuid, chat_url, update_only=update_only)
-                        parser_name = "ChatParserFansly"
-                    else:
-                        parser = ChatParser(profile_uuid, chat_url, update_only=update_only)
-                        parser_name = "ChatParser"
-                    
-                    # Регистрируем поток как активный с ссылкой на парсер
-                    with threads_lock:
-                        active_parsing_threads[thread_id] = {
-                            'profile_uuid': profile_uuid,
-                            'chat_url': chat_url,
-                            'thread_name': threading.current_thread().name,
-                            'started_at': datetime.now().isoformat(),
-                            'status': 'running',
-                            'parser': parser,  # Сохраняем ссылку на парсер для остановки
-                            'platform': platform
-                        }
-                    
-                    logger.info(f"🚀 Starting {parser_name} for profile {profile_uuid} and URL {chat_url}")
-                    print(f"🚀 Starting {parser_name} ({platform}) for profile {profile_uuid} and URL {chat_url}")
-                    result = asyncio.run(parser.run())
-                    logger.info(f"✅ Parser finished with result: {result}")
-                    print(f"✅ Parser finished with result: {result}")
-                    
-                    # Обновляем статус в зависимости от результата
-                    with threads_lock:
-                        if thread_id in active_parsing_threads:
-                            if result and result.get('status') == 'error':
-                                active_parsing_threads[thread_id]['status'] = 'error'
-                                active_parsing_threads[thread_id]['error_message'] = result.get('message', 'Unknown error')
-                            else:
-                                active_parsing_threads[thread_id]['status'] = 'completed'
-                except Exception as e:
-                    logger.error(f"❌ Parser error: {e}", exc_info=True)
-                    print(f"❌ Parser error: {e}")
-                    traceback.print_exc()
-                    # Обновляем статус на error
-                    with threads_lock:
-                        if thread_id in active_parsing_threads:
-                            active_parsing_threads[thread_id]['status'] = 'error'
-                            active_parsing_threads[thread_id]['error_message'] = str(e)
-                finally:
-                    # Удаляем поток из активных через 30 секунд после завершения
-                    # чтобы пользователь успел увидеть результат
-                    import time
-                    time.sleep(30)
-                    with threads_lock:
-                        active_parsing_threads.pop(thread_id, None)
-            
-            thread = threading.Thread(target=run_parser, name=f"ChatParser-{profile_uuid[:8]}")
-            thread.daemon = True
-            thread.start()
-            
-            logger.info(f"✅ Thread started: {thread.name}")
-            print(f"✅ Thread started: {thread.name}")
-            
-            context['success'] = f'Chat parsing started for {chat_url}. Check logs: docker-compose logs -f web'
+            context['success'] = f'Chat parsing queued for {chat_url} (job #{job.pk}). Check logs: docker-compose logs -f web'
             
         except Exception as e:
             context['error'] = f'Error starting parser: {str(e)}'
-            print(f"Error starting parser thread: {e}")
+            print(f"Error queueing parser job: {e}")
     
     return render(request, 'parser/chat_parser.html', context)
 
@@ -224,21 +137,17 @@ def stop_chat_parsing(request):
         if not profile_uuid:
             return JsonResponse({'status': 'error', 'message': 'Missing profile_uuid'})
         
-        # Ищем активный поток парсера для этого профиля и устанавливаем флаг остановки
-        parser_found = False
-        with threads_lock:
-            for thread_id, thread_info in active_parsing_threads.items():
-                if thread_info.get('profile_uuid') == profile_uuid:
-                    parser = thread_info.get('parser')
-                    if parser:
-                        parser.stop_requested = True
-                        parser_found = True
-                        print(f"🛑 Stop signal sent to parser for profile {profile_uuid[:8]}")
-                    break
-        
-        # Останавливаем профиль в Octo Browser
-        octo = OctoClient.init_from_settings()
-        success = octo.stop_profile(profile_uuid)
+        # Отменяем задачи профиля в общей очереди - исполнитель увидит флаг при heartbeat
+        parser_found = request_cancel(profile_uuid) > 0
+        if parser_found:
+            print(f"🛑 Stop signal sent to jobs for profile {profile_uuid[:8]}")
+        
+        # Профиль задачи освобождает ее исполнитель после остановки парсера;
+        # напрямую в Octo Browser останавливаем только профиль без задачи
+        success = False
+        if not parser_found:
+            octo = OctoClient.init_from_settings()
+            success = octo.stop_profile(profile_uuid)
         
         if success or parser_found:
             return JsonResponse({
@@ -266,61 +175,12 @@ def start_chat_parsing(request):
         if not profile_uuid or not chat_url:
             return JsonResponse({'status': 'error', 'message': 'Missing required parameters'})
         
-        # Запускаем парсер в отдельном потоке
-        def run_parser():
-            thread_id = threading.current_thread().ident
-            try:
-                # Определяем платформу по URL
-                platform = detect_platform(chat_url)
-                print(f"🔍 Detected platform: {platform}")
-                
-                # Создаем парсер в зависимости от платформы
-                if platform == 'fansly':
-                    parser = ChatParserFansly(profile_uuid, chat_url)
-                else:
-                    parser = ChatParser(profile_uuid, chat_url)
-                
-                # Регистрируем поток как активный с ссылкой на парсер
-                with threads_lock:
-                    active_parsing_threads[thread_id] = {
-                        'profile_uuid': profile_uuid,
-                        'chat_url': chat_url,
-                        'thread_name': threading.current_thread().name,
-                        'started_at': datetime.now().isoformat(),
-                        'status': 'running',
-                        'parser': parser,  # Сохраняем ссылку на парсер для остановки
-                        'platform': platform
-                    }
-                result = asyncio.run(parser.run())
-                
-                # Обновляем статус в зависимости от результата
-                with threads_lock:
-                    if thread_id in active_parsing_threads:
-                        if result and result.get('status') == 'error':
-                            active_parsing_threads[thread_id]['status'] = 'error'
-                            active_parsing_threads[thread_id]['error_message'] = result.get('message', 'Unknown error')
-                        else:
-                            active_parsing_threads[thread_id]['status'] = 'completed'
-            except Exception as e:
-                print(f"Parser error: {e}")
-                # Обновляем статус на error
-                with threads_lock:
-                    if thread_id in active_parsing_threads:
-                        active_parsing_threads[thread_id]['status'] = 'error'
-                        active_parsing_threads[thread_id]['error_message'] = str(e)
-            finally:
-                # Удаляем поток из активных через 30 секунд после завершения
-                import time
-                time.sleep(30)
-                with threads_lock:
-                    active_parsing_threads.pop(thread_id, None)
-        
-        thread = threading.Thread(target=run_parser, name=f"ChatParser-{profile_uuid[:8]}")
-        thread.daemon = True
-        thread.start()
+        job = enqueue_job(profile_uuid, chat_url)
+        start_job_runner()
         
         return JsonResponse({
             'status': 'success', 
+            'job_id': job.pk,
             'message': f'Chat parsing started'
         })
         
@@ -328,6 +188,54 @@ def start_chat_parsing(request):
         return JsonResponse({'status': 'error', 'message': str(e)})
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def start_batch_parsing(request):
+    """API endpoint для пакетного парсинга: список чатов или все известные чаты модели в одной сессии профиля"""
+    try:
+        profile_uuid = request.POST.get('profile_uuid')
+        model_id = request.POST.get('model_id')
+        # chat_urls - повторяющийся параметр или URL через перевод строки
+        chat_urls = [
+            url.strip()
+            for value in request.POST.getlist('chat_urls')
+            for url in value.splitlines()
+            if url.strip()
+        ]
+
+        if model_id:
+            if not profile_uuid:
+                model_info = ModelInfo.objects.filter(model_id=model_id).first()
+                profile_uuid = model_info.model_octo_profile if model_info else None
+            if not chat_urls:
+                chat_urls = list(
+                    ChatSummary.objects.filter(model_id=model_id)
+                    .values_list('chat_url', flat=True)
+                    .order_by('chat_url')
+                )
+
+        if not profile_uuid:
+            return JsonResponse({'status': 'error', 'message': 'Model profile UUID not found' if model_id else 'Missing profile_uuid'})
+        if not chat_urls:
+            return JsonResponse({'status': 'error', 'message': 'No chats to parse'})
+
+        # Известные чаты модели по умолчанию только обновляем
+        update_only = request.POST.get('update_only', '1' if model_id else '0').lower() in ('1', 'true', 'yes')
+
+        job = enqueue_batch_job(profile_uuid, chat_urls, update_only=update_only)
+        start_job_runner()
+
+        return JsonResponse({
+            'status': 'success',
+            'job_id': job.pk,
+            'chats': len(job.chat_urls),
+            'message': f'Batch parsing of {len(job.chat_urls)} chats started'
+        })
+
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+
 def view_chat_messages(request, profile_id):
     """Просмотр всех сообщений конкретного чата"""
     chat_url = request.GET.get('chat_url')
@@ -371,7 +279,11 @@ def view_chat_messages(request, profile_id):
 
 
 def view_full_chat(request):
-    """Просмотр диалога из FullChatMessage по chat_url"""
+    """Просмотр диалога из FullChatMessage по chat_url
+    
+    Страница отдается без сообщений: статистика берется из ChatSummary,
+    сами сообщения viewer подгружает страницами через get_chat_messages.
+    """
     chat_url = request.GET.get('chat_url')
     
     if not chat_url:
@@ -379,19 +291,19 @@ def view_full_chat(request):
         return render(request, 'parser/chat_parser.html', context)
     
     try:
-        # Получаем все сообщения для данного чата по chat_url
-        # Сортируем по timestamp (первые сверху, последние внизу)
-        messages = FullChatMessage.objects.filter(
-            chat_url=chat_url
-        ).order_by('timestamp')
-        
-        if not messages.exists():
+        summaries = ChatSummary.objects.filter(chat_url=chat_url)
+        stats = summaries.aggregate(
+            total_messages=Sum('message_count'),
+            model_messages=Sum('model_message_count'),
+            first_message_date=Min('first_message_at'),
+            last_message_date=Max('last_message_at'),
+        )
+        if not stats['total_messages']:
             context = {'error': f'No messages found for chat: {chat_url}'}
             return render(request, 'parser/chat_parser.html', context)
         
-        # Получаем model_id из любого сообщения
-        first_msg = messages.first()
-        model_id = first_msg.model_id if first_msg else None
+        summary = summaries.order_by('-message_count').first()
+        model_id = summary.model_id
         
         # Получаем информацию о модели
         model_name = 'Unknown Model'
@@ -402,31 +314,17 @@ def view_full_chat(request):
             except ModelInfo.DoesNotExist:
                 model_name = f'Model {model_id}'
         
-        # Получаем user_id из первого сообщения (для отображения)
-        user_id = first_msg.user_id if first_msg else 'unknown'
-        
-        # Статистика
-        total_messages = messages.count()
-        model_messages = messages.filter(is_from_model=True).count()
-        user_messages = messages.filter(is_from_model=False).count()
-        
-        # Первое (самое раннее) и последнее (самое позднее) сообщение
-        # Используем исходный порядок без сортировки для определения дат
-        all_messages = FullChatMessage.objects.filter(chat_url=chat_url).order_by('timestamp')
-        first_message = all_messages.first()
-        last_message = all_messages.last()
-        
         context = {
-            'user_id': user_id,
+            'user_id': summary.user_id or 'unknown',
             'model_id': model_id,
             'model_name': model_name,
-            'messages': messages,
             'chat_url': chat_url,
-            'total_messages': total_messages,
-            'model_messages': model_messages,
-            'user_messages': user_messages,
-            'first_message_date': first_message.timestamp if first_message else None,
-            'last_message_date': last_message.timestamp if last_message else None,
+            'total_messages': stats['total_messages'],
+            'model_messages': stats['model_messages'],
+            'user_messages': stats['total_messages'] - stats['model_messages'],
+            'first_message_date': stats['first_message_date'],
+            'last_message_date': stats['last_message_date'],
+            'page_size': CHAT_MESSAGES_PAGE_SIZE,
         }
         
         return render(request, 'parser/view_full_chat.html', context)
@@ -436,6 +334,93 @@ def view_full_chat(request):
         return render(request, 'parser/chat_parser.html', context)
 
 
+def _message_cursor(message: FullChatMessage) -> str:
+    """Курсор keyset-пагинации: время и id сообщения"""
+    return f"{message.timestamp.isoformat()}|{message.pk}"
+
+
+def _parse_message_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    timestamp, _, pk = cursor.rpartition('|')
+    return datetime.datetime.fromisoformat(timestamp), int(pk)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_chat_messages(request):
+    """API endpoint: страница сообщений чата с keyset-пагинацией по (timestamp, id)
+    
+    Параметры:
+        chat_url: чат
+        cursor: курсор сообщения, от которого листать (без курсора - последние сообщения)
+        direction: older - сообщения до курсора, newer - после него
+        limit: размер страницы (не больше CHAT_MESSAGES_MAX_PAGE_SIZE)
+    
+    Сообщения в ответе идут по времени (старые сверху). Стоимость запроса
+    не зависит от длины чата и глубины листания: индекс (chat_url, timestamp)
+    сразу приводит к курсору.
+    """
+    chat_url = request.GET.get('chat_url')
+    direction = request.GET.get('direction', 'older')
+    cursor = request.GET.get('cursor')
+    
+    if not chat_url:
+        return JsonResponse({'status': 'error', 'message': 'Missing chat_url'}, status=400)
+    if direction not in ('older', 'newer'):
+        return JsonResponse({'status': 'error', 'message': 'direction must be older or newer'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', CHAT_MESSAGES_PAGE_SIZE)), CHAT_MESSAGES_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid limit'}, status=400)
+    
+    # Сообщения без времени в keyset не участвуют (парсер всегда пишет время, при ошибке разбора - время записи)
+    messages = FullChatMessage.objects.filter(chat_url=chat_url, timestamp__isnull=False)
+    if cursor:
+        try:
+            timestamp, pk = _parse_message_cursor(cursor)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid cursor'}, status=400)
+        if direction == 'older':
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+        else:
+            messages = messages.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+    elif direction == 'newer':
+        return JsonResponse({'status': 'error', 'message': 'Cursor is required for newer messages'}, status=400)
+    
+    # Одно лишнее сообщение показывает, есть ли еще страницы в этом направлении
+    if direction == 'older':
+        page = list(messages.order_by('-timestamp', '-pk')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
+    else:
+        page = list(messages.order_by('timestamp', 'pk')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+    
+    return JsonResponse({
+        'status': 'success',
+        'messages': [
+            {
+                'id': message.pk,
+                'user_id': message.user_id,
+                'message': message.message,
+                'is_from_model': message.is_from_model,
+                'is_paid': message.is_paid,
+                'amount_paid': str(message.amount_paid),
+                'timestamp': message.timestamp.isoformat(),
+                'display_time': date_format(timezone.localtime(message.timestamp), 'M d, Y H:i'),
+            }
+            for message in page
+        ],
+        'older_cursor': _message_cursor(page[0]) if page else cursor,
+        'newer_cursor': _message_cursor(page[-1]) if page else cursor,
+        # Без курсора отдаются последние сообщения - более новых нет
+        'has_older': has_more if direction == 'older' else True,
+        'has_newer': has_more if direction == 'newer' else bool(cursor),
+    })
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def update_chat(request):
@@ -462,60 +447,13 @@ def update_chat(request):
         if not profile_uuid:
             return JsonResponse({'status': 'error', 'message': 'Model profile UUID not found'})
         
-        # Запускаем парсер в режиме обновления
-        def run_updater():
-            thread_id = threading.current_thread().ident
-            try:
-                # Определяем платформу по URL
-                platform = detect_platform(chat_url)
-                print(f"🔍 Detected platform for update: {platform}")
-                
-                # Создаем парсер в режиме обновления в зависимости от платформы
-                if platform == 'fansly':
-                    parser = ChatParserFansly(profile_uuid, chat_url, update_only=True)
-                else:
-                    parser = ChatParser(profile_uuid, chat_url, update_only=True)
-                
-                # Регистрируем поток как активный
-                with threads_lock:
-                    active_parsing_threads[thread_id] = {
-                        'profile_uuid': profile_uuid,
-                        'chat_url': chat_url,
-                        'thread_name': threading.current_thread().name,
-                        'started_at': datetime.now().isoformat(),
-                        'status': 'running',
-                        'parser': parser,
-                        'platform': platform
-                    }
-                
-                result = asyncio.run(parser.run())
-                
-                # Обновляем статус
-                with threads_lock:
-                    if thread_id in active_parsing_threads:
-                        if result and result.get('status') == 'error':
-                            active_parsing_threads[thread_id]['status'] = 'error'
-                            active_parsing_threads[thread_id]['error_message'] = result.get('message', 'Unknown error')
-                        else:
-                            active_parsing_threads[thread_id]['status'] = 'completed'
-            except Exception as e:
-                print(f"Updater error: {e}")
-                with threads_lock:
-                    if thread_id in active_parsing_threads:
-                        active_parsing_threads[thread_id]['status'] = 'error'
-                        active_parsing_threads[thread_id]['error_message'] = str(e)
-            finally:
-                import time
-                time.sleep(30)
-                with threads_lock:
-                    active_parsing_threads.pop(thread_id, None)
-        
-        thread = threading.Thread(target=run_updater, name=f"ChatUpdater-{chat_url[:20]}")
-        thread.daemon = True
-        thread.start()
+        # Ставим задачу обновления в очередь
+        job = enqueue_job(profile_uuid, chat_url, update_only=True)
+        start_job_runner()
         
         return JsonResponse({
             'status': 'success',
+            'job_id': job.pk,
             'message': 'Chat update started'
         })
         
@@ -526,60 +464,27 @@ def update_chat(request):
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_active_parsers(request):
-    """API endpoint для получения активных парсеров (потоков парсинга)"""
+    """API endpoint для получения активных парсеров (задач из очереди)"""
     try:
         # Получаем информацию о модели по UUID профиля
         model_infos = ModelInfo.objects.exclude(model_octo_profile__isnull=True).exclude(model_octo_profile='')
         model_uuid_to_name = {m.model_octo_profile: m.model_name for m in model_infos}
         
-        # Получаем активные потоки парсинга
+        # Активные задачи из общей очереди (видны всем web-воркерам)
         active_parsers = []
-        with threads_lock:
-            # Фильтруем только живые потоки
-            threads_to_remove = []
-            for thread_id, thread_info in active_parsing_threads.items():
-                # Проверяем, жив ли поток
-                thread_obj = None
-                for t in threading.enumerate():
-                    if t.ident == thread_id:
-                        thread_obj = t
-                        break
-                
-                if thread_obj and thread_obj.is_alive():
-                    profile_uuid = thread_info['profile_uuid']
-                    model_name = model_uuid_to_name.get(profile_uuid, f'Profile {profile_uuid[:8]}')
-                    status = thread_info.get('status', 'running')
-                    active_parsers.append({
-                        'thread_id': thread_id,
-                        'uuid': profile_uuid,
-                        'name': model_name,
-                        'chat_url': thread_info.get('chat_url', 'Unknown'),
-                        'status': status,
-                        'started_at': thread_info.get('started_at', 'Unknown'),
-                        'thread_name': thread_info.get('thread_name', 'Unknown'),
-                        'error_message': thread_info.get('error_message', None)
-                    })
-                elif thread_info.get('status') in ('error', 'completed'):
-                    # Поток завершился, но еще не удален (в течение 30 секунд)
-                    profile_uuid = thread_info['profile_uuid']
-                    model_name = model_uuid_to_name.get(profile_uuid, f'Profile {profile_uuid[:8]}')
-                    active_parsers.append({
-                        'thread_id': thread_id,
-                        'uuid': profile_uuid,
-                        'name': model_name,
-                        'chat_url': thread_info.get('chat_url', 'Unknown'),
-                        'status': thread_info.get('status', 'unknown'),
-                        'started_at': thread_info.get('started_at', 'Unknown'),
-                        'thread_name': thread_info.get('thread_name', 'Unknown'),
-                        'error_message': thread_info.get('error_message', None)
-                    })
-                else:
-                    # Поток уже не жив и не в статусе завершения, удаляем его
-                    threads_to_remove.append(thread_id)
-            
-            # Удаляем неактивные потоки
-            for thread_id in threads_to_remove:
-                active_parsing_threads.pop(thread_id, None)
+        for job in visible_jobs().order_by('created_at'):
+            started_at = job.started_at or job.created_at
+            active_parsers.append({
+                'job_id': job.pk,
+                'uuid': job.profile_uuid,
+                'name': model_uuid_to_name.get(job.profile_uuid, f'Profile {job.profile_uuid[:8]}'),
+                'chat_url': job.chat_url,
+                'chat_count': len(job.chat_urls) if job.is_batch else 1,
+                'status': job.status,
+                'started_at': started_at.isoformat(),
+                'worker_id': job.worker_id or None,
+                'error_message': job.error_message or None
+            })
         
         return JsonResponse({
             'status': 'success',
@@ -593,37 +498,20 @@ def get_active_parsers(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def stop_all_parsers(request):
-    """API endpoint для остановки всех активных парсеров"""
+    """API endpoint для остановки всех активных парсеров
+    
+    Задачи в очереди отменяются сразу, выполняющиеся останавливает их
+    исполнитель при следующем heartbeat и сам освобождает профили Octo -
+    остановка профиля из-под работающего парсера оставила бы задачу и пул
+    профилей воркера в неизвестном состоянии.
+    """
     try:
-        octo = OctoClient.init_from_settings()
-        running_profiles = octo.get_running_profiles()
-        
-        # Получаем UUID профилей из ModelInfo
-        model_infos = ModelInfo.objects.exclude(model_octo_profile__isnull=True).exclude(model_octo_profile='')
-        model_uuid_to_name = {m.model_octo_profile: m.model_name for m in model_infos}
-        chat_parser_uuids = list(model_uuid_to_name.keys())
-        
-        stopped_count = 0
-        errors = []
-        
-        for profile in running_profiles:
-            profile_uuid = profile.get('uuid')
-            if profile_uuid in chat_parser_uuids:
-                try:
-                    success = octo.stop_profile(profile_uuid)
-                    if success:
-                        stopped_count += 1
-                    else:
-                        profile_name = model_uuid_to_name.get(profile_uuid, profile.get('title', 'Unknown'))
-                        errors.append(f"Failed to stop {profile_name}")
-                except Exception as e:
-                    profile_name = model_uuid_to_name.get(profile_uuid, profile.get('title', 'Unknown'))
-                    errors.append(f"Error stopping {profile_name}: {str(e)}")
+        stopped_count = request_cancel()
         
         return JsonResponse({
             'status': 'success',
             'stopped_count': stopped_count,
-            'errors': errors
+            'errors': []
         })
         
     except Exception as e:
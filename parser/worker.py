@@ -0,0 +1,185 @@
+"""
+Parser worker: one event loop executing many parse jobs concurrently
+"""
+import asyncio
+import signal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .ingest import close_async_db_pool
+from .jobs import claim_next_job, execute_job, make_worker_id, reap_stale_jobs, release_job
+from .models import ParseJob
+from .scheduler import schedule_parsing
+from .services import async_octo_client, close_async_octo_client, close_profile_pool, profile_pool
+
+
+class ParserWorker:
+    """Исполнитель задач из очереди ParseJob
+
+    Все парсеры работают в одном долгоживущем event loop. Параллелизм
+    ограничен общим семафором, семафором на хост Octo (сколько браузеров
+    одновременно держит один Octo) и семафором на профиль (один профиль -
+    один парсер). Профили после задач остаются теплыми в ProfilePool, пока не
+    истечет OCTO_PROFILE_IDLE_TTL.
+    """
+
+    def __init__(self, concurrency: int | None = None, host_concurrency: int | None = None,
+                 poll_interval: float | None = None):
+        self.worker_id = make_worker_id()
+        self.concurrency = concurrency or settings.PARSER_WORKER_CONCURRENCY
+        self.host_concurrency = host_concurrency or settings.PARSER_WORKER_OCTO_HOST_CONCURRENCY
+        self.poll_interval = poll_interval or settings.PARSER_WORKER_POLL_INTERVAL
+
+        self.slots: asyncio.Semaphore | None = None
+        self.host_slots: dict[str, asyncio.Semaphore] = {}
+        self.profile_slots: dict[str, asyncio.Semaphore] = {}
+        self.parsers: dict[int, object] = {}  # job_id -> запущенный парсер
+        self.tasks: set[asyncio.Task] = set()
+        self.stopping: asyncio.Event | None = None
+
+    def _host_slot(self, host: str) -> asyncio.Semaphore:
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(self.host_concurrency)
+        return self.host_slots[host]
+
+    def _profile_slot(self, profile_uuid: str) -> asyncio.Semaphore:
+        if profile_uuid not in self.profile_slots:
+            self.profile_slots[profile_uuid] = asyncio.Semaphore(1)
+        return self.profile_slots[profile_uuid]
+
+    def _busy_profiles(self) -> list[str]:
+        return [uuid for uuid, slot in self.profile_slots.items() if slot.locked()]
+
+    def stop(self):
+        """Прекращает прием задач и останавливает запущенные парсеры"""
+        if self.stopping.is_set():
+            return
+        print(f"🛑 Worker {self.worker_id} stopping, {len(self.parsers)} parser(s) running")
+        self.stopping.set()
+        for parser in self.parsers.values():
+            parser.stop_requested = True
+
+    async def _sleep(self, seconds: float):
+        """Пауза, которая прерывается при остановке воркера"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self, job: ParseJob, host_slot: asyncio.Semaphore, profile_slot: asyncio.Semaphore):
+        try:
+            await execute_job(job, self.parsers)
+        finally:
+            profile_slot.release()
+            if not profile_slot.locked():
+                self.profile_slots.pop(job.profile_uuid, None)
+            host_slot.release()
+            self.slots.release()
+            if self.stopping.is_set():
+                # Задача прервана остановкой воркера, а не пользователем - вернем ее в очередь
+                await sync_to_async(release_job)(job.pk)
+
+    async def _reap_periodically(self):
+        while not self.stopping.is_set():
+            try:
+                await sync_to_async(close_old_connections)()
+                reaped = await sync_to_async(reap_stale_jobs)()
+                if reaped:
+                    print(f"⚠️ Marked {reaped} job(s) with lost heartbeat as error")
+            except Exception as e:
+                print(f"⚠️ Error reaping stale jobs: {e}")
+            await self._sleep(settings.PARSER_JOB_HEARTBEAT_INTERVAL)
+
+    async def _poll_profile_registry(self):
+        """Единственный опрос списка профилей Octo на весь воркер"""
+        while not self.stopping.is_set():
+            try:
+                await async_octo_client().refresh_registry(force=True)
+            except Exception as e:
+                print(f"⚠️ Error refreshing Octo profile registry: {e}")
+            await self._sleep(settings.OCTO_REGISTRY_INTERVAL)
+
+    async def _reap_idle_profiles(self):
+        """Останавливает теплые профили, которые простаивают дольше OCTO_PROFILE_IDLE_TTL"""
+        while not self.stopping.is_set():
+            try:
+                await profile_pool().reap_idle()
+            except Exception as e:
+                print(f"⚠️ Error reaping idle profiles: {e}")
+            await self._sleep(settings.OCTO_REGISTRY_INTERVAL)
+
+    async def _schedule_periodically(self):
+        while not self.stopping.is_set():
+            try:
+                await sync_to_async(close_old_connections)()
+                await sync_to_async(schedule_parsing)()
+            except Exception as e:
+                print(f"⚠️ Error scheduling parsing: {e}")
+            await self._sleep(settings.PARSER_SCHEDULER_TICK)
+
+    async def run(self):
+        """Основной цикл: забирает задачи, пока есть свободные слоты"""
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.stopping = asyncio.Event()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        print(
+            f"🚀 Parser worker {self.worker_id} started "
+            f"(concurrency={self.concurrency}, per Octo host={self.host_concurrency})"
+        )
+        background = [
+            asyncio.create_task(self._reap_periodically()),
+            asyncio.create_task(self._poll_profile_registry()),
+            asyncio.create_task(self._reap_idle_profiles()),
+        ]
+        if settings.PARSER_SCHEDULER_ENABLED:
+            background.append(asyncio.create_task(self._schedule_periodically()))
+
+        while not self.stopping.is_set():
+            await self.slots.acquire()
+            host_slot = self._host_slot(settings.OCTO_HOST)
+            await host_slot.acquire()
+            if self.stopping.is_set():
+                host_slot.release()
+                self.slots.release()
+                break
+
+            try:
+                # Соединение, оборванное рестартом Postgres или простоем, закрываем - следующий запрос откроет новое
+                await sync_to_async(close_old_connections)()
+                job = await sync_to_async(claim_next_job)(self.worker_id, self._busy_profiles())
+            except Exception as e:
+                print(f"❌ Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                host_slot.release()
+                self.slots.release()
+                await self._sleep(self.poll_interval)
+                continue
+
+            # Слот профиля занимаем до создания задачи, чтобы следующий claim уже исключил профиль
+            profile_slot = self._profile_slot(job.profile_uuid)
+            await profile_slot.acquire()
+            print(f"🚀 Worker {self.worker_id} claimed job {job.pk} ({job.platform}): {job.chat_url}")
+            task = asyncio.create_task(self._execute(job, host_slot, profile_slot))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        if self.tasks:
+            print(f"⏳ Waiting for {len(self.tasks)} job(s) to stop...")
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        for task in background:
+            task.cancel()
+        await close_profile_pool()
+        await close_async_octo_client()
+        await close_async_db_pool()
+        print(f"👋 Parser worker {self.worker_id} stopped")